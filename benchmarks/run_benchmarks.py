@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the refgenie hot paths.
+
+All inputs are synthetic and generated on the fly, so no aligners, real
+genomes or network access are required. The results are saved as JSON,
+so that they can be compared across refgenie releases, e.g.:
+
+    python benchmarks/run_benchmarks.py -o results_0.10.0.json
+    python benchmarks/run_benchmarks.py --compare results_0.9.1.json results_0.10.0.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_fasta, make_asset_dir, make_genome_config
+
+import refgenie
+from refgenconf import RefGenConf
+from refgenconf.const import *
+from refgenie.asset_build_packages import *
+from refgenie.config_cache import load_cached_rgc
+from refgenie.refget import fasta_checksum
+from refgenie.refgenie import get_dir_digest, refgenie_add, main as refgenie_main
+
+BENCH_GENOME = "bench"
+BENCHMARKS = ["fasta_checksum", "dir_digest", "config_load", "config_load_cached", "config_write", "seek",
+              "getseq", "add", "build"]
+
+STUB_RECIPES = {
+    "bench_root": {
+        DESC: "Stub root asset for benchmarking",
+        ASSETS: {"bench_root": "{genome}_root.txt"},
+        REQ_FILES: [],
+        REQ_ASSETS: [],
+        REQ_PARAMS: [],
+        CONT: "databio/refgenie",
+        CMD_LST: ["echo {genome} > {asset_outfolder}/{genome}_root.txt"]
+    },
+    "bench_child": {
+        DESC: "Stub child asset for benchmarking",
+        ASSETS: {"bench_child": "{genome}_child.txt"},
+        REQ_FILES: [],
+        REQ_ASSETS: [{KEY: "bench_root", DEFAULT: "bench_root", DESC: "stub root asset"}],
+        REQ_PARAMS: [],
+        CONT: "databio/refgenie",
+        CMD_LST: ["cat {bench_root} > {asset_outfolder}/{genome}_child.txt"]
+    }
+}
+
+
+def build_argparser():
+    parser = argparse.ArgumentParser(description="Benchmark refgenie hot paths on synthetic data")
+    parser.add_argument("-o", "--output", default=None, help="Path to the JSON file to save the results to.")
+    parser.add_argument("-b", "--benchmarks", nargs="+", default=BENCHMARKS, choices=BENCHMARKS,
+                        help="Benchmarks to run. Default: all.")
+    parser.add_argument("-r", "--repeats", type=int, default=5, help="Number of repeats of each benchmark.")
+    parser.add_argument("-d", "--workdir", default=None,
+                        help="Directory to create the synthetic data in. Default: a temporary directory.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data.")
+    parser.add_argument("--seqs", type=int, default=25, help="Number of sequences in the synthetic FASTA.")
+    parser.add_argument("--seq-len", type=int, default=200000, help="Length of each synthetic sequence.")
+    parser.add_argument("--files", type=int, default=50, help="Number of files in the synthetic asset.")
+    parser.add_argument("--file-size", type=int, default=1024 * 1024,
+                        help="Size of each file in the synthetic asset, in bytes.")
+    parser.add_argument("--genomes", type=int, default=20, help="Number of genomes in the synthetic config.")
+    parser.add_argument("--assets", type=int, default=25, help="Number of assets per genome in the synthetic config.")
+    parser.add_argument("--tags", type=int, default=3, help="Number of tags per asset in the synthetic config.")
+    parser.add_argument("--lookups", type=int, default=1000, help="Number of lookups in the seek benchmark.")
+    parser.add_argument("--children", type=int, default=10,
+                        help="Number of child assets built in the build benchmark.")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), default=None,
+                        help="Compare two results files instead of running the benchmarks.")
+    return parser
+
+
+@contextlib.contextmanager
+def _quiet():
+    """ Silence stdout, which the CLI and pypiper write a lot to """
+    with open(os.devnull, "w") as devnull:
+        ori = sys.stdout
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = ori
+
+
+def _run_cli(argv):
+    """ Run the refgenie CLI in-process """
+    ori = sys.argv
+    sys.argv = ["refgenie"] + argv + ["--silent"]
+    try:
+        with _quiet():
+            refgenie_main()
+    except SystemExit as e:
+        if e.code:
+            raise RuntimeError("refgenie {} failed with code {}".format(" ".join(argv), e.code))
+    finally:
+        sys.argv = ori
+
+
+def _measure(fun, repeats, setup=None):
+    """
+    Time a function
+
+    :param callable fun: function to time, called with the setup result
+    :param int repeats: number of repeats
+    :param callable setup: function called before each repeat, untimed
+    :return Mapping: timings summary
+    """
+    times = []
+    for i in range(repeats):
+        x = setup(i) if setup else i
+        start = timer()
+        fun(x)
+        times.append(timer() - start)
+    srt = sorted(times)
+    return OrderedDict([("min", srt[0]), ("median", srt[len(srt) // 2]), ("mean", sum(times) / len(times)),
+                        ("max", srt[-1]), ("times", times)])
+
+
+class Workspace(object):
+    """ Synthetic genome folder, genome config, FASTA and asset files """
+
+    def __init__(self, path, args):
+        self.path = path
+        self.args = args
+        self.genome_folder = os.path.join(path, "genomes")
+        # a reused workdir holds the data of the previous run, which would skew the results
+        if os.path.exists(self.genome_folder):
+            shutil.rmtree(self.genome_folder)
+        os.makedirs(self.genome_folder)
+        self.cfg = make_genome_config(os.path.join(self.genome_folder, "genome_config.yaml"), self.genome_folder,
+                                      n_genomes=args.genomes, n_assets=args.assets, n_tags=args.tags, seed=args.seed)
+        fasta_dir = os.path.join(self.genome_folder, BENCH_GENOME, "fasta", DEFAULT_TAG)
+        os.makedirs(fasta_dir)
+        self.fasta = make_fasta(os.path.join(fasta_dir, BENCH_GENOME + ".fa"), n_seqs=args.seqs,
+                                seq_len=args.seq_len, seed=args.seed)
+        self.asset_dir = make_asset_dir(os.path.join(self.genome_folder, BENCH_GENOME, "bench_files"),
+                                        n_files=args.files, file_size=args.file_size, seed=args.seed)
+        rgc = RefGenConf(filepath=self.cfg, writable=True)
+        rgc.update_tags(BENCH_GENOME, "fasta", DEFAULT_TAG, data={CFG_ASSET_PATH_KEY: "fasta"})
+        rgc.update_seek_keys(BENCH_GENOME, "fasta", DEFAULT_TAG, keys={"fasta": BENCH_GENOME + ".fa"})
+        rgc.set_default_pointer(BENCH_GENOME, "fasta", DEFAULT_TAG)
+        rgc.write()
+        rgc.make_readonly()
+
+    def registry_paths(self, n, seed):
+        rng = random.Random(seed)
+        return [("genome{}".format(rng.randrange(self.args.genomes)), "asset{}".format(rng.randrange(self.args.assets)),
+                 "tag{}".format(rng.randrange(self.args.tags))) for _ in range(n)]
+
+
+def bench_fasta_checksum(ws, repeats):
+    return _measure(lambda _: fasta_checksum(ws.fasta), repeats)
+
+
+def bench_dir_digest(ws, repeats):
+    return _measure(lambda _: get_dir_digest(ws.asset_dir), repeats)
+
+
+def bench_config_load(ws, repeats):
+    return _measure(lambda _: RefGenConf(filepath=ws.cfg, writable=False), repeats)
+
+
+def bench_config_load_cached(ws, repeats):
+    load_cached_rgc(ws.cfg)  # create the snapshot
+    return _measure(lambda _: load_cached_rgc(ws.cfg), repeats)
+
+
+def bench_config_write(ws, repeats):
+    rgc = RefGenConf(filepath=ws.cfg, writable=False)
+
+    def _write(_):
+        rgc.make_writable()
+        rgc.write()
+        rgc.make_readonly()
+    return _measure(_write, repeats)
+
+
+def bench_seek(ws, repeats):
+    rgc = RefGenConf(filepath=ws.cfg, writable=False)
+
+    def _seek(paths):
+        for g, a, t in paths:
+            rgc.seek(g, a, t)
+    return _measure(_seek, repeats, setup=lambda i: ws.registry_paths(ws.args.lookups, seed=i))
+
+
+def bench_getseq(ws, repeats):
+    rgc = RefGenConf(filepath=ws.cfg, writable=False)
+    rng = random.Random(ws.args.seed)
+
+    def _loci(_):
+        loci = []
+        for _ in range(100):
+            start = rng.randrange(ws.args.seq_len - 1000)
+            loci.append("chr{}:{}-{}".format(rng.randrange(ws.args.seqs) + 1, start, start + 1000))
+        return loci
+
+    def _getseq(loci):
+        with _quiet():
+            for locus in loci:
+                rgc.getseq(BENCH_GENOME, locus)
+    return _measure(_getseq, repeats, setup=_loci)
+
+
+def bench_add(ws, repeats):
+    rgc = RefGenConf(filepath=ws.cfg, writable=False)
+
+    def _clean(i):
+        # the tag directories are created in the added directory, so the
+        # previous ones would be copied along and every repeat copy more data
+        for tag_dir in [os.path.join(ws.asset_dir, "r{}".format(j)) for j in range(repeats)]:
+            if os.path.exists(tag_dir):
+                shutil.rmtree(tag_dir)
+        return i
+
+    def _add(i):
+        asset = {"genome": BENCH_GENOME, "asset": "bench_files", "tag": "r{}".format(i), "seek_key": None}
+        refgenie_add(rgc, asset, "bench_files", force=True)
+    try:
+        return _measure(_add, repeats, setup=_clean)
+    finally:
+        _clean(None)
+
+
+def bench_build(ws, repeats):
+    asset_build_packages.update(STUB_RECIPES)
+    for i in range(ws.args.children):
+        asset_build_packages["bench_child{}".format(i)] = STUB_RECIPES["bench_child"]
+
+    def _build(i):
+        paths = ["{}/bench_root:r{}".format(BENCH_GENOME, i)] + \
+            ["{}/bench_child{}:r{}".format(BENCH_GENOME, c, i) for c in range(ws.args.children)]
+        _run_cli(["build", "-c", ws.cfg] + paths)
+    try:
+        return _measure(_build, repeats)
+    finally:
+        for k in [k for k in asset_build_packages if k.startswith("bench_")]:
+            del asset_build_packages[k]
+
+
+def compare(baseline_path, current_path):
+    """ Print the median time ratios of two results files """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+    row = "{:<20}{:>14}{:>14}{:>10}"
+    print(row.format("benchmark", "baseline [s]", "current [s]", "ratio"))
+    for name, res in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        b, c = baseline["results"][name]["median"], res["median"]
+        print(row.format(name, "{:.4f}".format(b), "{:.4f}".format(c), "{:.2f}".format(c / b if b else float("nan"))))
+
+
+def main():
+    args = build_argparser().parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    workdir = args.workdir or tempfile.mkdtemp(prefix="refgenie_bench_")
+    try:
+        ws = Workspace(workdir, args)
+        results = OrderedDict()
+        for name in args.benchmarks:
+            print("Running benchmark: {}".format(name))
+            results[name] = globals()["bench_" + name](ws, args.repeats)
+            print("  median: {:.4f}s".format(results[name]["median"]))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    report = OrderedDict([
+        ("refgenie_version", refgenie.__version__),
+        ("python_version", platform.python_version()),
+        ("platform", platform.platform()),
+        ("parameters", OrderedDict([(k, v) for k, v in sorted(vars(args).items())
+                                    if k not in ["output", "compare", "workdir"]])),
+        ("results", results)
+    ])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print("Results saved to: {}".format(args.output))
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
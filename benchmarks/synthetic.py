@@ -0,0 +1,124 @@
+"""
+Synthetic inputs for the refgenie benchmarks: FASTA genomes, asset
+directories and genome configuration files of configurable size.
+
+All the generators are seeded, so the same parameters always produce
+the same files and the benchmark results are comparable across runs.
+"""
+
+import gzip
+import os
+import random
+from collections import OrderedDict
+
+import yaml
+
+from refgenconf.const import *
+
+__all__ = ["make_fasta", "make_asset_dir", "make_genome_config"]
+
+
+def make_fasta(path, n_seqs=10, seq_len=100000, line_width=60, compress=False, seed=0):
+    """
+    Write a synthetic FASTA file
+
+    :param str path: path to the file to write
+    :param int n_seqs: number of sequences
+    :param int seq_len: length of each sequence
+    :param int line_width: number of bases per line
+    :param bool compress: whether the file should be gzipped
+    :param int seed: random seed
+    :return str: path to the written file
+    """
+    rng = random.Random(seed)
+    opener = gzip.open if compress else open
+    with opener(path, "wt") as f:
+        for i in range(n_seqs):
+            f.write(">chr{} synthetic sequence {}\n".format(i + 1, i + 1))
+            seq = "".join(rng.choices("ACGT", k=seq_len))
+            for start in range(0, seq_len, line_width):
+                f.write(seq[start:start + line_width] + "\n")
+    return path
+
+
+def make_asset_dir(path, n_files=20, file_size=1024 * 1024, n_subdirs=2, seed=0):
+    """
+    Populate a synthetic asset directory with random files
+
+    :param str path: path to the directory to populate, created if missing
+    :param int n_files: number of files to create
+    :param int file_size: size of each file in bytes
+    :param int n_subdirs: number of subdirectories to spread the files across
+    :param int seed: random seed
+    :return str: path to the populated directory
+    """
+    rng = random.Random(seed)
+    for i in range(n_files):
+        subdir = os.path.join(path, "sub{}".format(i % n_subdirs)) if n_subdirs else path
+        if not os.path.exists(subdir):
+            os.makedirs(subdir)
+        with open(os.path.join(subdir, "file{}.bin".format(i)), "wb") as f:
+            f.write(rng.getrandbits(8 * file_size).to_bytes(file_size, "little"))
+    return path
+
+
+def make_genome_config(path, genome_folder, n_genomes=10, n_assets=20, n_tags=2, seed=0):
+    """
+    Write a synthetic genome configuration file.
+
+    The assets are registered in the config only, no files are created.
+
+    :param str path: path to the file to write
+    :param str genome_folder: path to use as the genome folder
+    :param int n_genomes: number of genomes
+    :param int n_assets: number of assets per genome
+    :param int n_tags: number of tags per asset
+    :param int seed: random seed
+    :return str: path to the written file
+    """
+    rng = random.Random(seed)
+
+    def _digest():
+        return "".join(rng.choice("0123456789abcdef") for _ in range(32))
+
+    genomes = OrderedDict()
+    for g in range(n_genomes):
+        assets = OrderedDict()
+        for a in range(n_assets):
+            asset = "asset{}".format(a)
+            tags = OrderedDict()
+            for t in range(n_tags):
+                tags["tag{}".format(t)] = {
+                    CFG_ASSET_PATH_KEY: asset,
+                    CFG_SEEK_KEYS_KEY: {asset: "genome{}.{}".format(g, asset), "index": "genome{}.idx".format(g)},
+                    CFG_ASSET_CHECKSUM_KEY: _digest(),
+                    CFG_ASSET_PARENTS_KEY: ["genome{}/asset0:tag0".format(g)] if a else [],
+                }
+            assets[asset] = {
+                CFG_ASSET_DESC_KEY: "synthetic asset {}".format(a),
+                CFG_ASSET_TAGS_KEY: tags,
+                CFG_ASSET_DEFAULT_TAG_KEY: "tag0"
+            }
+        genomes["genome{}".format(g)] = {
+            CFG_GENOME_DESC_KEY: "synthetic genome {}".format(g),
+            CFG_CHECKSUM_KEY: _digest(),
+            CFG_ASSETS_KEY: assets
+        }
+    cfg = OrderedDict([
+        (CFG_VERSION_KEY, REQ_CFG_VERSION),
+        (CFG_FOLDER_KEY, genome_folder),
+        (CFG_SERVERS_KEY, [DEFAULT_SERVER]),
+        (CFG_GENOMES_KEY, genomes)
+    ])
+    with open(path, "w") as f:
+        yaml.safe_dump(_to_builtin(cfg), f, default_flow_style=False)
+    return path
+
+
+def _to_builtin(x):
+    """ Convert nested OrderedDicts to dicts, which the safe YAML dumper can represent """
+    if isinstance(x, dict):
+        return {k: _to_builtin(v) for k, v in x.items()}
+    if isinstance(x, list):
+        return [_to_builtin(i) for i in x]
+    return x
@@ -0,0 +1,878 @@
+"""
+Single-pass annotation processing engine.
+
+The annotation recipes (ensembl_gtf, refgene_anno and feat_annotation) used to
+decompress the same input file once per output, piping it through long
+`gzip | grep | sed | awk | sort` command chains. Here every input is read
+once and each line is pushed to all the output pipelines at the same time.
+
+Each pipeline step reproduces the semantics of the shell command it replaces,
+so that the outputs are byte-for-byte identical to those of the original
+recipes:
+
+- awk field splitting (runs of blanks or a single tab), string/number
+  comparisons of input fields ("strnum") and number output formatting,
+- the stateful awk programs (e.g. the uninitialized variables and the arrays
+  that are not reset between the records),
+- `LC_COLLATE=C sort` with the keyed, unique (`-u`, first of the equal run)
+  and last-resort comparisons of GNU sort. Large inputs are sorted with an
+  external merge sort, spilling sorted runs to temporary files.
+"""
+
+import fnmatch
+import gzip
+import heapq
+import io
+import logging
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from decimal import Decimal
+from multiprocessing import Pool
+
+from .bgzf import BgzfWriter
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["Sort", "Pipeline", "run_pipelines", "open_input", "process_pool", "ensembl_gtf", "refgene_anno",
+           "feat_annotation", "dbnsfp"]
+
+# number of lines kept in memory by a sort before a sorted run is spilled to disk
+SORT_BUFFER_LINES = 1000000
+# minimal number of lines sorted in partitions on the process pool
+PARTITION_MIN_LINES = 10000
+# size of the chunks the dbNSFP chromosome files are streamed in
+DBNSFP_CHUNK_SIZE = 4 * 1024 * 1024
+DBNSFP_MEMBER_PATTERN = "dbNSFP*variant.chr*"
+ENCODING = "latin-1"  # decodes any byte, and preserves the byte (C locale) order
+
+_AWK_BLANKS = re.compile(r"[ \t\n]+")
+_AWK_NUM = r"[-+]?(?:\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)"
+_AWK_NUMERIC = re.compile(r"^[ \t\n]*" + _AWK_NUM + r"[ \t\n]*$")
+_AWK_NUM_PREFIX = re.compile(r"^[ \t\n]*(" + _AWK_NUM + ")")
+_SORT_NUM = re.compile(r"^[ \t]*(-?)(\d*)(?:\.(\d*))?")
+_SORT_KEY_SPEC = re.compile(r"^-k(\d+)(?:,(\d+))?([nr]*)$")
+
+
+# awk semantics
+
+def awk_fields(line, fs=None):
+    """
+    Split a record into fields, like awk does
+
+    :param str line: the record
+    :param str fs: a single character field separator, runs of blanks by default
+    :return list[str]: the fields
+    """
+    if fs is None:
+        return [f for f in _AWK_BLANKS.split(line) if f]
+    return line.split(fs) if line else []
+
+
+def _field(fields, i):
+    """ Get the i-th (1-based) field, an empty string if there are fewer fields """
+    return fields[i - 1] if i <= len(fields) else ""
+
+
+def _num(value):
+    """
+    Convert an awk value to a number, using the longest numeric prefix of strings
+
+    :param str | float | NoneType value: the value; None means uninitialized
+    :return float: the number
+    """
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _AWK_NUM_PREFIX.match(value)
+    return float(match.group(1)) if match else 0.0
+
+
+def _fmt(value):
+    """
+    Convert an awk value to the string it is printed as; the integral numbers
+    are printed as integers, the other ones with the default "%.6g" format
+
+    :param str | float | NoneType value: the value; None means uninitialized
+    :return str: the printed value
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)):
+        if value == int(value) and abs(value) < 2 ** 53:
+            return "%d" % value
+        return "%.6g" % value
+    return value
+
+
+def _numeric_value(value):
+    """
+    Get the number an awk value compares as, if it compares as a number
+
+    :param str | float | NoneType value: an input field (strnum), a number or
+        None for an uninitialized variable
+    :return float | NoneType: the number, None if the value compares as a string
+    """
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(value) if _AWK_NUMERIC.match(value) else None
+
+
+def awk_compare(a, b):
+    """
+    Compare two awk values: numerically if both look numeric, as strings otherwise.
+    String constants must be compared directly, they are never numeric.
+
+    :param str | float | NoneType a: an input field (strnum), a number or
+        None for an uninitialized variable
+    :param str | float | NoneType b: like a
+    :return int: -1, 0 or 1
+    """
+    na, nb = _numeric_value(a), _numeric_value(b)
+    if na is not None and nb is not None:
+        return (na > nb) - (na < nb)
+    sa, sb = _fmt(a), _fmt(b)
+    return (sa > sb) - (sa < sb)
+
+
+def _awk_true(value):
+    """ Truth value of an input field used as an awk pattern """
+    number = _numeric_value(value)
+    return number != 0 if number is not None else value != ""
+
+
+def _awk_split(value, sep):
+    """ awk split() with a single character separator """
+    return value.split(sep) if value else []
+
+
+# GNU sort semantics
+
+def _sort_number(text):
+    """ Numeric value of a sort key, as parsed by 'sort -n' in the C locale """
+    sign, integer, fraction = _SORT_NUM.match(text).groups()
+    if fraction:
+        return Decimal(sign + (integer or "0") + "." + fraction)
+    return -int(integer) if sign and integer else int(integer or 0)
+
+
+class _Reversed(object):
+    """ Wrapper that reverses the ordering of the wrapped string """
+    __slots__ = ["value"]
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _skip_field(line, pos):
+    """ Skip the blanks and then the non-blanks, starting at the position """
+    n = len(line)
+    while pos < n and line[pos] in " \t":
+        pos += 1
+    while pos < n and line[pos] not in " \t":
+        pos += 1
+    return pos
+
+
+class Sort(object):
+    """
+    GNU sort in the C locale, with the default (blank) field separation.
+
+    Keys start with the blanks preceding the field. The lines with equal keys
+    are compared as a whole unless the sort is unique, in which case only the
+    first line of each equal run is kept (GNU sort -u is stable).
+    """
+
+    def __init__(self, *options):
+        """
+        Create the sort
+
+        :param str options: sort command line options, e.g. '-k1,1', '-k2,2nr' or '-u'
+        """
+        self.unique = "-u" in options
+        self.keys = []
+        for opt in options:
+            if opt == "-u":
+                continue
+            match = _SORT_KEY_SPEC.match(opt)
+            if not match:
+                raise ValueError("Unsupported sort option: {}".format(opt))
+            start, end, flags = match.groups()
+            self.keys.append((int(start), int(end) if end else None, "n" in flags, "r" in flags))
+        self.options = options
+
+    def __repr__(self):
+        return "sort " + " ".join(self.options)
+
+    @property
+    def partitionable(self):
+        """ Whether the lines can be sorted in partitions by the first key, which is a single plain field """
+        start, end, numeric, reverse = self.keys[0]
+        return start == end and not numeric and not reverse
+
+    @staticmethod
+    def _key_text(line, start, end):
+        """ Get the text of the key that spans the fields start to end (to the end of the line if None) """
+        pos = 0
+        for _ in range(start - 1):
+            pos = _skip_field(line, pos)
+        if end is None:
+            return line[pos:]
+        lim = 0
+        for _ in range(end):
+            lim = _skip_field(line, lim)
+        return line[pos:lim] if lim > pos else ""
+
+    def partition_key(self, line):
+        """
+        Get the text of the first key, which the partitions of a partitionable sort are made by
+
+        :param str line: the line
+        :return str: the first key
+        """
+        start, end, _, _ = self.keys[0]
+        return self._key_text(line, start, end)
+
+    def key(self, line):
+        """
+        Compute the key the line is sorted by
+
+        :param str line: the line
+        :return tuple: sort key
+        """
+        key = []
+        for start, end, numeric, reverse in self.keys:
+            text = self._key_text(line, start, end)
+            if numeric:
+                value = _sort_number(text)
+                key.append(-value if reverse else value)
+            else:
+                key.append(_Reversed(text) if reverse else text)
+        if not self.unique:
+            key.append(line)  # last-resort comparison
+        return tuple(key)
+
+
+def _sort_lines(args):
+    """ Sort the lines in a worker process """
+    sort, lines = args
+    return sorted(lines, key=sort.key)
+
+
+@contextmanager
+def process_pool(processes):
+    """
+    Create a pool of processes the sorts are run on; no pool for a single process
+
+    :param int | str processes: number of processes
+    :return multiprocessing.Pool | NoneType: the pool
+    """
+    processes = int(processes)
+    if processes <= 1:
+        yield None
+        return
+    pool = Pool(processes)
+    try:
+        yield pool
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+# pipelines
+
+class _Stage(object):
+    """ A pipeline stage, which pushes its output lines to the next stage """
+
+    def __init__(self, downstream):
+        self.downstream = downstream
+
+    def push(self, line):
+        raise NotImplementedError
+
+    def close(self):
+        self.downstream.close()
+
+
+class _Each(_Stage):
+    def __init__(self, fun, downstream):
+        super(_Each, self).__init__(downstream)
+        self.fun = fun
+
+    def push(self, line):
+        out = self.fun(line)
+        if out is None:
+            return
+        if isinstance(out, list):
+            for o in out:
+                self.downstream.push(o)
+        else:
+            self.downstream.push(out)
+
+
+class _Program(_Stage):
+    """ Stateful stage, with 'push(line)' and 'end()' generator methods """
+
+    def __init__(self, program, downstream):
+        super(_Program, self).__init__(downstream)
+        self.program = program
+
+    def push(self, line):
+        for o in self.program.push(line):
+            self.downstream.push(o)
+
+    def close(self):
+        for o in self.program.end():
+            self.downstream.push(o)
+        super(_Program, self).close()
+
+
+class _Sorter(_Stage):
+    """ External merge sort stage """
+
+    def __init__(self, sort, downstream, pool=None, buffer_lines=SORT_BUFFER_LINES):
+        super(_Sorter, self).__init__(downstream)
+        self.sort = sort
+        self.pool = pool
+        self.buffer_lines = buffer_lines
+        self.buffer = []
+        self.runs = []
+        self.tmpdir = None
+
+    def push(self, line):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.buffer_lines:
+            self._spill()
+
+    def _sort_buffer(self):
+        """
+        Sort the buffered lines. If the first key is a plain field, e.g. the
+        chromosome, the lines are partitioned by it and the partitions are
+        sorted in parallel; concatenated in the order of the first key, they
+        are in the same order as the lines sorted as a whole.
+
+        :return list[str]: the sorted lines
+        """
+        if self.pool is None or not self.sort.partitionable or len(self.buffer) < PARTITION_MIN_LINES:
+            return sorted(self.buffer, key=self.sort.key)
+        partitions = {}
+        for line in self.buffer:
+            partitions.setdefault(self.sort.partition_key(line), []).append(line)
+        if len(partitions) == 1:
+            return sorted(self.buffer, key=self.sort.key)
+        sorted_lines = []
+        for lines in self.pool.map(_sort_lines, [(self.sort, partitions[k]) for k in sorted(partitions)]):
+            sorted_lines.extend(lines)
+        return sorted_lines
+
+    def _spill(self):
+        if self.tmpdir is None:
+            self.tmpdir = tempfile.mkdtemp(prefix="refgenie_sort_")
+        path = os.path.join(self.tmpdir, "run{}".format(len(self.runs)))
+        with io.open(path, "w", encoding=ENCODING, newline="\n") as f:
+            for line in self._sort_buffer():
+                f.write(line + "\n")
+        self.runs.append(path)
+        self.buffer = []
+
+    def _sorted(self):
+        if not self.runs:
+            for line in self._sort_buffer():
+                yield line
+            return
+        if self.buffer:
+            self._spill()
+        files = [io.open(p, encoding=ENCODING, newline="\n") for p in self.runs]
+        try:
+            # the run index breaks the ties, which keeps the merge stable
+            heap = []
+            for i, f in enumerate(files):
+                line = f.readline()
+                if line:
+                    line = line[:-1]
+                    heap.append((self.sort.key(line), i, line))
+            heapq.heapify(heap)
+            while heap:
+                _, i, line = heap[0]
+                yield line
+                nxt = files[i].readline()
+                if nxt:
+                    nxt = nxt[:-1]
+                    heapq.heapreplace(heap, (self.sort.key(nxt), i, nxt))
+                else:
+                    heapq.heappop(heap)
+        finally:
+            for f in files:
+                f.close()
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def close(self):
+        previous = None
+        for line in self._sorted():
+            if self.sort.unique:
+                key = self.sort.key(line)
+                if previous is not None and key == previous:
+                    continue
+                previous = key
+            self.downstream.push(line)
+        self.buffer = []
+        super(_Sorter, self).close()
+
+
+class _Sink(object):
+    """ Pipeline end, which collects the lines or writes them to a file """
+
+    def __init__(self, path=None, opener=None):
+        self.lines = [] if path is None else None
+        self.path = path
+        self.file = None
+        if path is not None:
+            self.file = (opener or io.open)(path, "wb")
+
+    def push(self, line):
+        if self.file is None:
+            self.lines.append(line)
+        else:
+            self.file.write((line + "\n").encode(ENCODING))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class Pipeline(object):
+    """
+    A chain of steps the lines are pushed through. A step is one of:
+
+    - a function that maps a line to None (drop it), a line or a list of lines,
+    - an object with 'push(line)' and 'end()' methods returning iterables of lines,
+      for stateful programs with an END block,
+    - a Sort.
+    """
+
+    def __init__(self, steps, output=None, pool=None):
+        """
+        Create the pipeline
+
+        :param list steps: the pipeline steps
+        :param str output: path to the file to write the output lines to;
+            the lines are collected in the 'lines' attribute if not provided
+        :param multiprocessing.Pool pool: pool of processes to sort the partitions on
+        """
+        self.steps = steps
+        self.output = output
+        self.sink = _Sink(output)
+        stage = self.sink
+        for step in reversed(steps):
+            if isinstance(step, Sort):
+                stage = _Sorter(step, stage, pool=pool)
+            elif hasattr(step, "push") and hasattr(step, "end"):
+                stage = _Program(step, stage)
+            else:
+                stage = _Each(step, stage)
+        self.head = stage
+
+    @property
+    def lines(self):
+        return self.sink.lines
+
+    def push(self, line):
+        self.head.push(line)
+
+    def close(self):
+        self.head.close()
+
+
+def open_input(path):
+    """
+    Open a possibly gzipped file for reading in binary mode, like 'gzip -dcf' does
+
+    :param str path: path to the file
+    :return file: binary file object
+    """
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    return gzip.open(path, "rb") if magic == b"\x1f\x8b" else open(path, "rb")
+
+
+def run_pipelines(inputs):
+    """
+    Read each input once, pushing every line to all of its pipelines
+
+    :param list[(str, list[Pipeline])] inputs: paths to the input files and
+        the pipelines to push their lines to
+    """
+    for path, pipelines in inputs:
+        _LOGGER.info("Processing '{}' with {} pipelines".format(path, len(pipelines)))
+        with open_input(path) as f:
+            for raw in f:
+                line = raw.decode(ENCODING)
+                if line.endswith("\n"):
+                    line = line[:-1]
+                for p in pipelines:
+                    p.push(line)
+        for p in pipelines:
+            p.close()
+
+
+# ensembl_gtf
+
+def _ensembl_tss(line):
+    # grep 'exon_number "1";' | sed 's/^/chr/' | awk -v OFS='\t' '{print $1, $4, $5, $20, $14, $7}' |
+    # sed 's/";//g' | sed 's/"//g'
+    if 'exon_number "1";' not in line:
+        return
+    f = awk_fields("chr" + line)
+    line = "\t".join([_field(f, i) for i in (1, 4, 5, 20, 14, 7)]).replace('";', "").replace('"', "")
+    # awk '{if($6=="+"){print $1"\t"$2+20"\t"$2+120...}else{print $1"\t"$3-120"\t"$3-20...}}'
+    f = awk_fields(line)
+    if _field(f, 6) == "+":
+        start, end = _num(_field(f, 2)) + 20, _num(_field(f, 2)) + 120
+    else:
+        start, end = _num(_field(f, 3)) - 120, _num(_field(f, 3)) - 20
+    return "\t".join([_field(f, 1), _fmt(start), _fmt(end), _field(f, 4), _field(f, 5), _field(f, 6)])
+
+
+def _ensembl_gene_body(line):
+    # awk '$3 == "gene"' | sed 's/^/chr/' | awk -v OFS='\t' '{print $1,$4,$5,$14,$6,$7}' |
+    # sed 's/";//g' | sed 's/"//g'
+    if _field(awk_fields(line), 3) != "gene":
+        return
+    f = awk_fields("chr" + line)
+    line = "\t".join([_field(f, i) for i in (1, 4, 5, 14, 6, 7)]).replace('";', "").replace('"', "")
+    # awk '$4!="Metazoa_SRP"' | awk '$4!="U3"' | awk '$4!="7SK"' | awk '($3-$2)>200'
+    f = awk_fields(line)
+    if _field(f, 4) in ("Metazoa_SRP", "U3", "7SK") or not _num(_field(f, 3)) - _num(_field(f, 2)) > 200:
+        return
+    # awk '{if($6=="+"){print $1"\t"$2+500"\t"$3...}else{print $1"\t"$2"\t"$3-500...}}'
+    if _field(f, 6) == "+":
+        start, end = _fmt(_num(_field(f, 2)) + 500), _field(f, 3)
+    else:
+        start, end = _field(f, 2), _fmt(_num(_field(f, 3)) - 500)
+    line = "\t".join([_field(f, 1), start, end, _field(f, 4), _field(f, 5), _field(f, 6)])
+    # awk '$3>$2'
+    f = awk_fields(line)
+    return line if awk_compare(_field(f, 3), _field(f, 2)) > 0 else None
+
+
+def ensembl_gtf(gtf, tss, gene_body, processes="1"):
+    """
+    Create the Ensembl TSS and gene body annotations
+
+    :param str gtf: path to the Ensembl GTF file, possibly gzipped
+    :param str tss: path to the TSS BED file to create
+    :param str gene_body: path to the gene body BED file to create
+    :param int | str processes: number of processes to sort the chromosomes on
+    """
+    with process_pool(processes) as pool:
+        run_pipelines([(gtf, [
+            Pipeline([_ensembl_tss, Sort("-k1,1", "-k2,2n", "-u")], tss, pool),
+            Pipeline([_ensembl_gene_body, Sort("-k4", "-u")], gene_body, pool)
+        ])])
+
+
+# refgene_anno
+
+def _refgene_tss(line):
+    # awk '{if($4=="+"){print $3"\t"$5"\t"$5"\t"$13"\t.\t"$4}else{print $3"\t"$6"\t"$6"\t"$13"\t.\t"$4}}'
+    f = awk_fields(line)
+    pos = _field(f, 5) if _field(f, 4) == "+" else _field(f, 6)
+    return "\t".join([_field(f, 3), pos, pos, _field(f, 13), ".", _field(f, 4)])
+
+
+def _refgene_exons(line):
+    # awk -v OFS='\t' '$9>1' |
+    # awk -v OFS='\t' '{ n = split($10, a, ","); split($11, b, ","); for(i=1; i<n; ++i) print $3, a[i], b[i], $13, i, $4 }'
+    f = awk_fields(line)
+    if not awk_compare(_field(f, 9), 1) > 0:
+        return
+    starts, ends = _awk_split(_field(f, 10), ","), _awk_split(_field(f, 11), ",")
+    return ["\t".join([_field(f, 3), _field(starts, i), _field(ends, i), _field(f, 13), "%d" % i, _field(f, 4)])
+            for i in range(1, len(starts))]
+
+
+def _refgene_exons_strand(line):
+    # awk -v OFS='\t' '$6=="+" && $5!=1 {print $0} $6=="-" {print $0}'
+    f = awk_fields(line)
+    if (_field(f, 6) == "+" and awk_compare(_field(f, 5), 1) != 0) or _field(f, 6) == "-":
+        return line
+
+
+class _RefgeneLastExon(object):
+    """
+    awk '$4!=prev4 && prev6=="-" {prev4=$4; prev6=$6; delete line[NR-1]; idx-=1}
+        {line[++idx]=$0; prev4=$4; prev6=$6} END {for (x=1; x<=idx; x++) print line[x]}'
+    """
+
+    def __init__(self):
+        self.nr = 0
+        self.idx = 0
+        self.prev4 = None
+        self.prev6 = None
+        self.saved = {}
+
+    def push(self, line):
+        self.nr += 1
+        f = awk_fields(line)
+        if awk_compare(_field(f, 4), self.prev4) != 0 and self.prev6 == "-":
+            self.prev4, self.prev6 = _field(f, 4), _field(f, 6)
+            self.saved.pop(self.nr - 1, None)
+            self.idx -= 1
+        self.idx += 1
+        self.saved[self.idx] = line
+        self.prev4, self.prev6 = _field(f, 4), _field(f, 6)
+        return []
+
+    def end(self):
+        # deleted entries are printed as empty lines
+        return [self.saved.get(x, "") for x in range(1, self.idx + 1)]
+
+
+def _refgene_introns(line):
+    # awk -v OFS='\t' '$9>1' |
+    # awk -F'\t' '{ exonCount=int($9);split($10,exonStarts,"[,]"); split($11,exonEnds,"[,]");
+    #   for(i=1;i<exonCount;i++) {printf("%s\t%s\t%s\t%s\t%d\t%s\n",$3,exonEnds[i],exonStarts[i+1],$13,
+    #   ($3=="+"?i:exonCount-i),$4);}}'
+    if not awk_compare(_field(awk_fields(line), 9), 1) > 0:
+        return
+    f = awk_fields(line, "\t")
+    count = int(_num(_field(f, 9)))
+    starts, ends = _awk_split(_field(f, 10), ","), _awk_split(_field(f, 11), ",")
+    return ["\t".join([_field(f, 3), _field(ends, i), _field(starts, i + 1), _field(f, 13),
+                       "%d" % (i if _field(f, 3) == "+" else count - i), _field(f, 4)])
+            for i in range(1, count)]
+
+
+def _refgene_pre_mrna(line):
+    # grep 'cmpl' | awk '{print $3"\t"$5"\t"$6"\t"$13"\t.\t"$4}'
+    if "cmpl" not in line:
+        return
+    f = awk_fields(line)
+    return "\t".join([_field(f, 3), _field(f, 5), _field(f, 6), _field(f, 13), ".", _field(f, 4)])
+
+
+def refgene_anno(refgene, tss, exons, introns, pre_mrna, processes="1"):
+    """
+    Create the TSS, exon, intron and premature mRNA annotations from the RefGene database
+
+    :param str refgene: path to the RefGene database file, possibly gzipped
+    :param str tss: path to the TSS BED file to create
+    :param str exons: path to the exons BED file to create
+    :param str introns: path to the introns BED file to create
+    :param str pre_mrna: path to the premature mRNA BED file to create
+    :param int | str processes: number of processes to sort the chromosomes on
+    """
+    with process_pool(processes) as pool:
+        run_pipelines([(refgene, [
+            Pipeline([_refgene_tss, Sort("-k1,1", "-k2,2n", "-u")], tss, pool),
+            Pipeline([_refgene_exons, _refgene_exons_strand, _RefgeneLastExon(), Sort("-k1,1", "-k2,2n", "-u")],
+                     exons, pool),
+            Pipeline([_refgene_introns, Sort("-k1,1", "-k2,2n", "-u")], introns, pool),
+            Pipeline([_refgene_pre_mrna, Sort("-k1,1", "-k2,2n", "-u")], pre_mrna, pool)
+        ])])
+
+
+# feat_annotation
+
+def _keep_start_lt_end(line):
+    # awk '$2<$3'
+    f = awk_fields(line)
+    return line if awk_compare(_field(f, 2), _field(f, 3)) < 0 else None
+
+
+def _gtf_feature(feature, name):
+    """
+    awk '$3=="<feature>"' | grep -v 'pseudogene' |
+    awk -v OFS='\t' '{print "chr"$1, $4-1, $5, "<name>", $6, $7}' | awk '$2<$3'
+    """
+    def _fun(line):
+        f = awk_fields(line)
+        if _field(f, 3) != feature or "pseudogene" in line:
+            return
+        return _keep_start_lt_end("\t".join(
+            ["chr" + _field(f, 1), _fmt(_num(_field(f, 4)) - 1), _field(f, 5), name, _field(f, 6), _field(f, 7)]))
+    return _fun
+
+
+def _gtf_intron_exons(line):
+    # awk '$3=="exon"' | grep -v 'pseudogene' |
+    # awk -v OFS='\t' '{ split($20, a, "\""); print "chr"$1, $4-1, $5, a[2], $6, $7}'
+    f = awk_fields(line)
+    if _field(f, 3) != "exon" or "pseudogene" in line:
+        return
+    return "\t".join(["chr" + _field(f, 1), _fmt(_num(_field(f, 4)) - 1), _field(f, 5),
+                      _field(_awk_split(_field(f, 20), '"'), 2), _field(f, 6), _field(f, 7)])
+
+
+class _SeenBefore(object):
+    """ awk 'seen[$4]++ && seen[$4] > 1' """
+
+    def __init__(self):
+        self.seen = {}
+
+    def push(self, line):
+        key = _field(awk_fields(line), 4)
+        count = self.seen.get(key, 0)
+        self.seen[key] = count + 1
+        return [line] if count else []
+
+    def end(self):
+        return []
+
+
+class _Introns(object):
+    """
+    awk -v OFS='\t' '{if($4==prev4){new2=prev3+1;} {prev4=$4; prev3=$3; print $1, new2, $2-1, "Intron", $5, $6}}'
+    """
+
+    def __init__(self):
+        self.prev3 = None
+        self.prev4 = None
+        self.new2 = None
+
+    def push(self, line):
+        f = awk_fields(line)
+        if awk_compare(_field(f, 4), self.prev4) == 0:
+            self.new2 = _num(self.prev3) + 1
+        self.prev4, self.prev3 = _field(f, 4), _field(f, 3)
+        return ["\t".join([_field(f, 1), _fmt(self.new2), _fmt(_num(_field(f, 2)) - 1), "Intron",
+                           _field(f, 5), _field(f, 6)])]
+
+    def end(self):
+        return []
+
+
+def _nonzero_start(line):
+    # awk -F'\t' '$2'
+    return line if _awk_true(_field(awk_fields(line, "\t"), 2)) else None
+
+
+def _gff_feature(feature, name):
+    """
+    awk '$3=="<feature>"' | awk -v OFS='\t' '{print "chr"$1, $4, $5, "<name>", $6, $7}' | awk '$2<$3'
+    """
+    def _fun(line):
+        f = awk_fields(line)
+        if _field(f, 3) != feature:
+            return
+        return _keep_start_lt_end(
+            "\t".join(["chr" + _field(f, 1), _field(f, 4), _field(f, 5), name, _field(f, 6), _field(f, 7)]))
+    return _fun
+
+
+def feat_annotation(gtf, gff, output, processes="1"):
+    """
+    Create the combined genomic feature annotation
+
+    :param str gtf: path to the Ensembl GTF file, possibly gzipped
+    :param str gff: path to the Ensembl regulatory build GFF file, possibly gzipped
+    :param str output: path to the gzipped annotation BED file to create
+    :param int | str processes: number of processes to sort the chromosomes on
+    """
+    with process_pool(processes) as pool:
+        exons = Pipeline([_gtf_feature("exon", "Exon"), Sort("-k1,1", "-k2,2n", "-k3,3n", "-u")], pool=pool)
+        introns = Pipeline([_gtf_intron_exons, Sort("-k1,1", "-k2,2n", "-k3,3n", "-u"), _SeenBefore(),
+                            Sort("-k1,1", "-k2,2n", "-k3,3nr"), Sort("-k1,1", "-k2,2n", "-u"),
+                            Sort("-k1,1", "-k3,3n", "-u"), _Introns(), _nonzero_start, _keep_start_lt_end,
+                            Sort("-k1,1", "-k2,2n", "-u")], pool=pool)
+        utr3 = Pipeline([_gtf_feature("three_prime_utr", "3' UTR"), Sort("-k1,1", "-k2,2n", "-u")], pool=pool)
+        utr5 = Pipeline([_gtf_feature("five_prime_utr", "5' UTR"), Sort("-k1,1", "-k2,2n", "-u")], pool=pool)
+        promoter = Pipeline([_gff_feature("promoter", "Promoter"), Sort("-k1,1", "-k2,2n", "-k3,3n", "-u")],
+                            pool=pool)
+        flanking = Pipeline([_gff_feature("promoter_flanking_region", "Promoter Flanking Region"),
+                             Sort("-k1,1", "-k2,2n", "-k3,3n", "-u")], pool=pool)
+        enhancer = Pipeline([_gff_feature("enhancer", "Enhancer"), Sort("-k1,1", "-k2,2n", "-k3,3n", "-u")],
+                            pool=pool)
+        run_pipelines([(gtf, [exons, introns, utr3, utr5]), (gff, [promoter, flanking, enhancer])])
+    # cat enhancer promoter promoter_flanking 5utr 3utr exons introns | awk -F'\t' '!seen[$1, $2, $3]++' | gzip
+    seen = set()
+    with gzip.open(output, "wb") as out:
+        for p in [enhancer, promoter, flanking, utr5, utr3, exons, introns]:
+            for line in p.lines:
+                f = awk_fields(line, "\t")
+                key = (_field(f, 1), _field(f, 2), _field(f, 3))
+                if key not in seen:
+                    seen.add(key)
+                    out.write((line + "\n").encode(ENCODING))
+
+
+# dbnsfp
+
+def _dbnsfp_members(archive):
+    """
+    Get the per-chromosome members of the dbNSFP archive, in the order of the 'dbNSFP*variant.chr*' shell glob
+
+    :param zipfile.ZipFile archive: the dbNSFP archive
+    :return list[(str, str)]: member names and the names of the files they are decompressed to
+    """
+    members = []
+    for name in archive.namelist():
+        base = os.path.basename(name)
+        unzipped = base[:-3] if base.endswith(".gz") else base
+        if fnmatch.fnmatchcase(unzipped, DBNSFP_MEMBER_PATTERN):
+            members.append((name, unzipped))
+    return sorted(members, key=lambda x: x[1])
+
+
+def _open_member(archive, name):
+    """ Open a possibly gzipped archive member for reading """
+    f = archive.open(name)
+    return gzip.GzipFile(fileobj=f, mode="rb") if name.endswith(".gz") else f
+
+
+def _dbnsfp_chunks(archive, members):
+    """
+    Stream the concatenated members, without the lines that contain '#'; like 'cat ... | grep -v "#"'
+
+    :param zipfile.ZipFile archive: the dbNSFP archive
+    :param list[str] members: names of the members to concatenate
+    :return Iterable[bytes]: chunks of complete lines
+    """
+    rest = b""
+    for name in members:
+        _LOGGER.info("Processing '{}'".format(name))
+        with _open_member(archive, name) as f:
+            for data in iter(lambda: f.read(DBNSFP_CHUNK_SIZE), b""):
+                data = rest + data
+                cut = data.rfind(b"\n") + 1
+                data, rest = data[:cut], data[cut:]
+                if b"#" in data:
+                    data = b"".join([l for l in data.splitlines(True) if b"#" not in l])
+                if data:
+                    yield data
+    if rest and b"#" not in rest:
+        yield rest + b"\n"
+
+
+def dbnsfp(archive, output, threads="1"):
+    """
+    Create the dbNSFP database file by streaming the per-chromosome files from the
+    archive to a BGZF-compressed file, without decompressing them to disk
+
+    :param str archive: path to the dbNSFP zip archive
+    :param str output: path to the BGZF-compressed database file to create
+    :param int | str threads: number of compression threads
+    """
+    with zipfile.ZipFile(archive) as z:
+        members = _dbnsfp_members(z)
+        header = [m for m, unzipped in members if unzipped.endswith("_variant.chr1")]
+        if not header:
+            raise ValueError("No '{}' chromosome 1 file in the archive: {}".format(DBNSFP_MEMBER_PATTERN, archive))
+        with BgzfWriter(output, threads=int(threads)) as out:
+            # head -n1 dbNSFP*_variant.chr1
+            with _open_member(z, header[0]) as f:
+                out.write(f.readline())
+            for chunk in _dbnsfp_chunks(z, [m for m, _ in members]):
+                out.write(chunk)
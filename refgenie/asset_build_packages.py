@@ -11,6 +11,19 @@
 #   provided via the CLI. These should be listed as 'required_inputs' and
 #   will be checked for existence before the commands are executed.
 
+# Besides shell commands, the command list may contain native stages: dicts
+# with the name of a stage registered in refgenie.stages and its arguments,
+# which are populated in the same way as the commands.
+
+# A list in the command list declares a group of independent commands, which
+# are run concurrently (see 'refgenie build --command-workers'). Each item of
+# a group is a command, a stage, or a list of commands that are run in order.
+# The build fails if any command of a group fails.
+
+# Recipes may also declare the compute resources (cores, mem in MB, time) a
+# build needs when the jobs are submitted to a cluster by build_all_genome;
+# the recipes that do not declare them get the defaults defined there.
+
 DESC = "description"
 ASSET_DESC = "asset_description"
 ASSETS = "assets"
@@ -22,8 +35,20 @@ CONT = "container"
 CMD_LST = "command_list"
 KEY = "key"
 DEFAULT = "default"
+STAGE = "stage"
+STAGE_ARGS = "arguments"
+RESOURCES = "resources"
+
+RECIPE_CONSTS = ["DESC", "ASSET_DESC", "ASSETS", "PTH", "REQ_FILES", "REQ_ASSETS", "CONT", "CMD_LST", "KEY", "DEFAULT",
+                 "STAGE", "STAGE_ARGS", "RESOURCES"]
 
-RECIPE_CONSTS = ["DESC", "ASSET_DESC", "ASSETS", "PTH", "REQ_FILES", "REQ_ASSETS", "CONT", "CMD_LST", "KEY", "DEFAULT"]
+# recipes that produce a fasta asset, which initializes the genome
+FASTA_RECIPES = ["fasta", "fasta_bgzip"]
+
+# for the tools that read only plain FASTA files: writes the fasta asset,
+# decompressed if it is compressed (fasta_bgzip), to {asset_outfolder}/{genome}.fa.
+# The recipes remove the file when the tool is done.
+PLAIN_FASTA_CMD = "gzip -dcf {fasta} > {asset_outfolder}/{genome}.fa"
 
 asset_build_packages = {
     "fasta": {
@@ -49,6 +74,35 @@ asset_build_packages = {
             "cut -f 1,2 {asset_outfolder}/{genome}.fa.fai > {asset_outfolder}/{genome}.chrom.sizes",
         ]
     },
+    "fasta_bgzip": {
+        DESC: "DNA sequences in the BGZF-compressed FASTA format (produced with bgzip), indexed FASTA (produced with samtools index) and chromosome sizes file",
+        ASSETS: {
+            "fasta": "{genome}.fa.gz",
+            "fai": "{genome}.fa.gz.fai",
+            "gzi": "{genome}.fa.gz.gzi",
+            "chrom_sizes": "{genome}.chrom.sizes"
+        },
+        REQ_FILES: [
+            {
+                KEY: "fasta",
+                DESC: "gzipped fasta file"
+            }
+        ],
+        REQ_ASSETS: [],
+        REQ_PARAMS: [
+            {
+                KEY: "threads",
+                DEFAULT: "8",
+                DESC: "Number of threads to use for parallel computing"
+            }
+        ],
+        CONT: "databio/refgenie",
+        CMD_LST: [
+            "gzip -dcf {fasta} | bgzip -@ {threads} -c > {asset_outfolder}/{genome}.fa.gz",
+            "samtools faidx {asset_outfolder}/{genome}.fa.gz",
+            "cut -f 1,2 {asset_outfolder}/{genome}.fa.gz.fai > {asset_outfolder}/{genome}.chrom.sizes",
+        ]
+    },
     "fasta_txome": {
         DESC: "cDNA sequences in the FASTA format, indexed FASTA (produced with samtools index) and chromosome sizes file",
         ASSETS: {
@@ -93,16 +147,17 @@ asset_build_packages = {
             }
         ],
         CONT: "databio/refgenie",
+        RESOURCES: {"cores": "8", "time": "24:00:00"},
         CMD_LST: [
-            "cp {dbnsfp} {asset_outfolder}/{genome}.zip",
-            "unzip {asset_outfolder}/{genome}.zip -d {asset_outfolder}",
-            "gunzip -v {asset_outfolder}/*variant.chr*.gz",
-            "head -n1 {asset_outfolder}/dbNSFP*_variant.chr1 > {asset_outfolder}/{genome}_dbNSFP.txt",
-            "cat {asset_outfolder}/dbNSFP*variant.chr* | grep -v '#' >> {asset_outfolder}/{genome}_dbNSFP.txt",
-            "rm {asset_outfolder}/dbNSFP*_variant.chr*",
-            "bgzip -@ {threads} {asset_outfolder}/{genome}_dbNSFP.txt",
-            "tabix -s 1 -b 2 -e 2 {asset_outfolder}/{genome}_dbNSFP.txt.gz",
-            "rm `find {asset_outfolder} -type f -not -path '{asset_outfolder}/_refgenie_build*' -not -path '{asset_outfolder}/hg38_dbNSFP.txt.*'`"
+            {
+                STAGE: "dbnsfp",
+                STAGE_ARGS: {
+                    "archive": "{dbnsfp}",
+                    "output": "{asset_outfolder}/{genome}_dbNSFP.txt.gz",
+                    "threads": "{threads}"
+                }
+            },
+            "tabix -s 1 -b 2 -e 2 {asset_outfolder}/{genome}_dbNSFP.txt.gz"
         ]
     },
     "dbsnp": {
@@ -125,8 +180,10 @@ asset_build_packages = {
         REQ_PARAMS: [],
         CONT: "databio/refgenie",
         CMD_LST: [
-            "cp {dbsnp_vcf} {asset_outfolder}/{genome}_dbSNP.gz",
-            "cp {dbsnp_tbi} {asset_outfolder}/{genome}_dbSNP.gz.tbi"
+            [
+                "cp {dbsnp_vcf} {asset_outfolder}/{genome}_dbSNP.gz",
+                "cp {dbsnp_tbi} {asset_outfolder}/{genome}_dbSNP.gz.tbi"
+            ]
         ]
     },
     "bowtie2_index": {
@@ -165,7 +222,7 @@ asset_build_packages = {
         CONT: "databio/refgenie",
         CMD_LST: [
             "ln -sf {fasta} {asset_outfolder}",
-            "bwa index {asset_outfolder}/{genome}.fa",
+            "bwa index -p {asset_outfolder}/{genome}.fa {fasta}",
             ] 
     },    
     "hisat2_index": {
@@ -184,7 +241,9 @@ asset_build_packages = {
         REQ_PARAMS: [],
         CONT: "databio/refgenie",
         CMD_LST: [
-            "hisat2-build {fasta} {asset_outfolder}/{genome}"
+            PLAIN_FASTA_CMD,
+            "hisat2-build {asset_outfolder}/{genome}.fa {asset_outfolder}/{genome}",
+            "rm {asset_outfolder}/{genome}.fa"
             ] 
     },
     "bismark_bt2_index": {
@@ -202,6 +261,7 @@ asset_build_packages = {
         ASSETS: {
             "bismark_bt2_index": "."
         },
+        RESOURCES: {"mem": "32000", "time": "24:00:00"},
         CMD_LST: [
             "ln -sf {fasta} {asset_outfolder}",
             "bismark_genome_preparation --bowtie2 {asset_outfolder}"
@@ -222,6 +282,7 @@ asset_build_packages = {
         ASSETS: {
             "bismark_bt1_index": "."
         },
+        RESOURCES: {"mem": "32000", "time": "24:00:00"},
         CMD_LST: [
             "ln -sf {fasta} {asset_outfolder}",
             "bismark_genome_preparation {asset_outfolder}"
@@ -297,11 +358,16 @@ asset_build_packages = {
         ASSETS: {
             "salmon_sa_index": "."
         },
+        RESOURCES: {"cores": "8", "mem": "32000", "time": "12:00:00"},
         CMD_LST: [
-            "grep '^>' {fasta} | cut -d ' ' -f 1 > {asset_outfolder}/decoys.txt",
-            "sed -i.bak -e 's/>//g' {asset_outfolder}/decoys.txt",
-            "rm {asset_outfolder}/decoys.txt.bak",
-            "cat {fasta_txome} {fasta} > {asset_outfolder}/gentrome.fa",
+            [
+                [
+                    "gzip -dcf {fasta} | grep '^>' | cut -d ' ' -f 1 > {asset_outfolder}/decoys.txt",
+                    "sed -i.bak -e 's/>//g' {asset_outfolder}/decoys.txt",
+                    "rm {asset_outfolder}/decoys.txt.bak"
+                ],
+                "gzip -dcf {fasta_txome} {fasta} > {asset_outfolder}/gentrome.fa"
+            ],
             "salmon index -t {asset_outfolder}/gentrome.fa -d {asset_outfolder}/decoys.txt -p {threads} -i {asset_outfolder}",
             "rm {asset_outfolder}/gentrome.fa {asset_outfolder}/decoys.txt"
         ]
@@ -337,17 +403,22 @@ asset_build_packages = {
         ASSETS: {
             "salmon_partial_sa_index": "."
         },
+        RESOURCES: {"cores": "8", "mem": "32000", "time": "12:00:00"},
         CMD_LST: [
             "gunzip -c {gtf} > {asset_outfolder}/{genome}.gtf",
             "awk -v OFS='\t' '{{if ($3==\"exon\") {{print $1,$4,$5}}}}' {asset_outfolder}/{genome}.gtf > {asset_outfolder}/exons.bed",
-            "bedtools maskfasta -fi {fasta} -bed {asset_outfolder}/exons.bed -fo {asset_outfolder}/reference.masked.genome.fa",
+            PLAIN_FASTA_CMD,
+            "bedtools maskfasta -fi {asset_outfolder}/{genome}.fa -bed {asset_outfolder}/exons.bed -fo {asset_outfolder}/reference.masked.genome.fa",
+            "rm {asset_outfolder}/{genome}.fa",
             "mashmap -r {asset_outfolder}/reference.masked.genome.fa -q {fasta_txome} -t {threads} --pi 80 -s 500 -o {asset_outfolder}/mashmap.out",
             "awk -v OFS='\t' '{{print $6,$8,$9}}' {asset_outfolder}/mashmap.out | sort -k1,1 -k2,2n - > {asset_outfolder}/genome_found.sorted.bed",
             "bedtools merge -i {asset_outfolder}/genome_found.sorted.bed > {asset_outfolder}/genome_found_merged.bed",
             "bedtools getfasta -fi {asset_outfolder}/reference.masked.genome.fa -bed {asset_outfolder}/genome_found_merged.bed -fo {asset_outfolder}/genome_found.fa",
             "awk '{{a=$0; getline;split(a, b, \":\");  r[b[1]] = r[b[1]]\"\"$0}} END {{ for (k in r) {{ print k\"\\n\"r[k] }} }}' {asset_outfolder}/genome_found.fa > {asset_outfolder}/decoy.fa",
-            "cat {fasta_txome} {asset_outfolder}/decoy.fa > {asset_outfolder}/gentrome.fa",
-            "grep '>' {asset_outfolder}/decoy.fa | awk '{{print substr($1,2); }}' > {asset_outfolder}/decoys.txt",
+            [
+                "cat {fasta_txome} {asset_outfolder}/decoy.fa > {asset_outfolder}/gentrome.fa",
+                "grep '>' {asset_outfolder}/decoy.fa | awk '{{print substr($1,2); }}' > {asset_outfolder}/decoys.txt"
+            ],
             "rm {asset_outfolder}/exons.bed {asset_outfolder}/reference.masked.genome.fa {asset_outfolder}/mashmap.out {asset_outfolder}/genome_found.sorted.bed {asset_outfolder}/genome_found_merged.bed {asset_outfolder}/genome_found.fa {asset_outfolder}/decoy.fa {asset_outfolder}/reference.masked.genome.fa.fai",
             "salmon index -t {asset_outfolder}/gentrome.fa -d {asset_outfolder}/decoys.txt -i {asset_outfolder} -p {threads}"
         ]
@@ -374,7 +445,9 @@ asset_build_packages = {
             "epilog_index": "."
         },
         CMD_LST: [
-            "epilog index -i {fasta} -o {asset_outfolder}/{genome}_{context}.tsv --context {context} -t"
+            PLAIN_FASTA_CMD,
+            "epilog index -i {asset_outfolder}/{genome}.fa -o {asset_outfolder}/{genome}_{context}.tsv --context {context} -t",
+            "rm {asset_outfolder}/{genome}.fa"
             ] 
     },
     "star_index": {
@@ -398,9 +471,12 @@ asset_build_packages = {
         ASSETS: {
             "star_index": "."
         },
+        RESOURCES: {"cores": "8", "mem": "64000", "time": "12:00:00"},
         CMD_LST: [
             "mkdir -p {asset_outfolder}",
-            "STAR --runThreadN {threads} --runMode genomeGenerate --genomeDir {asset_outfolder} --genomeFastaFiles {fasta}"
+            PLAIN_FASTA_CMD,
+            "STAR --runThreadN {threads} --runMode genomeGenerate --genomeDir {asset_outfolder} --genomeFastaFiles {asset_outfolder}/{genome}.fa",
+            "rm {asset_outfolder}/{genome}.fa"
             ]
     },
     "gencode_gtf": {
@@ -430,7 +506,13 @@ asset_build_packages = {
             }
         ],
         REQ_ASSETS: [],
-        REQ_PARAMS: [],
+        REQ_PARAMS: [
+            {
+                KEY: "threads",
+                DEFAULT: "8",
+                DESC: "Number of threads to use for parallel computing"
+            }
+        ],
         CONT: "databio/refgenie",
         ASSETS: {
             "ensembl_gtf": "{genome}.gtf.gz",
@@ -439,8 +521,15 @@ asset_build_packages = {
         },
         CMD_LST: [
             "cp {ensembl_gtf} {asset_outfolder}/{genome}.gtf.gz",
-            "gzip -dcf {asset_outfolder}/{genome}.gtf.gz | grep 'exon_number \"1\";' | sed 's/^/chr/' | awk -v OFS='\t' '{{print $1, $4, $5, $20, $14, $7}}' | sed 's/\";//g' | sed 's/\"//g' | awk '{{if($6==\"+\"){{print $1\"\t\"$2+20\"\t\"$2+120\"\t\"$4\"\t\"$5\"\t\"$6}}else{{print $1\"\t\"$3-120\"\t\"$3-20\"\t\"$4\"\t\"$5\"\t\"$6}}}}' | LC_COLLATE=C sort -k1,1 -k2,2n -u > {asset_outfolder}/{genome}_ensembl_TSS.bed",
-            "gzip -dcf {asset_outfolder}/{genome}.gtf.gz | awk '$3 == \"gene\"' | sed 's/^/chr/' | awk -v OFS='\t' '{{print $1,$4,$5,$14,$6,$7}}' | sed 's/\";//g' | sed 's/\"//g' | awk '$4!=\"Metazoa_SRP\"' | awk '$4!=\"U3\"' | awk '$4!=\"7SK\"'  | awk '($3-$2)>200' | awk '{{if($6==\"+\"){{print $1\"\t\"$2+500\"\t\"$3\"\t\"$4\"\t\"$5\"\t\"$6}}else{{print $1\"\t\"$2\"\t\"$3-500\"\t\"$4\"\t\"$5\"\t\"$6}}}}' | awk '$3>$2' | LC_COLLATE=C sort -k4 -u > {asset_outfolder}/{genome}_ensembl_gene_body.bed"
+            {
+                STAGE: "ensembl_gtf",
+                STAGE_ARGS: {
+                    "gtf": "{asset_outfolder}/{genome}.gtf.gz",
+                    "tss": "{asset_outfolder}/{genome}_ensembl_TSS.bed",
+                    "gene_body": "{asset_outfolder}/{genome}_ensembl_gene_body.bed",
+                    "processes": "{threads}"
+                }
+            }
             ] 
     },
     "ensembl_rb": {
@@ -470,7 +559,13 @@ asset_build_packages = {
             }
         ],
         REQ_ASSETS: [],
-        REQ_PARAMS: [],
+        REQ_PARAMS: [
+            {
+                KEY: "threads",
+                DEFAULT: "8",
+                DESC: "Number of threads to use for parallel computing"
+            }
+        ],
         CONT: "databio/refgenie",
         ASSETS: {
             "refgene_anno": "{genome}_refGene.txt.gz",
@@ -481,10 +576,17 @@ asset_build_packages = {
         },
         CMD_LST: [
             "cp {refgene} {asset_outfolder}/{genome}_refGene.txt.gz",
-            "gzip -dcf {asset_outfolder}/{genome}_refGene.txt.gz | awk '{{if($4==\"+\"){{print $3\"\t\"$5\"\t\"$5\"\t\"$13\"\t.\t\"$4}}else{{print $3\"\t\"$6\"\t\"$6\"\t\"$13\"\t.\t\"$4}}}}' | LC_COLLATE=C sort -k1,1 -k2,2n -u > {asset_outfolder}/{genome}_TSS.bed",
-            "gzip -dcf {asset_outfolder}/{genome}_refGene.txt.gz | awk -v OFS='\t' '$9>1' | awk -v OFS='\t' '{{ n = split($10, a, \",\"); split($11, b, \",\"); for(i=1; i<n; ++i) print $3, a[i], b[i], $13, i, $4 }}' | awk -v OFS='\t' '$6==\"+\" && $5!=1 {{print $0}} $6==\"-\" {{print $0}}' | awk '$4!=prev4 && prev6==\"-\" {{prev4=$4; prev6=$6; delete line[NR-1]; idx-=1}} {{line[++idx]=$0; prev4=$4; prev6=$6}} END {{for (x=1; x<=idx; x++) print line[x]}}' | LC_COLLATE=C sort -k1,1 -k2,2n -u > {asset_outfolder}/{genome}_exons.bed",
-            "gzip -dcf {asset_outfolder}/{genome}_refGene.txt.gz | awk -v OFS='\t' '$9>1' | awk -F'\t' '{{ exonCount=int($9);split($10,exonStarts,\"[,]\"); split($11,exonEnds,\"[,]\"); for(i=1;i<exonCount;i++) {{printf(\"%s\\t%s\\t%s\\t%s\\t%d\\t%s\\n\",$3,exonEnds[i],exonStarts[i+1],$13,($3==\"+\"?i:exonCount-i),$4);}}}}' | LC_COLLATE=C sort -k1,1 -k2,2n -u > {asset_outfolder}/{genome}_introns.bed",
-            "gzip -dcf {asset_outfolder}/{genome}_refGene.txt.gz | grep 'cmpl' | awk  '{{print $3\"\t\"$5\"\t\"$6\"\t\"$13\"\t.\t\"$4}}' | LC_COLLATE=C sort -k1,1 -k2,2n -u >  {asset_outfolder}/{genome}_pre-mRNA.bed"
+            {
+                STAGE: "refgene_anno",
+                STAGE_ARGS: {
+                    "refgene": "{asset_outfolder}/{genome}_refGene.txt.gz",
+                    "tss": "{asset_outfolder}/{genome}_TSS.bed",
+                    "exons": "{asset_outfolder}/{genome}_exons.bed",
+                    "introns": "{asset_outfolder}/{genome}_introns.bed",
+                    "pre_mrna": "{asset_outfolder}/{genome}_pre-mRNA.bed",
+                    "processes": "{threads}"
+                }
+            }
         ]
     },
     "suffixerator_index": {
@@ -567,19 +669,24 @@ asset_build_packages = {
                 DESC: "Regulatory annotation file in General Feature Format (GTF) from Ensembl"
             }
         ],
-        REQ_PARAMS: [],
+        REQ_PARAMS: [
+            {
+                KEY: "threads",
+                DEFAULT: "8",
+                DESC: "Number of threads to use for parallel computing"
+            }
+        ],
         CONT: "databio/refgenie",
         CMD_LST: [
-            "gzip -dcf {ensembl_gtf} | awk '$3==\"exon\"' | grep -v 'pseudogene' | awk -v OFS='\t' '{{print \"chr\"$1, $4-1, $5, \"Exon\", $6, $7}}' | awk '$2<$3' | env LC_COLLATE=C sort -k1,1 -k2,2n -k3,3n -u > {asset_outfolder}/{genome}_exons.bed",
-            "gzip -dcf {ensembl_gtf} | awk '$3==\"exon\"' | grep -v 'pseudogene' | awk -v OFS='\t' '{{ split($20, a, \"\\\"\"); print \"chr\"$1, $4-1, $5, a[2], $6, $7}}' | env LC_COLLATE=C sort -k1,1 -k2,2n -k3,3n -u | awk 'seen[$4]++ && seen[$4] > 1' | env LC_COLLATE=C sort -k1,1 -k2,2n -k3,3nr | env LC_COLLATE=C sort -k1,1 -k2,2n -u | env LC_COLLATE=C sort -k1,1 -k3,3n -u | awk -v OFS='\t' '{{if($4==prev4){{new2=prev3+1;}} {{prev4=$4; prev3=$3; print $1, new2, $2-1, \"Intron\", $5, $6}}}}' | awk -F'\t' '$2' | awk '$2<$3' | env LC_COLLATE=C sort -k1,1 -k2,2n -u > {asset_outfolder}/{genome}_introns.bed",
-            "gzip -dcf {ensembl_gtf} | awk '$3==\"three_prime_utr\"' | grep -v 'pseudogene' | awk -v OFS='\t' '{{print \"chr\"$1, $4-1, $5, \"3\'\\\'\' UTR\", $6, $7}}' | awk '$2<$3' | env LC_COLLATE=C sort -k1,1 -k2,2n -u > {asset_outfolder}/{genome}_3utr.bed",
-            "gzip -dcf {ensembl_gtf} | awk '$3==\"five_prime_utr\"' | grep -v 'pseudogene' | awk -v OFS='\t' '{{print \"chr\"$1, $4-1, $5, \"5\'\\\'\' UTR\", $6, $7}}' | awk '$2<$3' | env LC_COLLATE=C sort -k1,1 -k2,2n -u > {asset_outfolder}/{genome}_5utr.bed",
-            "gzip -dcf {ensembl_rb} | awk '$3==\"promoter\"' | awk -v OFS='\t' '{{print \"chr\"$1, $4, $5, \"Promoter\", $6, $7}}' | awk '$2<$3' | env LC_COLLATE=C sort -k1,1 -k2,2n -k3,3n -u > {asset_outfolder}/{genome}_promoter.bed",
-            "gzip -dcf {ensembl_rb} | awk '$3==\"promoter_flanking_region\"' | awk -v OFS='\t' '{{print \"chr\"$1, $4, $5, \"Promoter Flanking Region\", $6, $7}}' | awk '$2<$3' | env LC_COLLATE=C sort -k1,1 -k2,2n -k3,3n -u > {asset_outfolder}/{genome}_promoter_flanking.bed",
-            "gzip -dcf {ensembl_rb} | awk '$3==\"enhancer\"' | awk -v OFS='\t' '{{print \"chr\"$1, $4, $5, \"Enhancer\", $6, $7}}' | awk '$2<$3' | env LC_COLLATE=C sort -k1,1 -k2,2n -k3,3n -u > {asset_outfolder}/{genome}_enhancer.bed",
-            "cat {asset_outfolder}/{genome}_enhancer.bed {asset_outfolder}/{genome}_promoter.bed {asset_outfolder}/{genome}_promoter_flanking.bed {asset_outfolder}/{genome}_5utr.bed {asset_outfolder}/{genome}_3utr.bed {asset_outfolder}/{genome}_exons.bed {asset_outfolder}/{genome}_introns.bed | awk -F'\t' '!seen[$1, $2, $3]++' > {asset_outfolder}/{genome}_annotations.bed",
-            "rm -f {asset_outfolder}/{genome}_enhancer.bed {asset_outfolder}/{genome}_promoter.bed {asset_outfolder}/{genome}_promoter_flanking.bed {asset_outfolder}/{genome}_5utr.bed {asset_outfolder}/{genome}_3utr.bed {asset_outfolder}/{genome}_exons.bed {asset_outfolder}/{genome}_introns.bed",
-            "gzip -f {asset_outfolder}/{genome}_annotations.bed"
+            {
+                STAGE: "feat_annotation",
+                STAGE_ARGS: {
+                    "gtf": "{ensembl_gtf}",
+                    "gff": "{ensembl_rb}",
+                    "output": "{asset_outfolder}/{genome}_annotations.bed.gz",
+                    "processes": "{threads}"
+                }
+            }
             ]
     },
     "cellranger_reference": {
@@ -608,11 +715,14 @@ asset_build_packages = {
             }
         ],
         CONT: "databio/refgenie",
+        RESOURCES: {"cores": "8", "mem": "64000", "time": "12:00:00"},
         CMD_LST: [
             "gunzip {gtf} -c > {asset_outfolder}/{genome}.gtf",
             "cellranger mkgtf {asset_outfolder}/{genome}.gtf {asset_outfolder}/{genome}_filtered.gtf",
             "rm {asset_outfolder}/{genome}.gtf",
-            "cd {asset_outfolder}; cellranger mkref --genome=ref --fasta={fasta} --genes={asset_outfolder}/{genome}_filtered.gtf --nthreads={threads}"
+            PLAIN_FASTA_CMD,
+            "cd {asset_outfolder}; cellranger mkref --genome=ref --fasta={asset_outfolder}/{genome}.fa --genes={asset_outfolder}/{genome}_filtered.gtf --nthreads={threads}",
+            "rm {asset_outfolder}/{genome}.fa"
         ]
     },
     "blacklist": {
@@ -0,0 +1,163 @@
+"""
+Asset existence and completeness checks.
+
+All the paths registered for the local assets -- the asset directories and
+the seek key paths -- are checked on a pool of threads, since on networked
+file systems the latency of a single stat call, not the throughput, limits
+a serial check.
+
+The results are cached in a file next to the genome configuration file and
+reused as long as the modification times of the directories holding the
+checked paths are unchanged: creating, removing or renaming a file changes
+the modification time of its directory.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from refgenconf.const import *
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["verify_assets", "verify_cache_path", "STATUS_OK", "STATUS_MISSING", "STATUS_INCOMPLETE"]
+
+STATUS_OK = "ok"
+STATUS_MISSING = "missing"
+STATUS_INCOMPLETE = "incomplete"
+CACHE_VERSION = 1
+# results for directories modified this recently (in seconds) are not cached,
+# since the modification time resolution of some file systems is coarse
+MTIME_SLACK = 2
+
+
+def verify_cache_path(gencfg):
+    """
+    Get the path to the verification cache of a genome configuration file
+
+    :param str gencfg: path to the genome configuration file
+    :return str: path to the cache file
+    """
+    folder, name = os.path.split(os.path.abspath(gencfg))
+    return os.path.join(folder, TEMPLATE_VERIFY_CACHE.format(name))
+
+
+def _tag_paths(rgc, genome, asset, tag):
+    """
+    Get the paths registered for an asset tag, resolved like RefGenConf.seek does
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param str genome: genome name
+    :param str asset: asset name
+    :param str tag: tag name
+    :return list[str]: the enclosing directory followed by the seek key paths
+    """
+    tag_data = rgc[CFG_GENOMES_KEY][genome][CFG_ASSETS_KEY][asset][CFG_ASSET_TAGS_KEY][tag]
+    enclosing = os.path.join(rgc[CFG_FOLDER_KEY], genome, tag_data[CFG_ASSET_PATH_KEY], tag)
+    paths = [enclosing]
+    for seek_key_value in tag_data[CFG_SEEK_KEYS_KEY].values():
+        path = enclosing if seek_key_value == "." else os.path.join(enclosing, seek_key_value)
+        if path not in paths:
+            paths.append(path)
+    return paths
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _read_cache(path):
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    return cache.get("tags", {}) if cache.get("version") == CACHE_VERSION else {}
+
+
+def _write_cache(path, tags):
+    """ Write the cache file atomically; failures are not fatal """
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": CACHE_VERSION, "tags": tags}, f)
+        os.rename(tmp, path)
+    except Exception as e:
+        _LOGGER.debug("Could not save asset verification cache ({}): {}".format(e.__class__.__name__, path))
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def verify_assets(rgc, genomes=None, threads=16, cache_file=None):
+    """
+    Check whether the registered paths of the local assets exist and whether
+    the assets are complete, i.e. have the path, seek keys and digest defined
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[str] genomes: genomes to check the assets of, all by default
+    :param int threads: number of threads to check the paths on
+    :param str cache_file: path to the cache file, no caching if not provided
+    :return list[(str, str, list[str])]: registry paths of the asset tags,
+        their statuses and the missing paths or attributes
+    """
+    tags = OrderedDict()
+    for genome in sorted(rgc[CFG_GENOMES_KEY].keys()):
+        if genomes and genome not in genomes:
+            continue
+        for asset, asset_data in rgc[CFG_GENOMES_KEY][genome].get(CFG_ASSETS_KEY, {}).items():
+            for tag, tag_data in asset_data.get(CFG_ASSET_TAGS_KEY, {}).items():
+                tags["{}/{}:{}".format(genome, asset, tag)] = (genome, asset, tag, tag_data)
+    results = OrderedDict()
+    paths = {}
+    for rp, (genome, asset, tag, tag_data) in tags.items():
+        missing_attrs = [k for k in REQ_TAG_ATTRS + [CFG_ASSET_CHECKSUM_KEY] if k not in tag_data]
+        if CFG_ASSET_PATH_KEY in missing_attrs or CFG_SEEK_KEYS_KEY in missing_attrs:
+            results[rp] = (STATUS_INCOMPLETE, missing_attrs)
+            continue
+        paths[rp] = _tag_paths(rgc, genome, asset, tag)
+    pool = ThreadPool(max(1, threads))
+    try:
+        # stat the directories first, to see which cached results are up to date
+        cached = _read_cache(cache_file) if cache_file else {}
+        dirs = sorted(set([os.path.dirname(p.rstrip(os.sep)) for ps in paths.values() for p in ps]))
+        mtimes = dict(zip(dirs, pool.map(_mtime, dirs)))
+        signatures = {}
+        for rp, ps in paths.items():
+            signatures[rp] = [[d, mtimes[d]] for d in sorted(set([os.path.dirname(p.rstrip(os.sep)) for p in ps]))]
+        fresh = dict([(rp, cached[rp]["missing"]) for rp in paths
+                      if rp in cached and cached[rp]["paths"] == paths[rp]
+                      and cached[rp]["dirs"] == signatures[rp] and None not in [m for _, m in signatures[rp]]])
+        _LOGGER.debug("Using cached verification results for {} of {} asset tags".format(len(fresh), len(paths)))
+        to_check = sorted(set([p for rp, ps in paths.items() if rp not in fresh for p in ps]))
+        exists = dict(zip(to_check, pool.map(os.path.exists, to_check)))
+    finally:
+        pool.close()
+        pool.join()
+    new_cache = {}
+    recent = time.time() - MTIME_SLACK
+    for rp, ps in paths.items():
+        missing = fresh[rp] if rp in fresh else [p for p in ps if not exists[p]]
+        if all([m is not None and m < recent for _, m in signatures[rp]]):
+            new_cache[rp] = {"paths": ps, "dirs": signatures[rp], "missing": missing}
+        missing_attrs = [k for k in [CFG_ASSET_CHECKSUM_KEY] if k not in tags[rp][3]]
+        if missing:
+            results[rp] = (STATUS_MISSING, missing)
+        elif missing_attrs:
+            results[rp] = (STATUS_INCOMPLETE, missing_attrs)
+        else:
+            results[rp] = (STATUS_OK, [])
+    if cache_file:
+        # keep the results of the genomes that were not checked
+        new_cache.update(dict([(rp, v) for rp, v in _read_cache(cache_file).items() if rp not in tags]))
+        _write_cache(cache_file, new_cache)
+    return [(rp, ) + results[rp] for rp in tags]
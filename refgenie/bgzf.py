@@ -0,0 +1,221 @@
+"""
+BGZF-compressed files: random access to FASTA files and parallel compression.
+
+BGZF (the bgzip format) is a series of independently compressed gzip blocks,
+so the compressed file can be read from any block and the blocks can be
+compressed in parallel. The samtools index files are used to locate the
+sequences: the .fai file holds the offsets of the sequences in the
+uncompressed data and the .gzi file maps the uncompressed offsets of the
+blocks to their compressed offsets.
+"""
+
+import logging
+import os
+import struct
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["BgzfFasta", "BgzfWriter", "is_bgzf_fasta"]
+
+BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+GZI_EXT = ".gzi"
+FAI_EXT = ".fai"
+# the uncompressed block size used by bgzip, which leaves room for the
+# compression overhead in the 64 KiB block limit
+BLOCK_SIZE = 0xff00
+# empty block that marks the end of a BGZF file
+EOF_BLOCK = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00\x1b\x00\x03\x00" \
+            b"\x00\x00\x00\x00\x00\x00\x00\x00"
+
+
+def is_bgzf_fasta(path):
+    """
+    Check whether a FASTA file is BGZF-compressed and indexed with samtools faidx
+
+    :param str path: path to the FASTA file
+    :return bool: whether the file is BGZF-compressed and has both .fai and .gzi indexes
+    """
+    if not (os.path.isfile(path + GZI_EXT) and os.path.isfile(path + FAI_EXT)):
+        return False
+    with open(path, "rb") as f:
+        return f.read(4) == BGZF_MAGIC
+
+
+def _read_block(f):
+    """
+    Read and decompress the BGZF block at the current file position
+
+    :param file f: the compressed file
+    :return bytes: the decompressed block, empty at the end of the file
+    """
+    header = f.read(12)
+    if not header:
+        return b""
+    if len(header) < 12 or header[:4] != BGZF_MAGIC:
+        raise IOError("Invalid BGZF block at offset {}".format(f.tell() - len(header)))
+    xlen = struct.unpack("<H", header[10:12])[0]
+    extra = f.read(xlen)
+    bsize = None
+    pos = 0
+    while pos + 4 <= len(extra):
+        si1, si2, slen = struct.unpack("<BBH", extra[pos:pos + 4])
+        if (si1, si2, slen) == (66, 67, 2):
+            bsize = struct.unpack("<H", extra[pos + 4:pos + 6])[0]
+        pos += 4 + slen
+    if bsize is None:
+        raise IOError("Missing BGZF block size at offset {}".format(f.tell() - xlen - 12))
+    data = f.read(bsize - xlen - 19)  # the block size excludes 1 byte; the header is 12 + xlen bytes
+    f.read(8)  # CRC32 and ISIZE
+    return zlib.decompress(data, -15)
+
+
+class BgzfFasta(object):
+    """ A BGZF-compressed FASTA file, indexed with samtools faidx """
+
+    def __init__(self, path):
+        """
+        Read the indexes of the FASTA file
+
+        :param str path: path to the BGZF-compressed FASTA file
+        """
+        self.path = path
+        self.index = OrderedDict()
+        with open(path + FAI_EXT) as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 5:
+                    continue
+                self.index[fields[0]] = tuple(int(x) for x in fields[1:5])
+        with open(path + GZI_EXT, "rb") as f:
+            count = struct.unpack("<Q", f.read(8))[0]
+            pairs = struct.unpack("<{}Q".format(2 * count), f.read(16 * count))
+        # the first block, which starts at 0 in both files, is implicit
+        self.compressed = [0] + list(pairs[0::2])
+        self.uncompressed = [0] + list(pairs[1::2])
+
+    def keys(self):
+        return list(self.index.keys())
+
+    def _read(self, start, length):
+        """
+        Read the uncompressed data
+
+        :param int start: offset in the uncompressed data
+        :param int length: number of bytes to read
+        :return bytes: the data
+        """
+        i = bisect_right(self.uncompressed, start) - 1
+        skip = start - self.uncompressed[i]
+        chunks = []
+        needed = skip + length
+        with open(self.path, "rb") as f:
+            f.seek(self.compressed[i])
+            while needed > 0:
+                block = _read_block(f)
+                if not block and f.tell() >= os.fstat(f.fileno()).st_size:
+                    break
+                chunks.append(block)
+                needed -= len(block)
+        return b"".join(chunks)[skip:skip + length]
+
+    def fetch(self, name, start=None, end=None):
+        """
+        Get a sequence or its part
+
+        :param str name: sequence name
+        :param int start: 0-based start of the range, the beginning of the sequence by default
+        :param int end: 0-based, exclusive end of the range, the end of the sequence by default
+        :return str: the sequence
+        """
+        if name not in self.index:
+            raise KeyError("{} not in {}.".format(name, self.path))
+        seq_len, offset, line_bases, line_width = self.index[name]
+        start, end, _ = slice(start, end).indices(seq_len)
+        if end <= start:
+            return ""
+
+        def _pos(p):
+            return offset + (p // line_bases) * line_width + p % line_bases
+        first, last = _pos(start), _pos(end - 1) + 1
+        data = self._read(first, last - first).decode("ascii")
+        return data.replace("\n", "").replace("\r", "")
+
+
+def _compress_block(data, level=zlib.Z_DEFAULT_COMPRESSION):
+    """
+    Compress data into a BGZF block; zlib releases the GIL, so the blocks are compressed in parallel
+
+    :param bytes data: at most BLOCK_SIZE bytes of data
+    :param int level: compression level
+    :return bytes: the block
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00" + \
+        struct.pack("<H", len(cdata) + 25)
+    return header + cdata + struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data))
+
+
+class BgzfWriter(object):
+    """ Writes BGZF-compressed files, compressing the blocks on multiple threads """
+
+    def __init__(self, path, threads=1, level=zlib.Z_DEFAULT_COMPRESSION, batch_blocks=16):
+        """
+        Open the file for writing
+
+        :param str path: path to the file to write
+        :param int threads: number of compression threads
+        :param int level: compression level
+        :param int batch_blocks: number of blocks per thread compressed at once
+        """
+        self.path = path
+        self.level = level
+        self.file = open(path, "wb")
+        self.pool = ThreadPool(threads) if threads > 1 else None
+        self.batch_size = max(1, threads) * batch_blocks * BLOCK_SIZE
+        self.buffer = []
+        self.buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data):
+        """
+        Write the data
+
+        :param bytes data: the data to write
+        """
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.batch_size:
+            self._flush(final=False)
+
+    def _flush(self, final):
+        data = b"".join(self.buffer)
+        end = len(data) if final else len(data) - len(data) % BLOCK_SIZE
+        blocks = [data[i:i + BLOCK_SIZE] for i in range(0, end, BLOCK_SIZE)]
+        self.buffer = [data[end:]]
+        self.buffered = len(data) - end
+        compress = lambda b: _compress_block(b, self.level)
+        for block in (self.pool.map(compress, blocks) if self.pool else map(compress, blocks)):
+            self.file.write(block)
+
+    def close(self):
+        """ Compress the buffered data, write the end of file marker and close the file """
+        if self.file.closed:
+            return
+        try:
+            self._flush(final=True)
+            self.file.write(EOF_BLOCK)
+        finally:
+            self.file.close()
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
@@ -1,32 +1,80 @@
+#!/usr/bin/env python
 """
-A helper script to create SLURM submission scripts for all the assets
-defined in asset_build_packages for a given genome
+Builds the assets of a genome on a cluster: creates the submission scripts
+for the selected assets with divvy templates and submits them with scheduler
+dependencies derived from the recipe requirements, so that every asset is
+built as soon as its parent assets are. A final job, which depends on all the
+others, verifies the assets registered in the genome configuration file.
 """
-from .asset_build_packages import asset_build_packages
+from .asset_build_packages import *
+from .exceptions import MissingGenomeConfigError
+from .refgenie import parse_registry_path, _parse_user_build_input, _load_rgc
+
 from ubiquerg import expandpath
-import os
+from subprocess import PIPE, Popen
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
 import argparse
+import logging
+import os
+import re
+import shlex
+import sys
+from collections import OrderedDict
+
 import divvy
+import refgenconf
 
-parser = argparse.ArgumentParser(description='Builds submission scripts for all assets for a genome')
-parser.add_argument('-g', '--genome', dest="genome", type=str, 
-    help='genome to build the submission scripts for')
-parser.add_argument('-p', '--path', dest="path", type=str, 
-    help='path to the desired submission directory location')
-parser.add_argument('-pt', '--partition', dest="PARTITION", type=str, 
-    help='partition in SLURM submission script', default="standard")
-parser.add_argument('-m', '--mem', dest="MEM", type=str, 
-    help='mem in SLURM submission script', default="200000")
-parser.add_argument('-t', '--time', dest="TIME", type=str, 
-    help='time in SLURM submission script', default="10:00:00")
-parser.add_argument('-c', '--cores', dest="CORES", type=str, 
-    help='cpus-per-task in SLURM submission script', default="4")
-parser.add_argument('-o', '--output', dest="LOGFILE", type=str, 
-    help='output in SLURM submission script', default=None)
-parser.add_argument('-j', '--job-name', dest="JOBNAME", type=str, 
-    help='job-name in SLURM submission script', default=None)
-
-args = parser.parse_args()
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_RESOURCES = {"cores": "4", "mem": "16000", "time": "10:00:00"}
+FINAL_JOB = "verify"
+# recipes that build the same asset as another recipe, built only on request, keyed to the asset they build
+ALTERNATIVE_RECIPES = dict([(r, "fasta") for r in FASTA_RECIPES if r != "fasta"])
+
+
+def build_argparser():
+    """
+    Build a parser for this tool
+
+    :return argparse.ArgumentParser: constructed parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Builds the assets of a genome on a cluster, submitting the jobs with scheduler dependencies "
+                    "derived from the recipe requirements")
+    parser.add_argument('-g', '--genome', dest="genome", type=str, required=True,
+                        help='genome to build the assets for')
+    parser.add_argument('-a', '--assets', dest="assets", type=str, nargs="+", default=None,
+                        help='assets to build, with their missing parents. Default: all the assets '
+                             'that the provided files are sufficient for')
+    parser.add_argument('-c', '--genome-config', dest="genome_config", type=str, required=False,
+                        help="path to local genome configuration file. Optional if '{}' environment variable is set.".
+                        format(", ".join(refgenconf.CFG_ENV_VARS)))
+    parser.add_argument('--files', nargs="+", action='append', default=None,
+                        help='paths to the required files (e.g. fasta=/path/to/file.fa.gz)')
+    parser.add_argument('--params', nargs="+", action='append', default=None,
+                        help='required parameter values (e.g. context=CG)')
+    parser.add_argument('-p', '--path', dest="path", type=str, default=".",
+                        help='path to the desired submission directory location')
+    parser.add_argument('--compute', dest="compute", type=str, default="slurm",
+                        help='divvy compute package to use. Default: slurm')
+    parser.add_argument('--divcfg', dest="divcfg", type=str, default=None,
+                        help='path to the divvy configuration file. Default: $DIVCFG or the divvy default')
+    parser.add_argument('-pt', '--partition', dest="PARTITION", type=str, default="standard",
+                        help='partition in the submission script. Default: standard')
+    parser.add_argument('-m', '--mem', dest="MEM", type=str, default=None,
+                        help='memory in the submission scripts, overrides the recipe resources')
+    parser.add_argument('-t', '--time', dest="TIME", type=str, default=None,
+                        help='time in the submission scripts, overrides the recipe resources')
+    parser.add_argument('--cores', dest="CORES", type=str, default=None,
+                        help='cpus-per-task in the submission scripts, overrides the recipe resources')
+    parser.add_argument('-n', '--dry-run', action="store_true",
+                        help='write the submission scripts and print the submission commands without running them')
+    return parser
 
 
 def _make_sub_dir(path, genome):
@@ -43,38 +91,259 @@ def _make_sub_dir(path, genome):
     return path
 
 
-def _req_input_to_args(req_input):
+def _parents(recipe):
+    """
+    Get the names of the default parent assets of a recipe
+
+    :param str recipe: recipe name
+    :return list[str]: names of the parent assets
+    """
+    return [parse_registry_path(req[DEFAULT])["asset"] for req in asset_build_packages[recipe][REQ_ASSETS]]
+
+
+def plan_jobs(genome, assets=None, files=None, params=None, existing=None, resources=None):
     """
-    Given a list of the required inputs for the build command, create an args
-    string
+    Determine the build jobs and their order
+
+    The parents of the selected assets that are not in the genome
+    configuration are built as well. If no assets are selected, all the
+    assets that the provided files are sufficient for are built.
 
-    :param list[str] req_input: input names
-    :return str: args string
+    :param str genome: genome name
+    :param list[str] assets: assets to build, all by default
+    :param Mapping[str, str] files: paths to the required files, keyed by the input names
+    :param Mapping[str, str] params: required parameter values, keyed by the parameter names
+    :param Iterable[str] existing: assets of the genome in the genome configuration
+    :param Mapping[str, str] resources: resources that override the recipe ones
+    :return Mapping[str, Mapping]: the jobs keyed by the recipe names, with
+        their parents, inputs and resources, each job after its parents. The
+        job of an alternative recipe, e.g. fasta_bgzip, is the parent of the
+        jobs that require the asset it builds
+    :raise ValueError: if a selected asset cannot be built
     """
-    return ["--" + x + " <arg_here>" for x in req_input]
-
-
-subdir_path = _make_sub_dir(args.path, args.genome)
-dcc = divvy.ComputingConfiguration()
-dcc.activate_package("slurm")
-cmd_template = "refgenie build -g {g} -a {a} {req_input_str}"
-genome = args.genome
-to_remove = ["genome", "path"]
-
-data = vars(args)
-for i in to_remove:
-    data.pop(i)
-
-for asset in asset_build_packages:
-    sub_script = os.path.join(subdir_path, asset + ".sub")
-    req_input = asset_build_packages[asset]["required_inputs"]
-    if req_input:
-        print("{} asset requires additional input in the command ({}), so '{}'"
-            " requires manual edit".format(asset, req_input, sub_script))
-        req_str = " ".join(_req_input_to_args(req_input))
+    files, params, existing = files or {}, params or {}, set(existing or [])
+    jobs = OrderedDict()
+    visiting = []
+    skipped = []
+
+    def _job(asset):
+        if asset in jobs:
+            return asset
+        for recipe in jobs:
+            if ALTERNATIVE_RECIPES.get(recipe) == asset:
+                return recipe
+        return None
+
+    def _include(asset, explicit):
+        if _job(asset):
+            return True
+        if asset in skipped and not explicit:
+            return False
+        if asset in existing and not explicit:
+            return True
+        if asset in visiting:
+            raise ValueError("Circular recipe requirements: {}".format(" -> ".join(visiting + [asset])))
+        if asset not in asset_build_packages:
+            raise ValueError("Recipe not found: '{}'".format(asset))
+        recipe = asset_build_packages[asset]
+        missing = [f[KEY] for f in recipe[REQ_FILES] if f[KEY] not in files] + \
+            [p[KEY] for p in recipe[REQ_PARAMS] if p[KEY] not in params and p.get(DEFAULT) is None]
+        if missing:
+            if explicit:
+                raise ValueError("Inputs required to build '{}' are not provided: {}".format(asset, ", ".join(missing)))
+            _LOGGER.info("Skipping '{}', inputs not provided: {}".format(asset, ", ".join(missing)))
+            skipped.append(asset)
+            return False
+        visiting.append(asset)
+        for parent in _parents(asset):
+            if not _include(parent, False):
+                if explicit:
+                    raise ValueError("Parent asset '{}' of '{}' can be neither found nor built".format(parent, asset))
+                _LOGGER.info("Skipping '{}', parent asset '{}' cannot be built".format(asset, parent))
+                visiting.pop()
+                skipped.append(asset)
+                return False
+        visiting.pop()
+        job_resources = dict(DEFAULT_RESOURCES)
+        job_resources.update(recipe.get(RESOURCES, {}))
+        job_resources.update(dict([(k, v) for k, v in (resources or {}).items() if v is not None]))
+        job_params = dict([(p[KEY], params[p[KEY]]) for p in recipe[REQ_PARAMS] if p[KEY] in params])
+        if "threads" in [p[KEY] for p in recipe[REQ_PARAMS]] and "threads" not in job_params:
+            job_params["threads"] = job_resources["cores"]
+        jobs[asset] = {
+            "parents": [_job(p) for p in _parents(asset) if _job(p)],
+            "files": dict([(f[KEY], files[f[KEY]]) for f in recipe[REQ_FILES]]),
+            "params": job_params,
+            "resources": job_resources
+        }
+        return True
+
+    if assets:
+        # the alternative recipes first, so that they build the parents of the other assets
+        for asset in sorted(assets, key=lambda a: a not in ALTERNATIVE_RECIPES):
+            _include(asset, True)
     else:
-        req_str = ""
-    data["CODE"] = cmd_template.format(g=genome, a=asset, req_input_str=req_str)
-    data["LOGFILE"] = asset + ".log"
-    data["JOBNAME"] = asset + "Build"
-    dcc.write_script(sub_script, data)
+        for asset in sorted(asset_build_packages.keys()):
+            if asset not in ALTERNATIVE_RECIPES:
+                _include(asset, False)
+    return jobs
+
+
+def build_command(genome, asset, job, genome_config):
+    """
+    Create the refgenie build command of a job
+
+    The build registers the asset in the spool, so that the concurrent jobs
+    do not contend for the genome configuration file lock.
+
+    :param str genome: genome name
+    :param str asset: recipe name, the job is keyed by
+    :param Mapping job: the job, as planned by plan_jobs
+    :param str genome_config: path to the genome configuration file
+    :return str: the command
+    """
+    cmd = ["refgenie", "build", "{}/{}".format(genome, ALTERNATIVE_RECIPES.get(asset, asset)), "-c", genome_config,
+           "--spool"]
+    if asset in ALTERNATIVE_RECIPES:
+        cmd += ["--recipe", asset]
+    for opt, values in [("--files", job["files"]), ("--params", job["params"])]:
+        if values:
+            cmd += [opt] + ["{}={}".format(k, v) for k, v in sorted(values.items())]
+    return " ".join([quote(x) for x in cmd])
+
+
+def dependency_args(submission_command, job_ids, success=True):
+    """
+    Create the scheduler options that make a job wait for other jobs
+
+    :param str submission_command: the command that submits the jobs, e.g. sbatch
+    :param list[str] job_ids: IDs of the jobs to wait for
+    :param bool success: whether the jobs must succeed for the job to run,
+        otherwise it runs once they end
+    :return list[str]: the options; none for the schedulers that run the jobs
+        right away, like sh, or whose dependency options are not known
+    """
+    if not job_ids:
+        return []
+    scheduler = os.path.basename(shlex.split(submission_command)[0])
+    if scheduler == "sbatch":
+        return ["--dependency={}:{}".format("afterok" if success else "afterany", ":".join(job_ids))] + \
+            (["--kill-on-invalid-dep=yes"] if success else [])
+    if scheduler == "qsub":
+        return ["-W", "depend={}:{}".format("afterok" if success else "afterany", ":".join(job_ids))]
+    if scheduler == "bsub":
+        return ["-w", " && ".join(["{}({})".format("done" if success else "ended", i) for i in job_ids])]
+    return []
+
+
+def submit_jobs(dcc, jobs, genome, genome_config, subdir, extra_vars=None, dry_run=False):
+    """
+    Write the submission scripts of the jobs and submit them with dependencies
+
+    With a scheduler that runs the jobs right away, like the local 'sh', the
+    jobs run one after another and the jobs whose parents failed are skipped.
+    The exit status of such a submission is not the one of the job, e.g. the
+    divvy local template pipes the job output through tee, so a job succeeds
+    only if it creates its marker file, which its command does last.
+
+    :param divvy.ComputingConfiguration dcc: computing configuration with the compute package activated
+    :param Mapping[str, Mapping] jobs: the jobs, as planned by plan_jobs
+    :param str genome: genome name
+    :param str genome_config: path to the genome configuration file
+    :param str subdir: path to the submission scripts directory
+    :param Mapping extra_vars: additional variables to populate the templates with
+    :param bool dry_run: whether to only print the submission commands
+    :return Mapping[str, str]: job IDs keyed by the asset names; None for the
+        jobs not submitted, the ones that failed to submit or, with a
+        scheduler that runs the jobs right away, failed
+    """
+    submission_command = dcc.compute.submission_command
+    synchronous = not dependency_args(submission_command, ["0"])
+    if synchronous:
+        _LOGGER.info("'{}' does not support job dependencies; the jobs are run one by one".
+                     format(submission_command))
+    # the final job runs once all the others end, also if some of them fail;
+    # it merges the spooled asset registrations and checks the assets
+    final = OrderedDict([(FINAL_JOB, {"parents": list(jobs.keys()), "resources": dict(DEFAULT_RESOURCES),
+                                      "code": "refgenie merge -c {0} && refgenie list -c {0} -g {1} --verify".
+                                      format(quote(genome_config), quote(genome))})])
+    job_ids = OrderedDict()
+    for asset, job in list(jobs.items()) + list(final.items()):
+        parent_ids = [job_ids[p] for p in job["parents"]]
+        if synchronous and None in parent_ids and asset != FINAL_JOB:
+            _LOGGER.warning("Skipping '{}', a parent job failed".format(asset))
+            job_ids[asset] = None
+            continue
+        script = os.path.join(subdir, asset + ".sub")
+        code = job.get("code") or build_command(genome, asset, job, genome_config)
+        marker = os.path.join(subdir, asset + ".ok")
+        if synchronous:
+            if os.path.exists(marker):
+                os.remove(marker)
+            code = "{} && touch {}".format(code, quote(marker))
+        variables = dict(extra_vars or {})
+        variables.update({
+            "CODE": code,
+            "JOBNAME": "{}_{}".format(genome, asset),
+            "LOGFILE": os.path.join(subdir, asset + ".log"),
+            "CORES": job["resources"]["cores"],
+            "MEM": job["resources"]["mem"],
+            "TIME": job["resources"]["time"]
+        })
+        dcc.write_script(script, variables)
+        cmd = shlex.split(submission_command) + \
+            dependency_args(submission_command, [i for i in parent_ids if i], asset != FINAL_JOB) + [script]
+        if dry_run:
+            print(" ".join([quote(x) for x in cmd]))
+            job_ids[asset] = "<{}>".format(asset)
+            continue
+        _LOGGER.info("Submitting '{}': {}".format(asset, " ".join(cmd)))
+        proc = Popen(cmd, stdout=PIPE, universal_newlines=True)
+        out = proc.communicate()[0]
+        if proc.returncode != 0:
+            _LOGGER.error("Job '{}' {} (exit code {})".format(
+                asset, "failed" if synchronous else "submission failed", proc.returncode))
+            job_ids[asset] = None
+            continue
+        if synchronous and not os.path.exists(marker):
+            _LOGGER.error("Job '{}' failed, see the log file: {}".format(asset, variables["LOGFILE"]))
+            job_ids[asset] = None
+            continue
+        match = re.search(r"\d+", out or "")
+        job_ids[asset] = asset if synchronous else (match.group(0) if match else None)
+        if not synchronous and job_ids[asset] is None:
+            _LOGGER.error("Could not determine the ID of the '{}' job: {}".format(asset, out))
+    return job_ids
+
+
+def main():
+    """ main workflow """
+    parser = build_argparser()
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    cfg = refgenconf.select_genome_config(filename=args.genome_config, check_exist=True, strict_env=True)
+    if not cfg:
+        raise MissingGenomeConfigError(args.genome_config)
+    cfg = os.path.abspath(cfg)
+    rgc = _load_rgc(cfg)
+    existing = rgc.list_assets_by_genome(args.genome) if args.genome in rgc.genomes_list() else []
+    files = dict([(k, os.path.abspath(expandpath(v))) for k, v in _parse_user_build_input(args.files).items()])
+    jobs = plan_jobs(args.genome, args.assets, files, _parse_user_build_input(args.params), existing,
+                     {"cores": args.CORES, "mem": args.MEM, "time": args.TIME})
+    if not jobs:
+        _LOGGER.info("Nothing to build")
+        return
+    for asset, job in jobs.items():
+        _LOGGER.info("{}: after {}".format(asset, ", ".join(job["parents"]) or "-"))
+    dcc = divvy.ComputingConfiguration(filepath=args.divcfg)
+    if not dcc.activate_package(args.compute):
+        _LOGGER.error("Could not activate divvy compute package: {}".format(args.compute))
+        sys.exit(1)
+    job_ids = submit_jobs(dcc, jobs, args.genome, cfg, _make_sub_dir(args.path, args.genome),
+                          {"PARTITION": args.PARTITION}, args.dry_run)
+    if None in job_ids.values():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
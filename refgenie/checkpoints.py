@@ -0,0 +1,129 @@
+"""
+Command checkpoints for resuming failed builds.
+
+pypiper skips the recipe commands only once the build target flag exists, so
+a build that fails at a late command used to run all the commands again when
+it was rerun. Instead, every completed command is recorded in a checkpoint
+file in the build logs directory, with a fingerprint of the command and of the
+build inputs, and a rerun resumes at the first command that has not completed.
+
+The fingerprints are chained: the fingerprint of a command covers the
+populated command, the size and modification time of the input files and
+parent assets, and the fingerprints of all the preceding commands. A changed
+command or input invalidates its checkpoint and all the following ones.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from .const import *
+from .stages import format_command
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["checkpoints_path", "input_fingerprint", "command_fingerprints", "read_checkpoints", "write_checkpoints",
+           "resume_index", "clear_checkpoints"]
+
+CHECKPOINTS_VERSION = 1
+
+
+def checkpoints_path(log_outfolder, asset, tag):
+    """
+    Get the path to the checkpoint file of a build
+
+    :param str log_outfolder: path to the build logs directory
+    :param str asset: asset name
+    :param str tag: tag name
+    :return str: path to the checkpoint file
+    """
+    return os.path.join(log_outfolder, TEMPLATE_CHECKPOINTS_JSON.format(asset, tag))
+
+
+def input_fingerprint(paths):
+    """
+    Fingerprint the build inputs by their paths, sizes and modification times
+
+    :param Iterable[str] paths: paths to the input files and parent assets;
+        the ones that do not exist are ignored
+    :return str: the fingerprint
+    """
+    md5 = hashlib.md5()
+    for path in sorted(set([os.path.abspath(p) for p in paths])):
+        if not os.path.exists(path):
+            continue
+        st = os.stat(path)
+        md5.update("{}\t{}\t{}\n".format(path, st.st_size, int(st.st_mtime)).encode("utf-8"))
+    return md5.hexdigest()
+
+
+def command_fingerprints(commands, inputs):
+    """
+    Fingerprint the populated recipe commands, each one chained to the preceding ones
+
+    :param list commands: populated commands, stages and groups
+    :param str inputs: fingerprint of the build inputs
+    :return list[str]: the fingerprints of the commands
+    """
+    fingerprints = []
+    previous = inputs
+    for cmd in commands:
+        previous = hashlib.md5("{}\n{}".format(previous, format_command(cmd)).encode("utf-8")).hexdigest()
+        fingerprints.append(previous)
+    return fingerprints
+
+
+def read_checkpoints(path):
+    """
+    Read the checkpoint file of a build
+
+    :param str path: path to the checkpoint file
+    :return Mapping: the build output folder ('outfolder') and the
+        fingerprints of the completed commands ('commands'); empty if there
+        are no valid checkpoints
+    """
+    try:
+        with open(path) as f:
+            checkpoints = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    return checkpoints if checkpoints.get("version") == CHECKPOINTS_VERSION else {}
+
+
+def write_checkpoints(path, outfolder, fingerprints):
+    """
+    Save the checkpoint file of a build atomically
+
+    :param str path: path to the checkpoint file
+    :param str outfolder: path to the folder the commands write to
+    :param list[str] fingerprints: fingerprints of the completed commands
+    """
+    with open(path + ".tmp", "w") as f:
+        json.dump({"version": CHECKPOINTS_VERSION, "outfolder": outfolder, "commands": fingerprints}, f)
+    os.rename(path + ".tmp", path)
+
+
+def resume_index(checkpoints, fingerprints):
+    """
+    Determine the first command that has to be run
+
+    :param Mapping checkpoints: the checkpoints read from the checkpoint file
+    :param list[str] fingerprints: fingerprints of the commands to run
+    :return int: index of the first command without a valid checkpoint
+    """
+    completed = checkpoints.get("commands", [])
+    index = 0
+    while index < min(len(completed), len(fingerprints)) and completed[index] == fingerprints[index]:
+        index += 1
+    return index
+
+
+def clear_checkpoints(path):
+    """
+    Remove the checkpoint file of a build, if it exists
+
+    :param str path: path to the checkpoint file
+    """
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,453 @@
+"""
+Content-defined chunked asset storage.
+
+An asset tag is stored in a chunk store as a manifest -- the directory tree
+of the asset with the list of chunks that make up each file -- and the
+chunks, each saved once, compressed, under its SHA-256 digest:
+
+    <store>/manifests/<genome>/<asset>/<tag>.json
+    <store>/manifests/<genome>/<asset>/index.json
+    <store>/chunks/<first two digest characters>/<digest>
+
+The chunk boundaries are derived from the file contents, not from the offsets:
+a boundary is placed after a line break whose preceding bytes hash to a value
+with the lowest bits unset. An edit in a file changes only the chunks around
+it, so a new tag of an asset, e.g. an updated annotation, shares most of the
+chunks with the previous one. The store is a plain directory tree; served over
+HTTP by any static file server it is a source for 'refgenie pull --chunked',
+which fetches only the chunks that the local tags of the asset do not have.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import stat
+import tempfile
+import zlib
+from multiprocessing.pool import ThreadPool
+from shutil import rmtree
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+from refgenconf.const import *
+from ubiquerg import is_url
+
+from .config_db import _plain
+from .const import *
+from .exceptions import ChunkStoreError
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["iter_chunks", "export_asset", "check_manifest", "fetch_manifest", "restore_asset"]
+
+MANIFEST_VERSION = 1
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+# a line break is a chunk boundary with the probability of 1/512
+BOUNDARY_MASK = 0x1FF
+# number of bytes preceding a line break hashed to determine a boundary
+WINDOW_SIZE = 48
+READ_SIZE = 4 * 1024 * 1024
+CHUNKS_DIR = "chunks"
+MANIFESTS_DIR = "manifests"
+INDEX_NAME = "index.json"
+
+
+def _boundary(buf, start, end):
+    """
+    Find the end of the chunk that starts at the start offset
+
+    :param bytes buf: data
+    :param int start: offset of the chunk
+    :param int end: largest possible end offset of the chunk
+    :return int: end offset of the chunk
+    """
+    i = buf.find(b"\n", start + MIN_CHUNK_SIZE - 1, end)
+    while i != -1:
+        i += 1
+        if zlib.crc32(buf[i - WINDOW_SIZE:i]) & BOUNDARY_MASK == 0:
+            return i
+        i = buf.find(b"\n", i, end)
+    return end
+
+
+def iter_chunks(f):
+    """
+    Split the contents of a file into content-defined chunks
+
+    :param file f: file object opened in binary mode
+    :return Iterable[bytes]: the chunks
+    """
+    buf, pos, eof = b"", 0, False
+    while True:
+        if not eof and len(buf) - pos < MAX_CHUNK_SIZE:
+            block = f.read(READ_SIZE)
+            eof = not block
+            buf, pos = buf[pos:] + block, 0
+            continue
+        if pos == len(buf):
+            return
+        end = _boundary(buf, pos, min(pos + MAX_CHUNK_SIZE, len(buf)))
+        yield buf[pos:end]
+        pos = end
+
+
+def _chunk_relpath(digest):
+    return "/".join([CHUNKS_DIR, digest[:2], digest])
+
+
+def _manifest_relpath(genome, asset, tag=None):
+    return "/".join([MANIFESTS_DIR, genome, asset, "{}.json".format(tag) if tag else INDEX_NAME])
+
+
+def _makedirs(folder):
+    """ Create a directory with its parents, unless it exists """
+    if not os.path.isdir(folder):
+        try:
+            os.makedirs(folder)
+        except OSError:
+            # created concurrently
+            if not os.path.isdir(folder):
+                raise
+
+
+def _write_atomic(path, data):
+    """ Write the data to a file under a temporary name and rename it """
+    folder = os.path.dirname(path)
+    _makedirs(folder)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix="." + os.path.basename(path) + ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _list_tree(path):
+    """
+    List the contents of a directory tree, without following symbolic links
+
+    :param str path: path to the directory
+    :return (list[str], list[str], list[str]): the relative paths of the
+        directories, the regular files and the symbolic links
+    """
+    dirs, files, links = [], [], []
+    for root, dir_names, names in os.walk(path):
+        rel_root = os.path.relpath(root, path)
+        for name in dir_names + names:
+            rel = name if rel_root == os.curdir else "/".join(rel_root.split(os.sep) + [name])
+            mode = os.lstat(os.path.join(root, name)).st_mode
+            if stat.S_ISLNK(mode):
+                links.append(rel)
+            elif stat.S_ISDIR(mode):
+                dirs.append(rel)
+            elif stat.S_ISREG(mode):
+                files.append(rel)
+    return sorted(dirs), sorted(files), sorted(links)
+
+
+def _map(func, items, threads):
+    if threads <= 1 or len(items) <= 1:
+        return [func(x) for x in items]
+    pool = ThreadPool(min(threads, len(items)))
+    try:
+        return pool.map(func, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def export_asset(rgc, genome, asset, tag, store, threads=8):
+    """
+    Save an asset tag to a chunk store; the chunks already in the store are not saved again
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param str genome: genome name
+    :param str asset: asset name
+    :param str tag: tag name
+    :param str store: path to the chunk store directory
+    :param int threads: number of threads to chunk the files on
+    :return (int, int, int, int): numbers of the new and all the chunks, and their sizes in bytes
+    """
+    asset_data = rgc[CFG_GENOMES_KEY][genome][CFG_ASSETS_KEY][asset]
+    tag_data = asset_data[CFG_ASSET_TAGS_KEY][tag]
+    path = os.path.join(rgc[CFG_FOLDER_KEY], genome, tag_data[CFG_ASSET_PATH_KEY], tag)
+    dirs, files, links = _list_tree(path)
+
+    def _export(rel):
+        file_path = os.path.join(path, *rel.split("/"))
+        chunks, new, new_size = [], 0, 0
+        with open(file_path, "rb") as f:
+            for data in iter_chunks(f):
+                digest = hashlib.sha256(data).hexdigest()
+                chunks.append([digest, len(data)])
+                chunk_path = os.path.join(store, *_chunk_relpath(digest).split("/"))
+                if not os.path.exists(chunk_path):
+                    _write_atomic(chunk_path, zlib.compress(data))
+                    new, new_size = new + 1, new_size + len(data)
+        st = os.stat(file_path)
+        return {"path": rel, "mode": stat.S_IMODE(st.st_mode), "mtime": st.st_mtime, "chunks": chunks}, \
+            new, new_size
+
+    exported = _map(_export, files, threads)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "genome": genome,
+        "asset": asset,
+        "tag": tag,
+        "asset_description": asset_data.get(CFG_ASSET_DESC_KEY),
+        "attrs": dict([(k, _plain(tag_data[k])) for k in ATTRS_COPY_PULL + [CFG_ASSET_DIGEST_ALGORITHM_KEY]
+                                if k in tag_data]),
+        "dirs": dirs,
+        "files": [x[0] for x in exported],
+        "links": [{"path": rel, "target": os.readlink(os.path.join(path, *rel.split("/")))} for rel in links]
+    }
+    _write_atomic(os.path.join(store, *_manifest_relpath(genome, asset, tag).split("/")),
+                  json.dumps(manifest).encode("utf-8"))
+    index_path = os.path.join(store, *_manifest_relpath(genome, asset).split("/"))
+    index = _read_json(index_path) if os.path.exists(index_path) else {"tags": []}
+    index["tags"] = sorted(set(index["tags"] + [tag]))
+    index["default_tag"] = asset_data.get(CFG_ASSET_DEFAULT_TAG_KEY, index.get("default_tag", tag))
+    _write_atomic(index_path, json.dumps(index).encode("utf-8"))
+    all_chunks = [c for f in manifest["files"] for c in f["chunks"]]
+    return sum([x[1] for x in exported]), len(all_chunks), sum([x[2] for x in exported]), \
+        sum([c[1] for c in all_chunks])
+
+
+def _read(source, relpath):
+    """
+    Read a file from a chunk store
+
+    :param str source: URL or path to the chunk store
+    :param str relpath: path to the file in the store
+    :return bytes: the contents
+    """
+    if is_url(source):
+        response = urlopen(source.rstrip("/") + "/" + relpath)
+        try:
+            return response.read()
+        finally:
+            response.close()
+    with open(os.path.join(source, *relpath.split("/")), "rb") as f:
+        return f.read()
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _check_relpath(rel, what):
+    """
+    Make sure that a path from a manifest stays in the directory it is relative to
+
+    :param str rel: relative path, with forward slashes
+    :param str what: what the path is, for the error message
+    :raise refgenie.exceptions.ChunkStoreError: if the path is absolute or leads out of the directory
+    """
+    if not rel or rel.startswith("/") or os.path.isabs(rel) or \
+            any([part in ["", os.curdir, os.pardir] for part in rel.split("/")]):
+        raise ChunkStoreError("Invalid {} in the manifest: {}".format(what, rel))
+
+
+def check_manifest(manifest, genome, asset, tag=None):
+    """
+    Make sure that a manifest describes the requested asset tag and only writes in its tag directory
+
+    The identifiers and the paths in the manifest are used to build the paths
+    in the genome folder, so a manifest from an untrusted store could write
+    anywhere otherwise.
+
+    :param Mapping manifest: the manifest of the asset tag
+    :param str genome: requested genome name
+    :param str asset: requested asset name
+    :param str tag: requested tag name, any by default
+    :raise refgenie.exceptions.ChunkStoreError: if the manifest is for another
+        asset tag, or has a path or link target out of the tag directory
+    """
+    try:
+        requested = [genome, asset, tag or manifest["tag"]]
+        found = [manifest["genome"], manifest["asset"], manifest["tag"]]
+        if found != requested:
+            raise ChunkStoreError("The manifest of '{}/{}:{}' is for another asset: '{}/{}:{}'".
+                                  format(*(requested + found)))
+        for name, what in zip(found, ["genome name", "asset name", "tag name"]):
+            _check_relpath(name, what)
+            if "/" in name:
+                raise ChunkStoreError("Invalid {} in the manifest: {}".format(what, name))
+        _check_relpath(manifest["attrs"].get(CFG_ASSET_PATH_KEY, asset), "asset path")
+        links = set([link["path"] for link in manifest["links"]])
+        paths = [(rel, "directory") for rel in manifest["dirs"]] + \
+            [(file_data["path"], "file path") for file_data in manifest["files"]] + \
+            [(rel, "link path") for rel in links]
+        for rel, what in paths:
+            _check_relpath(rel, what)
+            # the links are resolved when a path through them is created
+            parts = rel.split("/")
+            if any(["/".join(parts[:i]) in links for i in range(1, len(parts))]):
+                raise ChunkStoreError("Path through a link in the manifest: {}".format(rel))
+        for link in manifest["links"]:
+            # a relative target is resolved from the directory of the link
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(link["path"]), link["target"]))
+            if posixpath.isabs(link["target"]) or target == os.pardir or target.startswith(os.pardir + "/"):
+                raise ChunkStoreError("Link target out of the tag directory in the manifest: {} -> {}".
+                                      format(link["path"], link["target"]))
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ChunkStoreError("Malformed manifest of '{}/{}:{}': {}".format(genome, asset, tag, e))
+
+
+def fetch_manifest(source, genome, asset, tag=None):
+    """
+    Get the manifest of an asset tag from a chunk store
+
+    :param str source: URL or path to the chunk store
+    :param str genome: genome name
+    :param str asset: asset name
+    :param str tag: tag name, the default tag of the asset in the store if not provided
+    :return Mapping: the manifest
+    :raise refgenie.exceptions.ChunkStoreError: if the manifest cannot be
+        read, or does not describe the requested asset tag
+    """
+    try:
+        if tag is None:
+            tag = json.loads(_read(source, _manifest_relpath(genome, asset)).decode("utf-8"))["default_tag"]
+            _check_relpath(tag, "default tag")
+        manifest = json.loads(_read(source, _manifest_relpath(genome, asset, tag)).decode("utf-8"))
+    except (IOError, OSError, ValueError, KeyError, AttributeError) as e:
+        raise ChunkStoreError("Could not read the manifest of '{}/{}:{}' from '{}': {}".
+                              format(genome, asset, tag, source, e))
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ChunkStoreError("Unsupported manifest version of '{}/{}:{}' in: {}".format(genome, asset, tag, source))
+    check_manifest(manifest, genome, asset, tag)
+    return manifest
+
+
+def _local_chunks(rgc, genome, asset, exclude, threads):
+    """
+    Chunk the files of the local tags of an asset
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param str genome: genome name
+    :param str asset: asset name
+    :param str exclude: path to the tag directory to skip
+    :param int threads: number of threads to chunk the files on
+    :return Mapping[str, (str, int, int)]: paths to the files holding the
+        chunks, their offsets and sizes, keyed by the chunk digests
+    """
+    try:
+        tags = rgc[CFG_GENOMES_KEY][genome][CFG_ASSETS_KEY][asset][CFG_ASSET_TAGS_KEY]
+    except KeyError:
+        return {}
+    paths = []
+    for tag, tag_data in tags.items():
+        if CFG_ASSET_PATH_KEY not in tag_data:
+            continue
+        path = os.path.join(rgc[CFG_FOLDER_KEY], genome, tag_data[CFG_ASSET_PATH_KEY], tag)
+        if os.path.isdir(path) and os.path.abspath(path) != os.path.abspath(exclude):
+            paths += [os.path.join(path, *rel.split("/")) for rel in _list_tree(path)[1]]
+
+    def _index(file_path):
+        found, offset = {}, 0
+        with open(file_path, "rb") as f:
+            for data in iter_chunks(f):
+                found[hashlib.sha256(data).hexdigest()] = (file_path, offset, len(data))
+                offset += len(data)
+        return found
+
+    chunks = {}
+    for found in _map(_index, paths, threads):
+        chunks.update(found)
+    return chunks
+
+
+def _check(digest, data, origin):
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ChunkStoreError("Corrupted chunk {} in: {}".format(digest, origin))
+    return data
+
+
+def restore_asset(rgc, manifest, source, threads=8):
+    """
+    Reconstruct an asset tag from a chunk store in the genome folder
+
+    The chunks found in the local tags of the asset are copied from them; only
+    the other ones are fetched from the store. The asset is reconstructed in a
+    temporary directory and moved to the tag directory, replacing it.
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param Mapping manifest: the manifest of the asset tag
+    :param str source: URL or path to the chunk store
+    :param int threads: number of threads to fetch the chunks and write the files on
+    :return (int, int): numbers of bytes fetched and copied from the local tags
+    :raise refgenie.exceptions.ChunkStoreError: if a chunk cannot be fetched
+        or is corrupted, or the manifest has a path out of the tag directory
+    """
+    genome, asset, tag = manifest["genome"], manifest["asset"], manifest["tag"]
+    check_manifest(manifest, genome, asset, tag)
+    genome_dir = os.path.join(rgc[CFG_FOLDER_KEY], genome)
+    tag_dir = os.path.join(genome_dir, manifest["attrs"].get(CFG_ASSET_PATH_KEY, asset), tag)
+    sizes = dict([(d, s) for f in manifest["files"] for d, s in f["chunks"]])
+    local = _local_chunks(rgc, genome, asset, tag_dir, threads)
+    missing = sorted([d for d in sizes if d not in local])
+    _LOGGER.info("Fetching {} of {} chunks ({:.2f} of {:.2f} MB)".format(
+        len(missing), len(sizes), sum([sizes[d] for d in missing]) / 1e6, sum(sizes.values()) / 1e6))
+    # the genome directory is missing when the asset is the first one of the genome
+    _makedirs(genome_dir)
+    tmpdir = tempfile.mkdtemp(dir=genome_dir)
+    try:
+        chunk_dir = os.path.join(tmpdir, CHUNKS_DIR)
+        os.mkdir(chunk_dir)
+
+        def _fetch(digest):
+            relpath = _chunk_relpath(digest)
+            try:
+                data = zlib.decompress(_read(source, relpath))
+            except (IOError, OSError, zlib.error) as e:
+                raise ChunkStoreError("Could not fetch chunk {} from '{}': {}".format(digest, source, e))
+            with open(os.path.join(chunk_dir, digest), "wb") as f:
+                f.write(_check(digest, data, source))
+
+        def _chunk(digest):
+            if digest in local:
+                path, offset, size = local[digest]
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    return _check(digest, f.read(size), path)
+            with open(os.path.join(chunk_dir, digest), "rb") as f:
+                return f.read()
+
+        def _write(file_data):
+            path = os.path.join(asset_dir, *file_data["path"].split("/"))
+            with open(path, "wb") as f:
+                for digest, _ in file_data["chunks"]:
+                    f.write(_chunk(digest))
+            os.chmod(path, file_data["mode"])
+            os.utime(path, (file_data["mtime"], file_data["mtime"]))
+
+        _map(_fetch, missing, threads)
+        asset_dir = os.path.join(tmpdir, tag)
+        os.mkdir(asset_dir)
+        for rel in manifest["dirs"]:
+            os.mkdir(os.path.join(asset_dir, *rel.split("/")))
+        _map(_write, manifest["files"], threads)
+        for link in manifest["links"]:
+            os.symlink(link["target"], os.path.join(asset_dir, *link["path"].split("/")))
+        _makedirs(os.path.dirname(tag_dir))
+        if os.path.islink(tag_dir):
+            os.remove(tag_dir)
+        elif os.path.exists(tag_dir):
+            rmtree(tag_dir)
+        os.rename(asset_dir, tag_dir)
+    finally:
+        rmtree(tmpdir)
+    fetched = sum([sizes[d] for d in missing])
+    return fetched, sum(sizes.values()) - fetched
@@ -0,0 +1,161 @@
+"""
+Genome configuration snapshot cache.
+
+Parsing a large YAML genome configuration file is the single largest cost of
+most read-only refgenie commands. The parsed contents are therefore saved as a
+binary snapshot (pickle) next to the YAML file, which is used instead of the
+YAML file as long as the file has not changed. The snapshot is invalidated by
+the file modification time and size and, if these differ, by the file digest,
+so a touched or copied file does not require parsing either.
+
+Unpickling executes arbitrary code, so the snapshot is written readable and
+writable by the current user only, and it is only used if it is owned by the
+current user and is not writable by the group or others. The snapshot of
+another user is not replaced, so the other users of a shared genome
+configuration file parse the YAML file. Set the REFGENIE_NO_CONFIG_CACHE environment variable to
+disable the cache.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from stat import S_IWGRP, S_IWOTH
+
+from refgenconf import RefGenConf
+from yacman import load_yaml
+from yacman.const import FILEPATH_KEY, RO_KEY, WAIT_MAX_KEY
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["load_cached_rgc", "cache_path"]
+
+CACHE_VERSION = 1
+SNAPSHOT_MODE = 0o600
+
+
+def cache_path(gencfg):
+    """
+    Get the path to the snapshot of a genome configuration file
+
+    :param str gencfg: path to the genome configuration file
+    :return str: path to the snapshot file
+    """
+    folder, name = os.path.split(os.path.abspath(gencfg))
+    return os.path.join(folder, TEMPLATE_CFG_CACHE.format(name))
+
+
+def _file_digest(path):
+    """
+    Compute the digest of the file contents
+
+    :param str path: path to the file to digest
+    :return str: the hex digest
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stat_key(st):
+    return getattr(st, "st_mtime_ns", st.st_mtime), st.st_size
+
+
+def _read_snapshot(path):
+    """
+    Read a snapshot file, if it is trusted: owned by the current user and not writable by the group or others
+
+    :param str path: path to the snapshot file
+    :return Mapping | NoneType: the snapshot, None if missing, untrusted or unreadable
+    """
+    try:
+        with open(path, "rb") as f:
+            # the opened file is checked, so it cannot be replaced after the check
+            st = os.fstat(f.fileno())
+            if st.st_uid != os.getuid():
+                _LOGGER.debug("Ignoring genome configuration snapshot owned by other user: {}".format(path))
+                return
+            if st.st_mode & (S_IWGRP | S_IWOTH):
+                _LOGGER.debug("Ignoring genome configuration snapshot writable by other users: {}".format(path))
+                return
+            snapshot = pickle.load(f)
+    except Exception as e:
+        _LOGGER.debug("Could not read genome configuration snapshot ({}): {}".format(e.__class__.__name__, path))
+        return
+    if not isinstance(snapshot, dict) or snapshot.get("version") != CACHE_VERSION:
+        return
+    return snapshot
+
+
+def _write_snapshot(path, snapshot):
+    """
+    Write a snapshot file atomically, readable by the current user only; failures are not fatal
+
+    :param str path: path to the snapshot file
+    :param Mapping snapshot: the snapshot to write
+    """
+    tmp = None
+    try:
+        if os.lstat(path).st_uid != os.getuid():
+            _LOGGER.debug("Not replacing genome configuration snapshot owned by other user: {}".format(path))
+            return
+    except OSError:
+        pass
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.chmod(tmp, SNAPSHOT_MODE)
+        os.rename(tmp, path)
+        _LOGGER.debug("Saved genome configuration snapshot: {}".format(path))
+    except Exception as e:
+        _LOGGER.debug("Could not save genome configuration snapshot ({}): {}".format(e.__class__.__name__, path))
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_cached_rgc(gencfg, wait_max=10):
+    """
+    Create a read-only genome configuration object, from the snapshot if it is up to date.
+
+    The object behaves just like one read from the YAML file, e.g. making it
+    writable re-reads the YAML file.
+
+    :param str gencfg: path to the genome configuration file
+    :param int wait_max: how long to wait for the file lock when making the object writable
+    :return refgenconf.RefGenConf: genome configuration object
+    """
+    if os.getenv(CFG_CACHE_DISABLE_ENV_VAR):
+        return RefGenConf(filepath=gencfg, writable=False, wait_max=wait_max)
+    gencfg = os.path.abspath(gencfg)
+    snapshot_path = cache_path(gencfg)
+    st = os.stat(gencfg)
+    snapshot = _read_snapshot(snapshot_path)
+    entries = None
+    if snapshot is not None:
+        if snapshot["stat"] == list(_stat_key(st)):
+            entries = snapshot["entries"]
+        elif snapshot["digest"] == _file_digest(gencfg):
+            # the contents are the same, just remember the new stats
+            entries = snapshot["entries"]
+            snapshot["stat"] = list(_stat_key(st))
+            _write_snapshot(snapshot_path, snapshot)
+    if entries is None:
+        digest = _file_digest(gencfg)
+        entries = load_yaml(gencfg)
+        # the file might have changed while being read; save only if it did not
+        if _stat_key(os.stat(gencfg)) == _stat_key(st):
+            _write_snapshot(snapshot_path, {"version": CACHE_VERSION, "stat": list(_stat_key(st)),
+                                            "digest": digest, "entries": entries})
+    else:
+        _LOGGER.debug("Using genome configuration snapshot: {}".format(snapshot_path))
+    rgc = RefGenConf(entries=entries)
+    setattr(rgc, WAIT_MAX_KEY, wait_max)
+    setattr(rgc, FILEPATH_KEY, gencfg)
+    setattr(rgc, RO_KEY, True)
+    return rgc
@@ -0,0 +1,317 @@
+"""
+SQLite genome configuration backend.
+
+The genome configuration can be stored in a SQLite database instead of a YAML
+file; the backend is selected by the extension of the genome configuration
+file path (see DB_CFG_EXTS). The database holds one row per genome, asset and
+tag, so that:
+
+- read-only commands load just the genomes and assets they need,
+- writes update just the rows that have changed since the config was read,
+- readers are not blocked by a writer (write-ahead logging).
+
+The same file-based lock as for the YAML files is used to serialize the
+writers, so the read-modify-write semantics of RefGenConf are preserved.
+YAML remains the interchange format, see `refgenie convert`.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from refgenconf import RefGenConf
+from yacman.const import ATTR_KEYS, FILEPATH_KEY, RO_KEY, WAIT_MAX_KEY
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["GenomeConfigDB", "DBRefGenConf", "is_db_path", "config_entries"]
+
+SCHEMA_VERSION = 1
+# name of the attribute holding the rows the object was read from; it needs
+# to start with a double underscore to not be stored as a mapping item
+ROWS_ATTR = "__refgenie_db_rows"
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS genomes (genome TEXT PRIMARY KEY, attrs TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS assets (genome TEXT NOT NULL, asset TEXT NOT NULL, attrs TEXT NOT NULL, "
+    "PRIMARY KEY (genome, asset))",
+    "CREATE TABLE IF NOT EXISTS tags (genome TEXT NOT NULL, asset TEXT NOT NULL, tag TEXT NOT NULL, "
+    "attrs TEXT NOT NULL, PRIMARY KEY (genome, asset, tag))"
+]
+
+# row key kind -> (table, key columns, value column)
+TABLES = OrderedDict([
+    ("meta", ("meta", ["key"], "value")),
+    ("genome", ("genomes", ["genome"], "attrs")),
+    ("asset", ("assets", ["genome", "asset"], "attrs")),
+    ("tag", ("tags", ["genome", "asset", "tag"], "attrs"))
+])
+
+
+def is_db_path(path):
+    """
+    Determine whether the genome configuration file path points to a database
+
+    :param str path: path to the genome configuration file
+    :return bool: whether the path has one of the database file extensions
+    """
+    return isinstance(path, str) and os.path.splitext(path)[1].lower() in DB_CFG_EXTS
+
+
+def config_entries(rgc):
+    """
+    Get the contents of a genome configuration object as plain mappings,
+    without the object attributes that yacman stores as items
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :return collections.OrderedDict: genome configuration contents
+    """
+    return OrderedDict([(k, _plain(v)) for k, v in rgc.items() if k not in ATTR_KEYS])
+
+
+def _plain(x):
+    """
+    Convert nested mappings to OrderedDicts, without expanding the paths
+
+    :param object x: object to convert
+    :return object: converted object
+    """
+    if isinstance(x, Mapping):
+        return OrderedDict([(k, _plain(v)) for k, v in x.items()])
+    if isinstance(x, list):
+        return [_plain(i) for i in x]
+    return x
+
+
+def _dumps(x):
+    return json.dumps(_plain(x))
+
+
+def _loads(x):
+    return json.loads(x, object_pairs_hook=OrderedDict)
+
+
+def _config_rows(entries):
+    """
+    Split the genome configuration contents into genome, asset and tag level rows.
+
+    The nested assets and tags mappings are replaced with empty placeholders,
+    so that the structure can be restored exactly when the rows are read.
+
+    :param Mapping entries: genome configuration contents
+    :return dict[tuple, str]: JSON-encoded rows keyed by (kind, *key)
+    """
+    rows = OrderedDict()
+    for k, v in entries.items():
+        if k in ATTR_KEYS or k == CFG_GENOMES_KEY:
+            continue
+        rows[("meta", k)] = _dumps(v)
+    for g, genome in (entries.get(CFG_GENOMES_KEY) or {}).items():
+        genome = _plain(genome)
+        assets = genome.get(CFG_ASSETS_KEY)
+        if isinstance(assets, Mapping):
+            genome[CFG_ASSETS_KEY] = OrderedDict()
+            for a, asset in assets.items():
+                tags = asset.get(CFG_ASSET_TAGS_KEY)
+                if isinstance(tags, Mapping):
+                    asset[CFG_ASSET_TAGS_KEY] = OrderedDict()
+                    for t, tag in tags.items():
+                        rows[("tag", g, a, t)] = _dumps(tag)
+                rows[("asset", g, a)] = _dumps(asset)
+        rows[("genome", g)] = _dumps(genome)
+    return rows
+
+
+class GenomeConfigDB(object):
+    """ SQLite database that stores the genome configuration """
+
+    def __init__(self, path, timeout=10):
+        """
+        Create the database handle. The database is created on first write.
+
+        :param str path: path to the database file
+        :param int timeout: how long to wait for a database lock, in seconds
+        """
+        self.path = os.path.abspath(path)
+        self.timeout = timeout
+
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=self.timeout)
+        if con.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with con:
+                # write-ahead logging lets the readers proceed during writes
+                con.execute("PRAGMA journal_mode=WAL")
+                for statement in SCHEMA:
+                    con.execute(statement)
+                con.execute("PRAGMA user_version={}".format(SCHEMA_VERSION))
+        return con
+
+    def load(self, genomes=None, assets=None):
+        """
+        Read the genome configuration, possibly just a part of it
+
+        :param Iterable[str] genomes: names of the genomes to read, all by default
+        :param Iterable[str] assets: names of the assets to read, all by default
+        :return collections.OrderedDict, dict[tuple, str]: genome configuration
+            contents and the rows they were read from
+        """
+        if not os.path.isfile(self.path):
+            raise IOError("Genome configuration database does not exist: {}".format(self.path))
+
+        def _where(filters):
+            clauses, params = [], []
+            for col, values in filters:
+                if values:
+                    values = list(values)
+                    clauses.append("{} IN ({})".format(col, ", ".join(["?"] * len(values))))
+                    params.extend(values)
+            return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+        rows = OrderedDict()
+        con = self._connect()
+        try:
+            for kind, filters in [("meta", []), ("genome", [("genome", genomes)]),
+                                  ("asset", [("genome", genomes), ("asset", assets)]),
+                                  ("tag", [("genome", genomes), ("asset", assets)])]:
+                table, cols, value_col = TABLES[kind]
+                where, params = _where(filters)
+                query = "SELECT {}, {} FROM {}{} ORDER BY rowid".format(", ".join(cols), value_col, table, where)
+                for row in con.execute(query, params):
+                    rows[(kind,) + tuple(row[:-1])] = row[-1]
+        finally:
+            con.close()
+        return self._assemble(rows), rows
+
+    @staticmethod
+    def _assemble(rows):
+        """
+        Assemble the genome configuration contents from the rows
+
+        :param dict[tuple, str] rows: JSON-encoded rows keyed by (kind, *key)
+        :return collections.OrderedDict: genome configuration contents
+        """
+        by_kind = dict([(kind, []) for kind in TABLES])
+        for key, value in rows.items():
+            by_kind[key[0]].append((key[1:], value))
+        entries = OrderedDict([(k[0], _loads(v)) for k, v in by_kind["meta"]])
+        genomes = entries[CFG_GENOMES_KEY] = OrderedDict()
+        for (g, ), v in by_kind["genome"]:
+            genomes[g] = _loads(v)
+        for (g, a), v in by_kind["asset"]:
+            if isinstance((genomes.get(g) or {}).get(CFG_ASSETS_KEY), Mapping):
+                genomes[g][CFG_ASSETS_KEY][a] = _loads(v)
+        for (g, a, t), v in by_kind["tag"]:
+            asset = ((genomes.get(g) or {}).get(CFG_ASSETS_KEY) or {}).get(a)
+            if isinstance((asset or {}).get(CFG_ASSET_TAGS_KEY), Mapping):
+                asset[CFG_ASSET_TAGS_KEY][t] = _loads(v)
+        return entries
+
+    def save(self, rows, previous=None):
+        """
+        Write the rows that differ from the previously read ones, in a single transaction.
+
+        Rows that were read previously, but are missing now, are deleted.
+        Rows that were not read previously are left intact.
+
+        :param dict[tuple, str] rows: JSON-encoded rows keyed by (kind, *key)
+        :param dict[tuple, str] previous: rows the genome configuration was read from
+        :return int: number of rows inserted, updated or deleted
+        """
+        previous = previous or {}
+        upserts = [(k, v) for k, v in rows.items() if previous.get(k) != v]
+        deletes = [k for k in previous if k not in rows]
+        con = self._connect()
+        try:
+            with con:
+                for key in deletes:
+                    table, cols, _ = TABLES[key[0]]
+                    con.execute("DELETE FROM {} WHERE {}".format(
+                        table, " AND ".join(["{} = ?".format(c) for c in cols])), key[1:])
+                # update first and insert if there's nothing to update,
+                # so that the rowids, which determine the order, are kept
+                for key, value in sorted(upserts, key=lambda x: list(TABLES).index(x[0][0])):
+                    table, cols, value_col = TABLES[key[0]]
+                    cur = con.execute("UPDATE {} SET {} = ? WHERE {}".format(
+                        table, value_col, " AND ".join(["{} = ?".format(c) for c in cols])), (value,) + key[1:])
+                    if cur.rowcount == 0:
+                        con.execute("INSERT INTO {} ({}, {}) VALUES ({})".format(
+                            table, ", ".join(cols), value_col, ", ".join(["?"] * (len(cols) + 1))),
+                            key[1:] + (value,))
+        finally:
+            con.close()
+        _LOGGER.debug("Updated {} and deleted {} genome configuration rows in: {}".
+                      format(len(upserts), len(deletes), self.path))
+        return len(upserts) + len(deletes)
+
+
+class DBRefGenConf(RefGenConf):
+    """ RefGenConf stored in a SQLite database rather than a YAML file """
+
+    def __init__(self, filepath=None, entries=None, writable=False, wait_max=10, genomes=None, assets=None):
+        """
+        Create the config instance by with a database path or key-value pairs.
+
+        :param str filepath: a path to the database to read
+        :param Iterable[(str, object)] | Mapping[str, object] entries:
+            collection of key-value pairs
+        :param bool writable: whether to create the object with write capabilities
+        :param int wait_max: how long to wait for creating an object when the database is locked
+        :param Iterable[str] genomes: names of the genomes to read, all by default.
+            Objects made writable always read the whole database.
+        :param Iterable[str] assets: names of the assets to read, all by default
+        """
+        rows = {}
+        if filepath is not None:
+            db_entries, rows = GenomeConfigDB(filepath, timeout=wait_max).load(
+                genomes=None if writable else genomes, assets=None if writable else assets)
+            if entries:
+                db_entries.update(entries)
+            entries = db_entries
+        super(DBRefGenConf, self).__init__(entries=entries, wait_max=wait_max)
+        setattr(self, ROWS_ATTR, rows)
+        if filepath is not None:
+            setattr(self, WAIT_MAX_KEY, wait_max)
+            setattr(self, FILEPATH_KEY, os.path.abspath(filepath))
+            setattr(self, RO_KEY, True)
+            if writable:
+                # locks the database and reads it again, within the lock
+                self.make_writable()
+
+    def write(self, filepath=None):
+        """
+        Write the changed genome configuration entries to the database.
+
+        Make sure that the object has been made writable
+
+        :param str filepath: path to a different database to write a copy to
+        :raise OSError: when the object is read-only
+        :raise TypeError: when the database path cannot be determined
+        :raise ValueError: when the path to write a copy to is not a database path
+        :return str: path to the written database
+        """
+        if getattr(self, RO_KEY, False):
+            raise OSError("You can't call write on an object that was created in read-only mode.")
+        if filepath is not None and filepath != self.file_path:
+            if not is_db_path(filepath):
+                raise ValueError("Not a genome configuration database path ({}): {}".
+                                 format(", ".join(DB_CFG_EXTS), filepath))
+            GenomeConfigDB(filepath).save(_config_rows(self))
+            return os.path.abspath(filepath)
+        if not isinstance(self.file_path, str):
+            raise TypeError("No valid filepath provided. It has to be a str, got: {}".
+                            format(self.file_path.__class__.__name__))
+        rows = _config_rows(self)
+        GenomeConfigDB(self.file_path, timeout=getattr(self, WAIT_MAX_KEY, 10)).\
+            save(rows, getattr(self, ROWS_ATTR, None))
+        setattr(self, ROWS_ATTR, rows)
+        return self.file_path
@@ -17,9 +17,24 @@ TAG_CMD = "tag"
 ID_CMD = "id"
 SUBSCRIBE_CMD = "subscribe"
 UNSUBSCRIBE_CMD = "unsubscribe"
+PROFILE_CMD = "profile"
+CONVERT_CMD = "convert"
+VERIFY_CMD = "verify"
+GC_CMD = "gc"
+DEDUP_CMD = "dedup"
+MERGE_CMD = "merge"
+CHUNK_CMD = "chunk"
+PREFETCH_CMD = "prefetch"
+VIEWS_CMD = "views"
 
 GENOME_ONLY_REQUIRED = [REMOVE_CMD, GETSEQ_CMD]
 
+# commands that write the genome configuration file merge the spooled asset registrations first
+SPOOL_MERGE_CMDS = [BUILD_CMD, INSERT_CMD, PULL_CMD, REMOVE_CMD, TAG_CMD, SUBSCRIBE_CMD, UNSUBSCRIBE_CMD, MERGE_CMD]
+
+# commands after which the symbolic link views of the assets are refreshed
+VIEWS_REFRESH_CMDS = [BUILD_CMD, INSERT_CMD, PULL_CMD, REMOVE_CMD, TAG_CMD]
+
 # For each asset we assume a genome is also required
 ASSET_REQUIRED = [PULL_CMD, GET_ASSET_CMD, BUILD_CMD, INSERT_CMD, TAG_CMD, ID_CMD]
 
@@ -36,5 +51,49 @@ SUBPARSER_MESSAGES = {
     TAG_CMD: "Tag an asset.",
     ID_CMD: "Return the asset digest.",
     SUBSCRIBE_CMD: "Add a refgenieserver URL to the config.",
-    UNSUBSCRIBE_CMD: "Remove a refgenieserver URL from the config."
+    UNSUBSCRIBE_CMD: "Remove a refgenieserver URL from the config.",
+    PROFILE_CMD: "Summarize the asset build profiles.",
+    CONVERT_CMD: "Convert the genome configuration between the YAML and database formats.",
+    VERIFY_CMD: "Recalculate the asset digests and compare them with the registered ones.",
+    GC_CMD: "Find and delete the files in the genome folder that the genome configuration does not reference.",
+    DEDUP_CMD: "Replace identical files in the genome folder with links to one copy.",
+    MERGE_CMD: "Merge the spooled asset registrations into the genome configuration.",
+    CHUNK_CMD: "Save assets to a chunk store, for chunked pulls.",
+    PREFETCH_CMD: "Load the files of assets into the page cache.",
+    VIEWS_CMD: "Refresh the symbolic link views of the assets, or set their folder."
 }
+
+# genome configuration file extensions that select the SQLite backend
+DB_CFG_EXTS = [".sqlite", ".sqlite3", ".db"]
+
+# genome configuration snapshot cache
+TEMPLATE_CFG_CACHE = ".{}.pickle"
+TEMPLATE_VERIFY_CACHE = ".{}.verify_cache.json"
+TEMPLATE_DIGEST_STATE = ".{}.digest_state.json"
+TEMPLATE_SPOOL_DIR = ".{}.spool"
+TRASH_DIR = ".refgenie_trash"
+# symbolic link views of the assets
+CFG_VIEWS_FOLDER_KEY = "views_folder"
+VIEWS_DEFAULT_LINK = "_default"
+CFG_CACHE_DISABLE_ENV_VAR = "REFGENIE_NO_CONFIG_CACHE"
+NODE_CACHE_ENV_VAR = "REFGENIE_NODE_CACHE"
+NODE_CACHE_SIZE_ENV_VAR = "REFGENIE_NODE_CACHE_SIZE"
+DEFAULT_NODE_CACHE_SIZE = "100G"
+NODE_CACHE_GRACE_ENV_VAR = "REFGENIE_NODE_CACHE_GRACE"
+DEFAULT_NODE_CACHE_GRACE = "24h"
+
+# asset digest algorithms; the digests without a recorded algorithm are MD5 digests
+CFG_ASSET_DIGEST_ALGORITHM_KEY = "asset_digest_algorithm"
+DIGEST_ALGORITHMS = ["md5", "blake2b", "blake3", "xxh3"]
+DEFAULT_DIGEST_ALGORITHM = "md5"
+
+TEMPLATE_PROFILE_JSON = "build_profile_{}__{}.json"
+TEMPLATE_CHECKPOINTS_JSON = "build_checkpoints_{}__{}.json"
+
+# build profile phases
+PHASE_COMMANDS = "command_execution"
+PHASE_DIGEST = "digesting"
+PHASE_CHECKSUM = "checksumming"
+PHASE_LOCK_WAIT = "config_lock_wait"
+PHASE_WRITE = "config_write"
+PHASE_PUBLISH = "publishing"
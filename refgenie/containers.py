@@ -0,0 +1,100 @@
+"""
+Docker container sessions for the builds.
+
+A build of several assets with --docker used to start a container per asset.
+A session starts one long-lived container per image instead, and the recipe
+commands of all the assets are executed in it with 'docker exec'. The
+container mounts the union of the volumes that the assets need; if an asset
+needs a volume the running container does not mount, the container is
+replaced with one that mounts both. The containers are removed when the
+session is closed, also when the build is interrupted.
+"""
+
+import logging
+import os
+from subprocess import check_call, check_output, CalledProcessError
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["ContainerSession"]
+
+DOCKER = "docker"
+# the same mounts and user as in pypiper.PipelineManager.get_container
+SYSTEM_MOUNTS = ["/etc/group:/etc/group:ro", "/etc/passwd:/etc/passwd:ro", "/etc/shadow:/etc/shadow:ro",
+                 "/etc/sudoers.d:/etc/sudoers.d:ro", "/tmp/.X11-unix:/tmp/.X11-unix:rw"]
+
+
+class ContainerSession(object):
+    """
+    Runs one container per image for the duration of a build session
+
+    Use as a context manager, so that the containers are removed on exit.
+    """
+
+    def __init__(self, volumes=None):
+        """
+        :param Iterable[str] volumes: paths to mount in all the containers
+        """
+        self.volumes = _normalize(volumes or [])
+        self.containers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def container(self, image, volumes=None):
+        """
+        Get the container running the image, starting it if needed
+
+        :param str image: image name, e.g. databio/refgenie
+        :param Iterable[str] volumes: paths the container needs to mount
+        :return str: container ID
+        """
+        needed = _normalize(self.volumes + _normalize(volumes or []))
+        if image in self.containers:
+            container, mounted = self.containers[image]
+            missing = [p for p in needed if not _mounted(p, mounted)]
+            if not missing:
+                return container
+            _LOGGER.info("Restarting the '{}' container to mount: {}".format(image, ", ".join(missing)))
+            self._remove(image)
+            needed = _normalize(mounted + needed)
+        cwd = os.getcwd()
+        cmd = [DOCKER, "run", "-itd", "--workdir={}".format(cwd), "--user={}".format(os.getuid())]
+        for mnt in _normalize(needed + [cwd]):
+            cmd += ["-v", "{0}:{0}".format(mnt)]
+        for mnt in SYSTEM_MOUNTS:
+            cmd += ["--volume={}".format(mnt)]
+        cmd.append(image)
+        _LOGGER.debug("Starting container: {}".format(" ".join(cmd)))
+        container = check_output(cmd).decode("utf-8").strip()
+        _LOGGER.info("Using docker container: {}".format(container))
+        self.containers[image] = (container, needed)
+        return container
+
+    def _remove(self, image):
+        container, _ = self.containers.pop(image)
+        _LOGGER.info("Removing docker container: {}".format(container))
+        try:
+            with open(os.devnull, "w") as devnull:
+                check_call([DOCKER, "rm", "-f", container], stdout=devnull)
+        except (CalledProcessError, OSError) as e:
+            _LOGGER.warning("Could not remove docker container '{}': {}".format(container, e))
+
+    def close(self):
+        """ Remove all the containers of the session """
+        for image in list(self.containers.keys()):
+            self._remove(image)
+
+
+def _mounted(path, mounts):
+    """ Check whether the path is one of the mounts or inside one of them """
+    return any([path == m or path.startswith(m.rstrip(os.sep) + os.sep) for m in mounts])
+
+
+def _normalize(paths):
+    """ Get the absolute paths, without duplicates and the paths inside the other ones """
+    paths = sorted(set([os.path.abspath(p) for p in paths]))
+    return [p for p in paths if not _mounted(p, [q for q in paths if q != p])]
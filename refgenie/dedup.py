@@ -0,0 +1,138 @@
+"""
+Deduplication of identical files in the genome folder.
+
+Different tags of an asset, and different assets, often hold byte-identical
+files. The files of the same size are hashed, on a pool of threads, and the
+files with the same digest on the same file system are replaced with hard
+links to, or reflinks (copy-on-write clones) of, one of them. The digests
+saved by 'refgenie verify' are reused for the files that did not change since.
+
+A duplicate is replaced atomically: the link is created next to it under a
+temporary name and renamed over it.
+"""
+
+import logging
+import os
+import stat
+import tempfile
+from collections import OrderedDict
+from shutil import copystat
+
+from .digest import hash_files, saved_file_digests
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["find_duplicates", "link_duplicates", "LINK_HARD", "LINK_REFLINK"]
+
+LINK_HARD = "hardlink"
+LINK_REFLINK = "reflink"
+# Linux ioctl request that clones a file into another one (FICLONE)
+FICLONE = 0x40049409
+
+
+def _list_files(folder, min_size):
+    """
+    List the regular files in a directory tree
+
+    :param str folder: path to the directory
+    :param int min_size: minimal size in bytes of the listed files
+    :return list[(str, os.stat_result)]: paths to the files and their stats
+    """
+    files = []
+    for root, dirs, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode) and st.st_size >= min_size:
+                files.append((path, st))
+    return files
+
+
+def find_duplicates(folders, min_size=1024 * 1024, threads=8, io_limit=4, state_file=None):
+    """
+    Find the groups of identical files
+
+    Files already linked to each other are hashed once, and all their paths are listed.
+
+    :param list[str] folders: directories to search
+    :param int min_size: minimal size in bytes of the files to consider
+    :param int threads: number of hashing threads
+    :param int io_limit: maximum number of files read at the same time
+    :param str state_file: path to the digest verification state, whose file digests are reused
+    :return list[list[str]]: groups of paths to identical files on the same
+        file system, the paths to the file to keep first
+    """
+    inodes = OrderedDict()
+    for folder in folders:
+        for path, st in _list_files(folder, min_size):
+            inodes.setdefault((st.st_dev, st.st_ino), []).append((path, st))
+    by_size = {}
+    for (dev, _), links in inodes.items():
+        by_size.setdefault((dev, links[0][1].st_size), []).append(links[0])
+    candidates = [f for files in by_size.values() if len(files) > 1 for f in files]
+    saved = saved_file_digests(state_file) if state_file else {}
+    digests = {}
+    to_hash = []
+    for path, st in candidates:
+        if path in saved and list(saved[path][:2]) == [st.st_size, st.st_mtime]:
+            digests[path] = saved[path][2]
+        else:
+            to_hash.append(path)
+    _LOGGER.info("Hashing {} of {} files with non-unique sizes".format(len(to_hash), len(candidates)))
+    digests.update(dict(zip(to_hash, hash_files(to_hash, threads, io_limit))))
+    groups = OrderedDict()
+    for path, st in sorted(candidates, key=lambda x: x[0]):
+        groups.setdefault((st.st_dev, st.st_size, digests[path]), []).append(
+            sorted([p for p, _ in inodes[(st.st_dev, st.st_ino)]]))
+    return [[p for paths in g for p in paths] for g in groups.values() if len(g) > 1]
+
+
+def _reflink(source, target):
+    """
+    Clone a file with the FICLONE ioctl; the file system must support reflinks
+
+    :param str source: path to the file to clone
+    :param str target: path to the clone
+    """
+    import fcntl
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    copystat(source, target)
+
+
+def link_duplicates(group, method=LINK_HARD):
+    """
+    Replace the duplicates with links to the first file of the group
+
+    :param list[str] group: paths to identical files, the file to keep first
+    :param str method: link type, hardlink or reflink
+    :return int: number of bytes reclaimed
+    """
+    keep = group[0]
+    reclaimed = 0
+    for path in group[1:]:
+        tmp = None
+        try:
+            if os.path.samefile(keep, path):
+                continue
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".refgenie_dedup.")
+            os.close(fd)
+            if method == LINK_REFLINK:
+                _reflink(keep, tmp)
+                os.chmod(tmp, stat.S_IMODE(os.stat(path).st_mode))
+            else:
+                os.remove(tmp)
+                os.link(keep, tmp)
+            st = os.lstat(path)
+            # the space is reclaimed only if no other link to the duplicate exists
+            size = st.st_blocks * 512 if st.st_nlink == 1 else 0
+            os.rename(tmp, path)
+            reclaimed += size
+        except (IOError, OSError) as e:
+            _LOGGER.warning("Could not link '{}' to '{}': {}".format(path, keep, e))
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+    return reclaimed
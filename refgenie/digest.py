@@ -0,0 +1,378 @@
+"""
+Asset digest calculation and verification.
+
+The asset digest is the MD5 digest of the list of MD5 digests of the files in
+the asset directory, sorted by the file paths -- what the shell pipeline in
+get_dir_digest produces:
+
+    find . -type f -not -path './_refgenie_build*' -exec md5sum {} \\; | sort -k 2 | awk '{print $1}' | md5sum
+
+Here the files are hashed on a pool of threads, since hashlib releases the
+GIL while hashing large chunks, and the number of files read at the same time
+is limited separately, so that a slow or networked file system is not flooded
+with concurrent reads.
+
+The digests of the files can be saved to a state file next to the genome
+configuration file, so that an incremental verification hashes only the files
+whose size or modification time changed since the previous one.
+
+MD5 is the default digest algorithm, which the genome servers use. Assets can
+be digested with a faster algorithm instead -- BLAKE2b, BLAKE3 (requires the
+blake3 package) or XXH3 (requires the xxhash package) -- which is recorded in
+the asset_digest_algorithm attribute of the tag. The file digests are
+combined in the same way, with the same algorithm; all the digests are 128
+bits long.
+"""
+
+import hashlib
+import json
+import locale
+import logging
+import os
+import stat
+import tempfile
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from threading import BoundedSemaphore
+
+from refgenconf.const import *
+
+from .audit import MTIME_SLACK
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["dir_digest", "verify_digests", "digest_state_path", "saved_file_digests", "hash_files", "new_hash",
+           "digest_algorithm", "STATUS_OK", "STATUS_MISMATCH", "STATUS_MISSING", "STATUS_UNDIGESTED"]
+
+STATUS_OK = "ok"
+STATUS_MISMATCH = "mismatch"
+STATUS_MISSING = "missing"
+STATUS_UNDIGESTED = "undigested"
+STATE_VERSION = 1
+CHUNK_SIZE = 1024 * 1024
+
+
+def new_hash(algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """
+    Create a hash object of a digest algorithm
+
+    :param str algorithm: name of the algorithm, one of DIGEST_ALGORITHMS
+    :return: hash object, with the update and hexdigest methods
+    :raise ValueError: if the algorithm is not supported
+    :raise ImportError: if the package that implements the algorithm is not installed
+    """
+    if algorithm == "md5":
+        return hashlib.md5()
+    if algorithm == "blake2b":
+        if not hasattr(hashlib, "blake2b"):
+            raise ImportError("Python 3.6 or newer is required for the blake2b digests")
+        return hashlib.blake2b(digest_size=16)
+    if algorithm == "blake3":
+        try:
+            from blake3 import blake3
+        except ImportError:
+            raise ImportError("The blake3 package is required for the blake3 digests: pip install blake3")
+        return _Truncated(blake3(max_threads=blake3.AUTO), 16)
+    if algorithm == "xxh3":
+        try:
+            import xxhash
+        except ImportError:
+            raise ImportError("The xxhash package is required for the xxh3 digests: pip install xxhash")
+        return xxhash.xxh3_128()
+    raise ValueError("Unsupported digest algorithm: '{}'. Supported: {}".
+                     format(algorithm, ", ".join(DIGEST_ALGORITHMS)))
+
+
+class _Truncated(object):
+    """ Hash object of an extendable-output function, with a fixed digest length """
+
+    def __init__(self, hasher, length):
+        self._hasher = hasher
+        self._length = length
+
+    def update(self, data):
+        self._hasher.update(data)
+
+    def hexdigest(self):
+        return self._hasher.hexdigest(length=self._length)
+
+
+def digest_algorithm(tag_data):
+    """
+    Get the algorithm of the digest of an asset tag
+
+    :param Mapping tag_data: asset tag attributes
+    :return str: name of the algorithm
+    """
+    return tag_data.get(CFG_ASSET_DIGEST_ALGORITHM_KEY) or DEFAULT_DIGEST_ALGORITHM
+
+
+def digest_state_path(gencfg):
+    """
+    Get the path to the digest verification state of a genome configuration file
+
+    :param str gencfg: path to the genome configuration file
+    :return str: path to the state file
+    """
+    folder, name = os.path.split(os.path.abspath(gencfg))
+    return os.path.join(folder, TEMPLATE_DIGEST_STATE.format(name))
+
+
+def list_files(path):
+    """
+    List the files that make up the asset digest, like find does
+
+    Only regular files are listed; symbolic links are neither listed nor followed.
+
+    :param str path: path to the asset directory
+    :return Mapping[str, (int, float)]: sizes and modification times of the
+        files, keyed by the paths relative to the directory, prefixed with './'
+    """
+    files = {}
+    for root, dirs, names in os.walk(path):
+        rel_root = os.path.relpath(root, path)
+        for name in names:
+            rel = "./" + (name if rel_root == os.curdir else "/".join(rel_root.split(os.sep) + [name]))
+            if rel.startswith("./" + BUILD_STATS_DIR):
+                continue
+            st = os.lstat(os.path.join(root, name))
+            if stat.S_ISREG(st.st_mode):
+                files[rel] = (st.st_size, st.st_mtime)
+    return files
+
+
+def _md5_line(rel, md5):
+    """
+    Format the md5sum output line of a file; md5sum escapes special characters
+    in the file name and marks the line with a leading backslash then
+
+    :param str rel: file path, relative to the asset directory
+    :param str md5: MD5 digest of the file
+    :return str: the md5sum output line, without the line break
+    """
+    if "\\" in rel or "\n" in rel or "\r" in rel:
+        rel = rel.replace("\\", "\\\\").replace("\n", "\\n").replace("\r", "\\r")
+        md5 = "\\" + md5
+    return "{}  {}".format(md5, rel)
+
+
+def _xfrm(s):
+    try:
+        return locale.strxfrm(s)
+    except (ValueError, UnicodeError):
+        return s
+
+
+def _sort_lines(lines, collate):
+    """
+    Sort md5sum output lines like 'sort -k 2' does
+
+    The key starts right after the digest, with the blanks that precede the
+    file path; lines with equal keys are ordered by the whole line.
+
+    :param list[str] lines: md5sum output lines
+    :param bool collate: whether to collate the keys in the locale of the
+        environment, like sort does, or to compare them byte by byte
+    :return list[str]: the sorted lines
+    """
+    if not collate:
+        return sorted(lines, key=lambda l: (l[l.index(" "):], l))
+    previous = locale.setlocale(locale.LC_COLLATE)
+    try:
+        locale.setlocale(locale.LC_COLLATE, "")
+    except locale.Error:
+        return _sort_lines(lines, False)
+    try:
+        return sorted(lines, key=lambda l: (_xfrm(l[l.index(" "):]), _xfrm(l)))
+    finally:
+        locale.setlocale(locale.LC_COLLATE, previous)
+
+
+def combine_digests(file_digests, collate=True, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """
+    Combine the digests of the files into the asset digest
+
+    :param Mapping[str, str] file_digests: digests of the files, keyed by
+        the paths relative to the asset directory, prefixed with './'
+    :param bool collate: whether to order the files in the locale of the environment
+    :param str algorithm: digest algorithm the files were hashed with
+    :return str: the asset digest
+    """
+    lines = _sort_lines([_md5_line(rel, md5) for rel, md5 in file_digests.items()], collate)
+    combined = new_hash(algorithm)
+    combined.update("".join([l.split(" ")[0] + "\n" for l in lines]).encode("utf-8"))
+    return combined.hexdigest()
+
+
+def hash_files(paths, threads=8, io_limit=4, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """
+    Calculate the digests of files on a pool of threads
+
+    :param list[str] paths: paths to the files
+    :param int threads: number of hashing threads
+    :param int io_limit: maximum number of files read at the same time
+    :param str algorithm: digest algorithm
+    :return list[str]: the digests, in the order of the paths
+    """
+    io_slots = BoundedSemaphore(max(1, io_limit))
+
+    def _hash(path):
+        hasher = new_hash(algorithm)
+        with open(path, "rb") as f:
+            while True:
+                with io_slots:
+                    chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    if threads <= 1 or len(paths) <= 1:
+        return [_hash(p) for p in paths]
+    pool = ThreadPool(min(threads, len(paths)))
+    try:
+        # the largest files first, so that a single big file does not finish last
+        order = sorted(range(len(paths)), key=lambda i: -os.path.getsize(paths[i]))
+        digests = pool.map(_hash, [paths[i] for i in order], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    result = [None] * len(paths)
+    for i, d in zip(order, digests):
+        result[i] = d
+    return result
+
+
+def dir_digest(path, threads=8, io_limit=4, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """
+    Calculate the digest of an asset directory; the MD5 digest is equal to the one get_dir_digest produces
+
+    :param str path: path to the asset directory
+    :param int threads: number of hashing threads
+    :param int io_limit: maximum number of files read at the same time
+    :param str algorithm: digest algorithm
+    :return str: the digest, e.g. a3c46f201a3ce7831d85cf4a125aa334
+    """
+    rels = sorted(list_files(path).keys())
+    digests = hash_files([os.path.join(path, *r[2:].split("/")) for r in rels], threads, io_limit, algorithm)
+    return combine_digests(dict(zip(rels, digests)), algorithm=algorithm)
+
+
+def _read_state(path):
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    return state.get("tags", {}) if state.get("version") == STATE_VERSION else {}
+
+
+def _write_state(path, tags):
+    """ Write the state file atomically; failures are not fatal """
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": STATE_VERSION, "tags": tags}, f)
+        os.rename(tmp, path)
+    except Exception as e:
+        _LOGGER.debug("Could not save digest verification state ({}): {}".format(e.__class__.__name__, path))
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def saved_file_digests(state_file, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """
+    Get the digests of the files saved by the previous verifications
+
+    :param str state_file: path to the state file
+    :param str algorithm: digest algorithm of the digests to get
+    :return Mapping[str, (int, float, str)]: sizes, modification times and
+        digests of the files at the time they were hashed, keyed by the file paths
+    """
+    saved = {}
+    for tag_state in _read_state(state_file).values():
+        if "path" not in tag_state or tag_state.get("algorithm", DEFAULT_DIGEST_ALGORITHM) != algorithm:
+            continue
+        for rel, (size, mtime, md5) in tag_state["files"].items():
+            saved[os.path.join(tag_state["path"], *rel[2:].split("/"))] = (size, mtime, md5)
+    return saved
+
+
+def verify_digests(rgc, tags, threads=8, io_limit=4, state_file=None, incremental=False):
+    """
+    Recalculate the digests of the asset tags and compare them with the registered ones
+
+    The files of all the selected asset tags are hashed on one pool of
+    threads, with the digest algorithm recorded for each tag. The order of the
+    files follows the collation of the locale of the environment, like sort in
+    get_dir_digest does; a digest calculated in the C locale is accepted as well.
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[(str, str, str)] tags: genome, asset and tag names of the asset tags to verify
+    :param int threads: number of hashing threads
+    :param int io_limit: maximum number of files read at the same time
+    :param str state_file: path to the file to save the digests of the files
+        to, no state is saved if not provided
+    :param bool incremental: whether to reuse the digests of the files whose
+        size and modification time did not change, read from the state file
+    :return list[(str, str, str, str)]: registry paths of the asset tags,
+        their statuses, the registered and the calculated digests
+    """
+    state = _read_state(state_file) if state_file and incremental else {}
+    results = {}
+    files = OrderedDict()
+    rps = []
+    for genome, asset, tag in tags:
+        rp = "{}/{}:{}".format(genome, asset, tag)
+        rps.append(rp)
+        tag_data = rgc[CFG_GENOMES_KEY][genome][CFG_ASSETS_KEY][asset][CFG_ASSET_TAGS_KEY][tag]
+        expected = tag_data.get(CFG_ASSET_CHECKSUM_KEY)
+        if CFG_ASSET_PATH_KEY not in tag_data:
+            results[rp] = (STATUS_MISSING, expected, None)
+            continue
+        path = os.path.join(rgc[CFG_FOLDER_KEY], genome, tag_data[CFG_ASSET_PATH_KEY], tag)
+        if not os.path.isdir(path):
+            results[rp] = (STATUS_MISSING, expected, None)
+            continue
+        files[rp] = (path, expected, list_files(path), digest_algorithm(tag_data))
+    # reuse the digests of the unchanged files, hash the rest
+    digests = {}
+    to_hash = OrderedDict()
+    for rp, (path, _, listing, algorithm) in files.items():
+        previous = state.get(rp, {})
+        previous = previous.get("files", {}) \
+            if previous.get("algorithm", DEFAULT_DIGEST_ALGORITHM) == algorithm else {}
+        digests[rp] = {}
+        for rel, signature in listing.items():
+            if rel in previous and previous[rel][:2] == list(signature):
+                digests[rp][rel] = previous[rel][2]
+            else:
+                to_hash.setdefault(algorithm, []).append((rp, rel, os.path.join(path, *rel[2:].split("/"))))
+    _LOGGER.info("Hashing {} files of {} asset tags".format(sum([len(x) for x in to_hash.values()]), len(files)))
+    for algorithm, algorithm_files in to_hash.items():
+        for (rp, rel, _), md5 in zip(algorithm_files, hash_files([p for _, _, p in algorithm_files], threads,
+                                                                  io_limit, algorithm)):
+            digests[rp][rel] = md5
+    new_state = {}
+    recent = time.time() - MTIME_SLACK
+    for rp, (path, expected, listing, algorithm) in files.items():
+        actual = combine_digests(digests[rp], algorithm=algorithm)
+        if expected is not None and actual != expected:
+            c_digest = combine_digests(digests[rp], collate=False, algorithm=algorithm)
+            actual = c_digest if c_digest == expected else actual
+        if expected is None:
+            results[rp] = (STATUS_UNDIGESTED, expected, actual)
+        else:
+            results[rp] = (STATUS_OK if actual == expected else STATUS_MISMATCH, expected, actual)
+        new_state[rp] = {"path": path, "algorithm": algorithm,
+                         "files": dict([(rel, list(sig) + [digests[rp][rel]])
+                                        for rel, sig in listing.items() if sig[1] < recent])}
+    if state_file:
+        # keep the state of the asset tags that were not verified
+        new_state.update(dict([(rp, v) for rp, v in _read_state(state_file).items()
+                               if rp not in results]))
+        _write_state(state_file, new_state)
+    return [(rp, ) + results[rp] for rp in rps]
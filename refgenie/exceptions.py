@@ -1,6 +1,6 @@
 from refgenconf import CFG_ENV_VARS
 
-__all__ = ["RefgenieError", "MissingGenomeConfigError"]
+__all__ = ["RefgenieError", "MissingGenomeConfigError", "ChunkStoreError"]
 
 
 class RefgenieError(Exception):
@@ -33,3 +33,7 @@ class MissingFolderError(RefgenieError):
         """
         super(MissingFolderError, self).__init__(folder)
 
+
+class ChunkStoreError(RefgenieError):
+    """ Exception for when an asset cannot be read from a chunk store. """
+    pass
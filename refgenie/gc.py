@@ -0,0 +1,257 @@
+"""
+Garbage collection in the genome folder.
+
+Failed builds leave their directories in place, and assets removed from the
+genome configuration, or never registered in it, may leave theirs too. The
+genome folder is scanned for the asset and tag directories that the genome
+configuration does not reference and for the leftovers of interrupted
+downloads and removals. The directories are listed and measured on a pool of
+threads.
+
+Only the directories that refgenie could have created are considered: the
+asset and tag directories of the registered genomes, and the genome
+directories that hold refgenie build logs or sequence digests. The asset and
+tag directories without the build log directory of refgenie, which holds the
+build logs, status flags and locks, may have been put there by hand; they are
+reported as unknown, to be collected only on request. Directories with a
+build in progress, or modified recently, are never collected. The
+entries of the trash directory, which 'refgenie remove' moves the removed
+assets to, are collected regardless of their age.
+"""
+
+import errno
+import logging
+import os
+import re
+import time
+from multiprocessing.pool import ThreadPool
+from shutil import rmtree
+
+from refgenconf.const import *
+
+from .const import *
+from .trash import trash_entries
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["find_orphans", "delete_orphans", "KIND_FAILED", "KIND_INTERRUPTED", "KIND_UNREGISTERED",
+           "KIND_UNKNOWN", "KIND_DOWNLOAD", "KIND_TRASH"]
+
+KIND_FAILED = "failed build"
+KIND_INTERRUPTED = "interrupted build"
+KIND_UNREGISTERED = "unregistered"
+KIND_UNKNOWN = "unknown"
+KIND_DOWNLOAD = "download leftover"
+KIND_TRASH = "removed asset"
+# names of the pypiper status flags of the build
+RUNNING_FLAG = "refgenie_running.flag"
+FAILED_FLAG = "refgenie_failed.flag"
+# archives and temporary directories that RefGenConf.pull leaves if interrupted
+DOWNLOAD_ARCHIVE_REGEX = re.compile(r"^.+__.+\.tgz$")
+DOWNLOAD_TMPDIR_REGEX = re.compile(r"^tmp[a-z0-9_]{8}$")
+
+
+def _registered_dirs(rgc, genome):
+    """
+    Get the tag directories of the assets registered for a genome
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param str genome: genome name
+    :return set[str]: normalized paths to the tag directories
+    """
+    genome_dir = os.path.join(rgc[CFG_FOLDER_KEY], genome)
+    dirs = set()
+    for asset_data in (rgc[CFG_GENOMES_KEY][genome] or {}).get(CFG_ASSETS_KEY, {}).values():
+        for tag, tag_data in asset_data.get(CFG_ASSET_TAGS_KEY, {}).items():
+            if CFG_ASSET_PATH_KEY in tag_data:
+                dirs.add(os.path.normpath(os.path.join(genome_dir, tag_data[CFG_ASSET_PATH_KEY], tag)))
+    return dirs
+
+
+def _ancestors(paths, root):
+    """
+    Get the directories between the root and the paths
+
+    :param Iterable[str] paths: normalized paths inside the root
+    :param str root: normalized root path
+    :return set[str]: the ancestors of the paths, excluding the root
+    """
+    ancestors = set()
+    for p in paths:
+        p = os.path.dirname(p)
+        while p.startswith(root + os.sep) and p not in ancestors:
+            ancestors.add(p)
+            p = os.path.dirname(p)
+    return ancestors
+
+
+def _build_dirs(path):
+    """ Get the build log directories of a tag or an asset directory """
+    candidates = [os.path.join(path, BUILD_STATS_DIR)]
+    try:
+        candidates += [os.path.join(path, d, BUILD_STATS_DIR) for d in os.listdir(path)]
+    except OSError:
+        pass
+    return [d for d in candidates if os.path.isdir(d)]
+
+
+def _classify(path):
+    """
+    Classify an unreferenced asset or tag directory by its build logs
+
+    :param str path: path to the directory
+    :return str: the kind of the leftover, unknown if refgenie did not build it
+    """
+    build_dirs = _build_dirs(path)
+    if not build_dirs:
+        return KIND_UNKNOWN
+    if any([os.path.exists(os.path.join(d, FAILED_FLAG)) for d in build_dirs]):
+        return KIND_FAILED
+    if any([os.path.exists(os.path.join(d, RUNNING_FLAG)) for d in build_dirs]):
+        # with a build in progress the directory is recent, see the age check
+        return KIND_INTERRUPTED
+    return KIND_UNREGISTERED
+
+
+def _scan_genome(rgc, genome, registered):
+    """
+    Find the unreferenced directories and download leftovers in a genome directory
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param str genome: genome name
+    :param bool registered: whether the genome is in the genome configuration
+    :return list[(str, str)]: the paths and their kinds
+    """
+    genome_dir = os.path.normpath(os.path.join(rgc[CFG_FOLDER_KEY], genome))
+    if not registered:
+        looks_built = os.path.exists(os.path.join(genome_dir, "{}_sequence_digests.tsv".format(genome))) or \
+            any([_build_dirs(os.path.join(genome_dir, d)) for d in os.listdir(genome_dir)
+                 if os.path.isdir(os.path.join(genome_dir, d))])
+        return [(genome_dir, _classify_genome(genome_dir))] if looks_built else []
+    tag_dirs = _registered_dirs(rgc, genome)
+    ancestors = _ancestors(tag_dirs, genome_dir)
+    found = []
+    for name in sorted(os.listdir(genome_dir)):
+        path = os.path.join(genome_dir, name)
+        if os.path.islink(path) or path in tag_dirs:
+            continue
+        if os.path.isfile(path):
+            if DOWNLOAD_ARCHIVE_REGEX.match(name):
+                found.append((path, KIND_DOWNLOAD))
+        elif path in ancestors:
+            for child in sorted(os.listdir(path)):
+                child_path = os.path.join(path, child)
+                if os.path.isdir(child_path) and not os.path.islink(child_path) \
+                        and child_path not in tag_dirs and child_path not in ancestors:
+                    found.append((child_path, _classify(child_path)))
+        elif DOWNLOAD_TMPDIR_REGEX.match(name):
+            found.append((path, KIND_DOWNLOAD))
+        else:
+            found.append((path, _classify(path)))
+    return found
+
+
+def _classify_genome(genome_dir):
+    """ Classify an unregistered genome directory by the builds of its assets """
+    kinds = [_classify(os.path.join(genome_dir, d)) for d in os.listdir(genome_dir)
+             if os.path.isdir(os.path.join(genome_dir, d))]
+    for kind in [KIND_FAILED, KIND_INTERRUPTED]:
+        if kind in kinds:
+            return kind
+    return KIND_UNREGISTERED
+
+
+def _usage(path):
+    """
+    Get the disk usage of a file or directory tree and its latest modification time
+
+    :param str path: path to the file or directory
+    :return (int, float): number of bytes and the latest modification time, None if the path does not exist
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    size, mtime = st.st_blocks * 512, st.st_mtime
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            for name in dirs + files:
+                try:
+                    st = os.lstat(os.path.join(root, name))
+                except OSError:
+                    continue
+                size += st.st_blocks * 512
+                mtime = max(mtime, st.st_mtime)
+    return size, mtime
+
+
+def find_orphans(rgc, genomes=None, threads=16, min_age=24):
+    """
+    Find the directories and files in the genome folder that the genome configuration does not reference
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[str] genomes: genomes to scan, all the genome directories by default
+    :param int threads: number of threads to scan the genome folder on
+    :param float min_age: minimal age in hours of the latest modification in
+        a directory for it to be reported; the trash entries are reported regardless
+    :return list[(str, str, int)]: the paths, their kinds and disk usage in bytes
+    """
+    folder = rgc[CFG_FOLDER_KEY]
+    known = list((rgc[CFG_GENOMES_KEY] or {}).keys())
+    names = [d for d in sorted(os.listdir(folder)) if not d.startswith(".")
+             and os.path.isdir(os.path.join(folder, d)) and not os.path.islink(os.path.join(folder, d))]
+    if genomes:
+        names = [d for d in names if d in genomes]
+    pool = ThreadPool(max(1, threads))
+    try:
+        found = [x for xs in pool.map(lambda g: _scan_genome(rgc, g, g in known), names) for x in xs]
+        found += [(p, KIND_TRASH) for p in trash_entries(folder, genomes)]
+        usage = pool.map(_usage, [p for p, _ in found], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    newest = time.time() - min_age * 3600
+    orphans = []
+    for (path, kind), path_usage in zip(found, usage):
+        if path_usage is None:
+            continue
+        size, mtime = path_usage
+        if mtime > newest and kind != KIND_TRASH:
+            _LOGGER.debug("Skipping recently modified {} ({}): {}".format(kind, time.ctime(mtime), path))
+            continue
+        orphans.append((path, kind, size))
+    return orphans
+
+
+def delete_orphans(paths, threads=16):
+    """
+    Delete the files and directory trees on a pool of threads
+
+    :param list[str] paths: paths to delete
+    :param int threads: number of threads to delete the paths on
+    :return list[str]: the paths that could not be deleted
+    """
+    def _ignore_missing(func, path, exc_info):
+        # the trash entries may be deleted by a background 'refgenie remove' at the same time
+        if getattr(exc_info[1], "errno", None) != errno.ENOENT:
+            raise exc_info[1]
+
+    def _delete(path):
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                rmtree(path, onerror=_ignore_missing)
+            else:
+                os.remove(path)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return
+            _LOGGER.warning("Could not delete '{}': {}".format(path, e))
+            return path
+
+    pool = ThreadPool(max(1, threads))
+    try:
+        failed = pool.map(_delete, paths, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return [p for p in failed if p is not None]
@@ -0,0 +1,105 @@
+"""
+Asset manifests for bulk additions.
+
+A manifest lists the local assets for 'refgenie add' to register at once. It
+is either a tab-separated file, with a registry path, a path and, optionally,
+seek keys per line:
+
+    # registry path     path                        seek keys
+    hg38/blacklist      blacklist/hg38.bed.gz
+    hg38/gencode_gtf:35 gencode/v35                 gtf=gencode.v35.gtf.gz,exons=exons.bed
+
+or a YAML file, with the registry paths mapped to the paths, or to mappings
+with the path and the seek keys:
+
+    hg38/blacklist: blacklist/hg38.bed.gz
+    hg38/gencode_gtf:35:
+      path: gencode/v35
+      seek_keys:
+        gtf: gencode.v35.gtf.gz
+
+The paths are relative to the genome directories, just like the ones provided
+to 'refgenie add -p'. The seek keys point to paths relative to the asset tag
+directories, and are registered in addition to the default one.
+"""
+
+import csv
+import logging
+import os
+from collections import OrderedDict
+
+import yaml
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["read_manifest"]
+
+YAML_EXTS = [".yaml", ".yml"]
+HEADER = "registry_path"
+
+
+def _entry(registry_path, path, seek_keys=None):
+    return OrderedDict([("registry_path", registry_path), ("path", path), ("seek_keys", seek_keys or {})])
+
+
+def _parse_seek_keys(value, origin):
+    """
+    Parse the seek keys column of a manifest line
+
+    :param str value: comma-separated key=path pairs
+    :param str origin: manifest path and line number, for the error messages
+    :return Mapping[str, str]: the seek keys
+    """
+    seek_keys = OrderedDict()
+    for pair in [p.strip() for p in value.split(",") if p.strip()]:
+        if "=" not in pair:
+            raise ValueError("Invalid seek key '{}', expected key=path: {}".format(pair, origin))
+        key, path = [x.strip() for x in pair.split("=", 1)]
+        seek_keys[key] = path
+    return seek_keys
+
+
+def _read_tsv(path):
+    entries = []
+    with open(path) as f:
+        for number, row in enumerate(csv.reader(f, delimiter="\t"), 1):
+            row = [x.strip() for x in row]
+            if not row or not row[0] or row[0].startswith("#") or (number == 1 and row[0] == HEADER):
+                continue
+            origin = "{}:{}".format(path, number)
+            if len(row) < 2 or not row[1]:
+                raise ValueError("Missing asset path: {}".format(origin))
+            entries.append(_entry(row[0], row[1], _parse_seek_keys(row[2], origin) if len(row) > 2 else None))
+    return entries
+
+
+def _read_yaml(path):
+    with open(path) as f:
+        data = yaml.safe_load(f) or {}
+    if not isinstance(data, dict):
+        raise ValueError("The manifest must map the registry paths to the asset paths: {}".format(path))
+    entries = []
+    for registry_path, value in data.items():
+        if isinstance(value, dict):
+            if not value.get("path"):
+                raise ValueError("Missing asset path of '{}': {}".format(registry_path, path))
+            entries.append(_entry(str(registry_path), str(value["path"]),
+                                  OrderedDict([(str(k), str(v)) for k, v in (value.get("seek_keys") or {}).items()])))
+        elif value:
+            entries.append(_entry(str(registry_path), str(value)))
+        else:
+            raise ValueError("Missing asset path of '{}': {}".format(registry_path, path))
+    return entries
+
+
+def read_manifest(path):
+    """
+    Read an asset manifest, in the YAML format if the file extension is .yaml or .yml, tab-separated otherwise
+
+    :param str path: path to the manifest
+    :return list[Mapping]: the registry paths, asset paths and seek keys of the assets
+    :raise ValueError: if the manifest is invalid
+    """
+    entries = _read_yaml(path) if os.path.splitext(path)[1].lower() in YAML_EXTS else _read_tsv(path)
+    _LOGGER.debug("Read {} assets from the manifest: {}".format(len(entries), path))
+    return entries
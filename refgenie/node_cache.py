@@ -0,0 +1,307 @@
+"""
+Node-local asset cache.
+
+Jobs that read large assets, like aligner indexes, from a genome folder on a
+shared file system can read them from a copy in a node-local cache directory
+instead, e.g. on an SSD. An asset tag is copied to the cache the first time it
+is sought on the node, and its digest is verified against the registered one;
+the following seeks return the paths in the copy.
+
+Concurrent processes on the node share the copies: an asset tag is copied by
+one process while the others wait for it, under a file lock per cache entry.
+The cache index, with the sizes and last use times of the entries, is updated
+under a cache-wide file lock. Once the cache exceeds its size limit, the least
+recently used entries are removed; the files that processes have open remain
+readable until they are closed. A process that has sought an entry can use its
+paths after it ends, e.g. a job that calls 'refgenie seek' and then runs an
+aligner, so the entries used within a grace period are not removed: if there
+is no room otherwise, the asset is not cached.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from shutil import copytree, rmtree
+
+from refgenconf.const import *
+
+from .const import *
+from .digest import combine_digests, hash_files, list_files, digest_algorithm
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["cached_seek", "node_cache_dir", "node_cache_size", "node_cache_grace", "parse_size", "parse_duration"]
+
+INDEX_NAME = "index.json"
+LOCK_NAME = ".lock"
+INDEX_VERSION = 1
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+DURATION_UNITS = {"": 1, "S": 1, "M": 60, "H": 3600, "D": 86400}
+
+
+def parse_size(size):
+    """
+    Convert a size with an optional unit suffix to bytes
+
+    :param str | int size: size, e.g. 500G, 1.5T or 1048576
+    :return int: number of bytes
+    :raise ValueError: if the size cannot be parsed
+    """
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*$", str(size), re.IGNORECASE)
+    if not match:
+        raise ValueError("Invalid size: {}".format(size))
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def parse_duration(duration):
+    """
+    Convert a duration with an optional unit suffix to seconds
+
+    :param str | int duration: duration, e.g. 90m, 1.5h, 2d or 3600
+    :return float: number of seconds
+    :raise ValueError: if the duration cannot be parsed
+    """
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([SMHD]?)\s*$", str(duration), re.IGNORECASE)
+    if not match:
+        raise ValueError("Invalid duration: {}".format(duration))
+    return float(match.group(1)) * DURATION_UNITS[match.group(2).upper()]
+
+
+def node_cache_dir(cache_dir=None):
+    """
+    Get the node cache directory, from the environment if not provided
+
+    :param str cache_dir: path to the cache directory
+    :return str: path to the cache directory, None if the cache is not enabled
+    """
+    cache_dir = cache_dir or os.getenv(NODE_CACHE_ENV_VAR)
+    return os.path.abspath(os.path.expandvars(os.path.expanduser(cache_dir))) if cache_dir else None
+
+
+def node_cache_size(max_size=None):
+    """
+    Get the node cache size limit, from the environment if not provided
+
+    :param str | int max_size: size limit, e.g. 500G
+    :return int: size limit in bytes
+    """
+    return parse_size(max_size or os.getenv(NODE_CACHE_SIZE_ENV_VAR) or DEFAULT_NODE_CACHE_SIZE)
+
+
+def node_cache_grace(grace=None):
+    """
+    Get the node cache grace period, from the environment if not provided
+
+    :param str | int grace: grace period, e.g. 12h
+    :return float: grace period in seconds
+    """
+    if grace is None:
+        grace = os.getenv(NODE_CACHE_GRACE_ENV_VAR) or DEFAULT_NODE_CACHE_GRACE
+    return parse_duration(grace)
+
+
+@contextmanager
+def _locked(path, blocking=True):
+    """
+    Hold an exclusive lock on a lock file for the duration of the block
+
+    :param str path: path to the lock file, created if it does not exist
+    :param bool blocking: whether to wait for the lock, otherwise the block
+        is entered without it if another process holds it
+    :return bool: whether the lock is held
+    """
+    import fcntl
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except (IOError, OSError):
+            if blocking:
+                raise
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _read_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, INDEX_NAME)) as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    return index.get("entries", {}) if index.get("version") == INDEX_VERSION else {}
+
+
+def _write_index(cache_dir, entries):
+    path = os.path.join(cache_dir, INDEX_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"version": INDEX_VERSION, "entries": entries}, f)
+    os.rename(path + ".tmp", path)
+
+
+def _update_index(cache_dir, name, size, max_size=None, grace=0):
+    """
+    Register the use of an entry in the cache index, or make room for it
+
+    To make room, the least recently used entries are removed until the cache
+    fits in the size limit; the entries being copied by other processes and
+    the ones used within the grace period are not.
+
+    :param str cache_dir: path to the cache directory
+    :param str name: name of the entry
+    :param int size: size of the entry in bytes
+    :param int max_size: size limit in bytes; if provided, room is made for the entry instead
+    :param float grace: number of seconds since their last use during which the entries are not removed
+    :return bool: whether the entry fits in the cache; if not, it is not registered
+    """
+    with _locked(os.path.join(cache_dir, LOCK_NAME)):
+        entries = _read_index(cache_dir)
+        # forget the entries removed from the cache directory by other means
+        for n in [n for n in entries if not os.path.isdir(os.path.join(cache_dir, n))]:
+            entries.pop(n)
+        if max_size is None:
+            entries[name] = {"size": size, "used": time.time()}
+        else:
+            total = sum([e["size"] for n, e in entries.items() if n != name]) + size
+            now = time.time()
+            for n in sorted(entries.keys(), key=lambda x: entries[x]["used"]):
+                if total <= max_size:
+                    break
+                if n == name:
+                    continue
+                if now - entries[n]["used"] < grace:
+                    # the entries are sorted by the last use, so the rest are in use too
+                    break
+                with _locked(os.path.join(cache_dir, n + LOCK_NAME), blocking=False) as locked:
+                    if not locked:
+                        continue
+                    _LOGGER.info("Evicting '{}' from the node cache".format(n))
+                    rmtree(os.path.join(cache_dir, n), ignore_errors=True)
+                total -= entries.pop(n)["size"]
+            if total > max_size:
+                _write_index(cache_dir, entries)
+                return False
+        _write_index(cache_dir, entries)
+    return True
+
+
+def _copy_verified(source, target, expected, threads, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """
+    Copy an asset directory, without the build logs, and verify the digest of the copy
+
+    :param str source: path to the asset directory
+    :param str target: path to the copy
+    :param str expected: registered asset digest
+    :param int threads: number of threads to hash the files on
+    :param str algorithm: algorithm of the registered digest
+    :return bool: whether the digest of the copy matches
+    """
+    copytree(source, target, symlinks=True,
+             ignore=lambda d, names: [n for n in names if d == source and n.startswith(BUILD_STATS_DIR)])
+    rels = sorted(list_files(target).keys())
+    digests = dict(zip(rels, hash_files([os.path.join(target, *r[2:].split("/")) for r in rels], threads,
+                                        algorithm=algorithm)))
+    return expected in [combine_digests(digests, algorithm=algorithm),
+                        combine_digests(digests, collate=False, algorithm=algorithm)]
+
+
+def _populate(cache_dir, name, source, expected, size, max_size, threads, algorithm=DEFAULT_DIGEST_ALGORITHM,
+              grace=0):
+    """
+    Copy an asset directory to a cache entry, unless it is cached already
+
+    :param str cache_dir: path to the cache directory
+    :param str name: name of the cache entry
+    :param str source: path to the asset directory
+    :param str expected: registered asset digest
+    :param int size: size of the asset in bytes
+    :param int max_size: cache size limit in bytes
+    :param int threads: number of threads to hash the files on
+    :param str algorithm: algorithm of the registered digest
+    :param float grace: number of seconds since their last use during which the other entries are not evicted
+    :return bool: whether the entry is available
+    """
+    entry = os.path.join(cache_dir, name)
+    with _locked(entry + LOCK_NAME):
+        if not os.path.isdir(entry):
+            if not _update_index(cache_dir, name, size, max_size, grace):
+                _LOGGER.info("No room in the node cache for '{}', the cached assets are in use".format(source))
+                return False
+            tmp = entry + ".tmp"
+            # a leftover of an interrupted copy; the lock is held by no one else
+            rmtree(tmp, ignore_errors=True)
+            _LOGGER.info("Copying '{}' to the node cache: {}".format(source, entry))
+            try:
+                if not _copy_verified(source, tmp, expected, threads, algorithm):
+                    _LOGGER.warning("Digest of the node cache copy does not match the registered one, "
+                                    "using the asset in the genome folder: {}".format(source))
+                    rmtree(tmp, ignore_errors=True)
+                    return False
+            except (IOError, OSError) as e:
+                _LOGGER.warning("Could not copy '{}' to the node cache: {}".format(source, e))
+                rmtree(tmp, ignore_errors=True)
+                return False
+            os.rename(tmp, entry)
+        _update_index(cache_dir, name, size)
+    return True
+
+
+def cached_seek(rgc, genome, asset, tag=None, seek_key=None, cache_dir=None, max_size=None, threads=8, grace=None,
+                **kwargs):
+    """
+    Seek the path to an asset in the node cache, copying the asset to the cache if needed
+
+    The path in the genome folder is returned if the cache is not enabled,
+    the asset has no digest, does not fit in the cache, or cannot be copied.
+    The cached assets used within the grace period are not evicted to make
+    room for the asset, since the processes that sought them may still read them.
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param str genome: genome name
+    :param str asset: asset name
+    :param str tag: tag name, the default tag by default
+    :param str seek_key: seek key name
+    :param str cache_dir: path to the node cache directory, the REFGENIE_NODE_CACHE environment variable by default
+    :param str | int max_size: node cache size limit, the REFGENIE_NODE_CACHE_SIZE
+        environment variable or 100G by default
+    :param int threads: number of threads to verify the copied files on
+    :param str | int grace: grace period of the cached assets, e.g. 12h, the
+        REFGENIE_NODE_CACHE_GRACE environment variable or 24h by default
+    :param kwargs: arguments to pass to RefGenConf.seek
+    :return str: path to the asset
+    """
+    path = rgc.seek(genome, asset, tag, seek_key, **kwargs)
+    cache_dir = node_cache_dir(cache_dir)
+    if not cache_dir:
+        return path
+    tag = tag or rgc.get_default_tag(genome, asset)
+    tag_dir = rgc.seek(genome, asset, tag, enclosing_dir=True)
+    rel = os.path.relpath(path, tag_dir)
+    tag_data = rgc[CFG_GENOMES_KEY][genome][CFG_ASSETS_KEY][asset][CFG_ASSET_TAGS_KEY][tag]
+    expected = tag_data.get(CFG_ASSET_CHECKSUM_KEY)
+    if rel.startswith(os.pardir) or not expected or not os.path.isdir(tag_dir):
+        _LOGGER.debug("Not caching '{}/{}:{}'".format(genome, asset, tag))
+        return path
+    max_size = node_cache_size(max_size)
+    size = sum([s for s, _ in list_files(tag_dir).values()])
+    if size > max_size:
+        _LOGGER.warning("'{}/{}:{}' does not fit in the node cache ({:.2f} GB)".
+                        format(genome, asset, tag, size / 1e9))
+        return path
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                raise
+    # the entries are named by the digests, so updated assets are copied again
+    name = "{}__{}__{}__{}".format(genome, asset, tag, expected)
+    if not _populate(cache_dir, name, tag_dir, expected, size, max_size, threads, digest_algorithm(tag_data),
+                     node_cache_grace(grace)):
+        return path
+    return os.path.normpath(os.path.join(cache_dir, name, rel))
@@ -0,0 +1,211 @@
+"""
+Asset prefetch into the page cache.
+
+Tools that map large indexes into memory, like STAR or bwa, start slowly when
+the pages are read from a shared file system as the tool touches them. The
+files of the assets can be loaded into the page cache of the node beforehand,
+e.g. by a workflow engine before it launches a batch of jobs on the node. The
+kernel is advised to read the files ahead (posix_fadvise WILLNEED), which
+returns immediately, and the files are then read through on a pool of
+threads, the largest files first, which waits for the pages. The kernel may
+cap the read-ahead, so advising alone does not load the whole files.
+
+The share of the pages of the files that are in the page cache is determined
+with mincore, where the C library provides it.
+"""
+
+import logging
+import os
+import stat
+from glob import glob
+from multiprocessing.pool import ThreadPool
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["asset_files", "prefetch_files", "resident_bytes", "resident_files", "physical_memory"]
+
+CHUNK_SIZE = 4 * 1024 * 1024
+# mmap and mincore constants, the same on all Linux architectures
+PROT_READ = 1
+MAP_SHARED = 1
+
+
+def asset_files(path):
+    """
+    List the files of an asset, following the links to files
+
+    A path that does not exist is taken as the prefix of the file names, like
+    the seek keys of the index assets, e.g. bowtie2_index.
+
+    :param str path: path to the asset file or directory, or the prefix of the files
+    :return list[(str, int)]: resolved paths to the files and their sizes, without duplicates
+    """
+    candidates = [path]
+    if not os.path.exists(path):
+        candidates = glob(path + ".*")
+    elif os.path.isdir(path):
+        candidates = []
+        for root, dirs, names in os.walk(path):
+            if root == path and BUILD_STATS_DIR in dirs:
+                dirs.remove(BUILD_STATS_DIR)
+            candidates += [os.path.join(root, n) for n in names]
+    files = {}
+    for p in candidates:
+        p = os.path.realpath(p)
+        try:
+            st = os.stat(p)
+        except OSError:
+            _LOGGER.debug("Skipping a broken link: {}".format(p))
+            continue
+        if stat.S_ISREG(st.st_mode):
+            files[p] = st.st_size
+    return sorted(files.items(), key=lambda x: (-x[1], x[0]))
+
+
+def _advise(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        while f.read(CHUNK_SIZE):
+            pass
+
+
+def prefetch_files(paths, threads=8, wait=True):
+    """
+    Load the files into the page cache on a pool of threads
+
+    Without posix_fadvise, e.g. in Python 2, the files are only read through.
+
+    :param list[str] paths: paths to the files, the largest first
+    :param int threads: number of threads to read the files on
+    :param bool wait: whether to read the files through and wait for the
+        pages, otherwise the kernel is only advised to read them ahead
+    :return list[str]: the paths that could not be loaded
+    """
+    advise = hasattr(os, "posix_fadvise")
+    if not advise and not wait:
+        _LOGGER.warning("posix_fadvise is not available, reading the files through")
+        wait = True
+
+    def _load(path, load):
+        try:
+            load(path)
+        except (IOError, OSError) as e:
+            _LOGGER.warning("Could not prefetch '{}': {}".format(path, e))
+            return path
+
+    failed = []
+    pool = ThreadPool(max(1, min(threads, len(paths))))
+    try:
+        if advise:
+            # all the files are advised first, so the file system reads them ahead while the threads read
+            failed = [p for p in pool.map(lambda p: _load(p, _advise), paths, chunksize=16) if p is not None]
+        if wait:
+            failed += [p for p in pool.map(lambda p: _load(p, _read), [p for p in paths if p not in failed],
+                                           chunksize=1) if p is not None]
+    finally:
+        pool.close()
+        pool.join()
+    return failed
+
+
+def _libc():
+    """ Get the C library with mmap, mincore and munmap, None if it is not available """
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.mincore
+    except (ImportError, OSError, AttributeError):
+        return None
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                          ctypes.c_long]
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+    return libc
+
+
+_LIBC = []
+
+
+def resident_bytes(path, size):
+    """
+    Get the number of bytes of a file that are in the page cache
+
+    :param str path: path to the file
+    :param int size: size of the file
+    :return int: number of bytes in the page cache, None if it cannot be determined
+    """
+    import ctypes
+    if not _LIBC:
+        _LIBC.append(_libc())
+    libc = _LIBC[0]
+    if libc is None:
+        return None
+    if size == 0:
+        return 0
+    page = os.sysconf("SC_PAGE_SIZE")
+    pages = (size + page - 1) // page
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        addr = libc.mmap(None, size, PROT_READ, MAP_SHARED, fd, 0)
+        if addr in [None, ctypes.c_void_p(-1).value]:
+            _LOGGER.debug("Could not map '{}': {}".format(path, os.strerror(ctypes.get_errno())))
+            return None
+        try:
+            vec = (ctypes.c_ubyte * pages)()
+            if libc.mincore(ctypes.c_void_p(addr), size, vec) != 0:
+                _LOGGER.debug("mincore failed for '{}': {}".format(path, os.strerror(ctypes.get_errno())))
+                return None
+            # the kernel sets the lowest bit of the pages in the page cache, the others are reserved
+            resident = pages - bytes(bytearray(vec)).count(b"\x00")
+        finally:
+            libc.munmap(ctypes.c_void_p(addr), size)
+    finally:
+        os.close(fd)
+    # the last page is partial
+    return min(size, resident * page)
+
+
+def resident_files(files, threads=8):
+    """
+    Get the number of bytes of the files that are in the page cache, on a pool of threads
+
+    :param list[(str, int)] files: paths to the files and their sizes
+    :param int threads: number of threads to check the files on
+    :return list[int]: numbers of bytes in the page cache, None where they cannot be determined
+    """
+    def _resident(file):
+        try:
+            return resident_bytes(*file)
+        except (IOError, OSError) as e:
+            _LOGGER.debug("Could not check '{}': {}".format(file[0], e))
+            return None
+
+    pool = ThreadPool(max(1, min(threads, len(files))))
+    try:
+        return pool.map(_resident, files, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def physical_memory():
+    """
+    Get the amount of physical memory of the node
+
+    :return int: number of bytes, None if it cannot be determined
+    """
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
@@ -0,0 +1,238 @@
+"""
+Asset build profiling.
+
+Every asset build records the wall time, CPU time and peak memory use of the
+individual recipe commands and of the remaining build phases (digesting,
+checksumming, config lock wait and config write). The profile is saved as a
+JSON file in the asset build stats directory, so that the profiles can be
+aggregated across assets and genomes with `refgenie profile`.
+"""
+
+import json
+import logging
+import os
+import resource
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from glob import glob
+
+from ._version import __version__
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["BuildProfiler", "read_profiles", "aggregate_profiles"]
+
+
+def _cpu_time(who):
+    """
+    Get the CPU time (user + system) consumed so far
+
+    :param int who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN
+    :return float: CPU time in seconds
+    """
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _total_cpu_time():
+    return _cpu_time(resource.RUSAGE_SELF) + _cpu_time(resource.RUSAGE_CHILDREN)
+
+
+def _read_pypiper_profile(path, offset=0):
+    """
+    Read the rows of a pypiper profile file, starting at the provided offset
+
+    :param str path: path to the pypiper profile file (PIPELINE_profile.tsv)
+    :param int offset: byte offset to start reading at
+    :return list[list[str]], int: the rows read and the offset after reading
+    """
+    if not path or not os.path.isfile(path):
+        return [], offset
+    with open(path) as f:
+        f.seek(offset)
+        lines = f.readlines()
+        offset = f.tell()
+    return [l.rstrip("\n").split("\t") for l in lines
+            if l.strip() and not l.startswith("#")], offset
+
+
+def _peak_memory(rows):
+    """
+    Determine the peak memory use reported in pypiper profile rows
+
+    :param list[list[str]] rows: pypiper profile rows
+    :return float | NoneType: peak memory use in GB
+    """
+    mems = []
+    for row in rows:
+        try:
+            mems.append(float(row[4]))
+        except (IndexError, ValueError):
+            continue
+    return max(mems) if mems else None
+
+
+class BuildProfiler(object):
+    """ Collect the timings of a single asset build """
+
+    def __init__(self, genome, asset, tag, recipe):
+        """
+        Create the profiler
+
+        :param str genome: name of the genome the asset is built for
+        :param str asset: name of the asset being built
+        :param str tag: name of the tag being built
+        :param str recipe: name of the recipe used to build the asset
+        """
+        self.genome = genome
+        self.asset = asset
+        self.tag = tag
+        self.recipe = recipe
+        self.status = "running"
+        self.commands = []
+        self.phases = OrderedDict()
+        self._started = datetime.now()
+        self._wall_start = time.time()
+        self._cpu_start = _total_cpu_time()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a build phase. Phases that are entered multiple times are summed.
+
+        :param str name: name of the phase, e.g. 'digesting'
+        """
+        wall, cpu = time.time(), _total_cpu_time()
+        try:
+            yield
+        finally:
+            stats = self.phases.setdefault(name, OrderedDict([("wall_time", 0.0), ("cpu_time", 0.0), ("count", 0)]))
+            stats["wall_time"] += time.time() - wall
+            stats["cpu_time"] += _total_cpu_time() - cpu
+            stats["count"] += 1
+
+    @contextmanager
+    def command(self, cmd, pypiper_profile=None):
+        """
+        Time a single build command.
+
+        The CPU time is the one used by refgenie and its child processes
+        while the command runs, and the peak memory use is taken from the rows
+        that pypiper appends to its own profile file, if the file is provided.
+        The commands run concurrently with others measure their own processes
+        instead: they set 'cpu_time' and 'peak_memory_gb' in the yielded
+        mapping, with None for unknown.
+
+        :param str cmd: the command that is executed
+        :param str pypiper_profile: path to the pypiper profile file
+        """
+        offset = os.path.getsize(pypiper_profile) \
+            if pypiper_profile and os.path.isfile(pypiper_profile) else 0
+        wall, cpu = time.time(), _total_cpu_time()
+        status = "failed"
+        usage = {}
+        try:
+            yield usage
+            status = "completed"
+        finally:
+            rows, _ = _read_pypiper_profile(pypiper_profile, offset)
+            self.commands.append(OrderedDict([
+                ("command", cmd if isinstance(cmd, str) else json.dumps(cmd)),
+                ("status", status),
+                ("wall_time", time.time() - wall),
+                ("cpu_time", usage["cpu_time"] if "cpu_time" in usage else _total_cpu_time() - cpu),
+                ("peak_memory_gb", usage["peak_memory_gb"] if "peak_memory_gb" in usage else _peak_memory(rows))
+            ]))
+
+    def to_dict(self):
+        """
+        Get the profile as a JSON-serializable mapping
+
+        :return Mapping: the build profile
+        """
+        mems = [c["peak_memory_gb"] for c in self.commands if c["peak_memory_gb"] is not None]
+        return OrderedDict([
+            ("genome", self.genome),
+            ("asset", self.asset),
+            ("tag", self.tag),
+            ("recipe", self.recipe),
+            ("status", self.status),
+            ("refgenie_version", __version__),
+            ("started", self._started.strftime("%Y-%m-%d %H:%M:%S")),
+            ("wall_time", time.time() - self._wall_start),
+            ("cpu_time", _total_cpu_time() - self._cpu_start),
+            ("peak_memory_gb", max(mems) if mems else None),
+            ("phases", self.phases),
+            ("commands", self.commands)
+        ])
+
+    def write(self, path):
+        """
+        Save the profile to a JSON file
+
+        :param str path: path to the file to write
+        :return str: path to the written file
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+        _LOGGER.debug("Build profile saved to: {}".format(path))
+        return path
+
+
+def read_profiles(genome_folder, genomes=None, assets=None):
+    """
+    Find and read the build profiles saved in a genome folder
+
+    :param str genome_folder: path to the genome folder to search
+    :param list[str] genomes: genomes to restrict the search to
+    :param list[str] assets: assets to restrict the search to
+    :return list[Mapping]: build profiles
+    """
+    pattern = os.path.join(genome_folder, "*", "*", "*", BUILD_STATS_DIR, TEMPLATE_PROFILE_JSON.format("*", "*"))
+    profiles = []
+    for path in sorted(glob(pattern)):
+        try:
+            with open(path) as f:
+                profile = json.load(f, object_pairs_hook=OrderedDict)
+        except (IOError, ValueError) as e:
+            _LOGGER.warning("Could not read build profile '{}': {}".format(path, e))
+            continue
+        if genomes and profile.get("genome") not in genomes:
+            continue
+        if assets and profile.get("asset") not in assets:
+            continue
+        profile["path"] = path
+        profiles.append(profile)
+    return profiles
+
+
+def aggregate_profiles(profiles):
+    """
+    Summarize build profiles by asset, across genomes
+
+    :param list[Mapping] profiles: build profiles, as returned by read_profiles
+    :return Mapping[str, Mapping]: per-asset summary with build counts, total,
+        mean and max wall times, total CPU time, peak memory and per-phase wall times
+    """
+    summary = OrderedDict()
+    for p in sorted(profiles, key=lambda x: x["asset"]):
+        s = summary.setdefault(p["asset"], OrderedDict([
+            ("builds", 0), ("failed", 0), ("genomes", []), ("total_wall_time", 0.0), ("mean_wall_time", 0.0),
+            ("max_wall_time", 0.0), ("total_cpu_time", 0.0), ("peak_memory_gb", None), ("phases", OrderedDict())]))
+        s["builds"] += 1
+        if p.get("status") != "completed":
+            s["failed"] += 1
+        if p["genome"] not in s["genomes"]:
+            s["genomes"].append(p["genome"])
+        s["total_wall_time"] += p.get("wall_time") or 0.0
+        s["max_wall_time"] = max(s["max_wall_time"], p.get("wall_time") or 0.0)
+        s["total_cpu_time"] += p.get("cpu_time") or 0.0
+        s["mean_wall_time"] = s["total_wall_time"] / s["builds"]
+        if p.get("peak_memory_gb") is not None:
+            s["peak_memory_gb"] = max(s["peak_memory_gb"] or 0.0, p["peak_memory_gb"])
+        for name, stats in (p.get("phases") or {}).items():
+            s["phases"][name] = s["phases"].get(name, 0.0) + stats.get("wall_time", 0.0)
+    return summary
@@ -2,6 +2,9 @@
 
 from argparse import SUPPRESS
 from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 from shutil import rmtree
 from re import sub
 from requests import ConnectionError
@@ -9,19 +12,43 @@ import os
 import sys
 import csv
 import signal
+import subprocess
 import json
+import threading
 
 import pyfaidx
 
 from ._version import __version__
-from .exceptions import MissingGenomeConfigError, MissingFolderError
+from .exceptions import MissingGenomeConfigError, MissingFolderError, ChunkStoreError
 from .asset_build_packages import *
 from .const import *
+from .profiling import BuildProfiler, read_profiles, aggregate_profiles
+from .config_db import DBRefGenConf, is_db_path, config_entries
+from .config_cache import load_cached_rgc
+from .stages import is_stage, is_group, populate_command, format_command, run_stage
+from .bgzf import BgzfFasta, is_bgzf_fasta
+from .audit import verify_assets, verify_cache_path, STATUS_OK
+from .gc import find_orphans, delete_orphans, KIND_UNKNOWN
+from .trash import move_to_trash, empty_trash, empty_trash_in_background
+from .prefetch import asset_files, prefetch_files, resident_files, physical_memory
+from .views import views_folder, refresh_views
+from .dedup import find_duplicates, link_duplicates, LINK_HARD, LINK_REFLINK
+from .node_cache import cached_seek
+from .chunks import export_asset, fetch_manifest, restore_asset
+from .containers import ContainerSession
+from .scratch import make_scratch_dir, publish_asset
+from .checkpoints import checkpoints_path, input_fingerprint, command_fingerprints, read_checkpoints, \
+    write_checkpoints, resume_index, clear_checkpoints
+from .manifest import read_manifest
+from .spool import SpoolRecorder, spool_dir, write_record, pending_records, apply_records, merge_spool
+from .digest import verify_digests, digest_state_path, dir_digest, new_hash, digest_algorithm, STATUS_MISMATCH, \
+    STATUS_MISSING, STATUS_UNDIGESTED
 
 import logmuse
 import pypiper
 import refgenconf
-from refgenconf import RefGenConf, MissingAssetError, MissingGenomeError, MissingRecipeError, DownloadJsonError
+from refgenconf import RefGenConf, MissingAssetError, MissingGenomeError, MissingRecipeError, DownloadJsonError, \
+    RefgenconfError
 from ubiquerg import is_url, query_yes_no, parse_registry_path as prp, VersionInHelpParser, is_command_callable
 from ubiquerg.system import is_writable
 import yacman
@@ -112,24 +139,136 @@ def build_argparser():
         "-r", "--recipe", required=False, default=None, type=str,
         help="Provide a recipe to use.")
 
+    sps[BUILD_CMD].add_argument(
+        "--scratch", required=False, default=None, type=str,
+        help="Run the recipe in a node-local scratch directory and copy the finished asset to the genome folder.")
+
+    for cmd in [BUILD_CMD, INSERT_CMD]:
+        sps[cmd].add_argument(
+            "--digest-algorithm", required=False, default=DEFAULT_DIGEST_ALGORITHM, choices=DIGEST_ALGORITHMS,
+            help="Algorithm to digest the assets with. The genome servers use {}, the default; blake3 and xxh3 are "
+                 "faster, but require the blake3 and xxhash packages.".format(DEFAULT_DIGEST_ALGORITHM))
+
+    sps[BUILD_CMD].add_argument(
+        "--command-workers", required=False, default=None, type=int,
+        help="Maximum number of the independent recipe commands to run at once. Default: number of CPUs.")
+
+    sps[BUILD_CMD].add_argument(
+        "--spool", action="store_true",
+        help="Save the asset registration to the spool directory instead of writing the genome configuration "
+             "file; merge it with 'refgenie {}'. Avoids the file lock contention of concurrent builds.".
+             format(MERGE_CMD))
+
     # add 'genome' argument to many commands
-    for cmd in [PULL_CMD, GET_ASSET_CMD, BUILD_CMD, INSERT_CMD, REMOVE_CMD, GETSEQ_CMD, TAG_CMD, ID_CMD]:
+    for cmd in [PULL_CMD, GET_ASSET_CMD, BUILD_CMD, INSERT_CMD, REMOVE_CMD, GETSEQ_CMD, TAG_CMD, ID_CMD, VERIFY_CMD,
+                CHUNK_CMD, PREFETCH_CMD]:
         # genome is not required for listing actions
         sps[cmd].add_argument(
             "-g", "--genome", required=cmd in GETSEQ_CMD,
             help="Reference assembly ID, e.g. mm10.")
 
-    for cmd in LIST_REMOTE_CMD, LIST_LOCAL_CMD:
+    for cmd in LIST_REMOTE_CMD, LIST_LOCAL_CMD, PROFILE_CMD, GC_CMD, DEDUP_CMD:
         sps[cmd].add_argument("-g", "--genome", required=False, type=str,
                               nargs="*", help="Reference assembly ID, e.g. mm10.")
 
-    for cmd in [PULL_CMD, GET_ASSET_CMD, BUILD_CMD, INSERT_CMD, REMOVE_CMD, TAG_CMD, ID_CMD]:
+    sps[LIST_LOCAL_CMD].add_argument(
+        "--verify", action="store_true",
+        help="Check whether the registered paths of the assets exist and whether the assets are complete.")
+
+    sps[LIST_LOCAL_CMD].add_argument(
+        "--threads", type=int, default=16,
+        help="Number of threads to check the asset paths on. Default: 16.")
+
+    for cmd in [PULL_CMD, GET_ASSET_CMD, BUILD_CMD, INSERT_CMD, REMOVE_CMD, TAG_CMD, ID_CMD, CHUNK_CMD, PREFETCH_CMD]:
+        # the assets to add may be listed in a manifest instead
         sps[cmd].add_argument(
-            "asset_registry_paths", metavar="asset-registry-paths", type=str, nargs='+',
+            "asset_registry_paths", metavar="asset-registry-paths", type=str, nargs='*' if cmd == INSERT_CMD else '+',
             help="One or more registry path strings that identify assets  (e.g. hg38/fasta or hg38/fasta:tag"
-                 + (" or hg38/fasta.fai:tag)." if cmd == GET_ASSET_CMD else ")."))
-
-    for cmd in [PULL_CMD, REMOVE_CMD, INSERT_CMD]:
+                 + (" or hg38/fasta.fai:tag)." if cmd in [GET_ASSET_CMD, PREFETCH_CMD] else ")."))
+
+    sps[VIEWS_CMD].add_argument(
+        "--folder", default=None,
+        help="Path to the views folder to set in the genome configuration, relative to the genome "
+             "configuration file directory unless absolute. The views are refreshed after the commands "
+             "that write the genome configuration.")
+
+    sps[PREFETCH_CMD].add_argument(
+        "--threads", type=int, default=8,
+        help="Number of threads to read the files on. Default: 8.")
+
+    sps[PREFETCH_CMD].add_argument(
+        "--no-wait", action="store_true",
+        help="Only advise the kernel to read the files ahead and return right away. "
+             "The kernel may read less than the whole files.")
+
+    sps[PREFETCH_CMD].add_argument(
+        "--status", action="store_true",
+        help="Only report the share of the files in the page cache.")
+
+    sps[VERIFY_CMD].add_argument(
+        "asset_registry_paths", metavar="asset-registry-paths", type=str, nargs='*',
+        help="Registry path strings that identify the assets to verify (e.g. hg38/fasta or hg38/fasta:tag). "
+             "All the assets, or all the assets of the genome, by default.")
+
+    sps[VERIFY_CMD].add_argument(
+        "--threads", type=int, default=8,
+        help="Number of threads to hash the files on. Default: 8.")
+
+    sps[VERIFY_CMD].add_argument(
+        "--io-limit", type=int, default=4,
+        help="Maximum number of files read at the same time. Default: 4.")
+
+    sps[VERIFY_CMD].add_argument(
+        "--incremental", action="store_true",
+        help="Hash only the files whose size or modification time changed since the previous verification.")
+
+    sps[GC_CMD].add_argument(
+        "--delete", action="store_true",
+        help="Delete the reported files and directories.")
+
+    sps[GC_CMD].add_argument(
+        "--min-age", type=float, default=24,
+        help="Report only the files and directories not modified for this many hours. Default: 24.")
+
+    sps[GC_CMD].add_argument(
+        "--include-unregistered", action="store_true",
+        help="Delete also the unknown directories: the unreferenced directories without refgenie build logs.")
+
+    sps[GC_CMD].add_argument(
+        "--threads", type=int, default=16,
+        help="Number of threads to scan the genome folder and delete the files on. Default: 16.")
+
+    sps[REMOVE_CMD].add_argument(
+        "--background", action="store_true",
+        help="Delete the asset directories in a background process, which outlives this one, "
+             "instead of waiting for the deletion.")
+
+    sps[REMOVE_CMD].add_argument(
+        "--threads", type=int, default=16,
+        help="Number of threads to delete the files on. Default: 16.")
+
+    sps[DEDUP_CMD].add_argument(
+        "-l", "--link", choices=[LINK_HARD, LINK_REFLINK], default=LINK_HARD,
+        help="Type of the links to replace the duplicates with. Reflinks require a file system "
+             "with copy-on-write support, e.g. Btrfs or XFS. Default: {}.".format(LINK_HARD))
+
+    sps[DEDUP_CMD].add_argument(
+        "-n", "--dry-run", action="store_true",
+        help="Only report the identical files and the space that would be reclaimed.")
+
+    sps[DEDUP_CMD].add_argument(
+        "--min-size", type=int, default=1024 * 1024,
+        help="Minimal size in bytes of the files to deduplicate. Default: 1048576.")
+
+    sps[DEDUP_CMD].add_argument(
+        "--threads", type=int, default=8,
+        help="Number of threads to hash the files on. Default: 8.")
+
+    sps[DEDUP_CMD].add_argument(
+        "--io-limit", type=int, default=4,
+        help="Maximum number of files read at the same time. Default: 4.")
+
+    for cmd in [PULL_CMD, REMOVE_CMD, INSERT_CMD, GC_CMD, DEDUP_CMD]:
         sps[cmd].add_argument(
             "-f", "--force", action="store_true",
             help="Do not prompt before action, approve upfront.")
@@ -138,10 +277,36 @@ def build_argparser():
         "-u", "--no-untar", action="store_true",
         help="Do not extract tarballs.")
 
+    sps[PULL_CMD].add_argument(
+        "--chunked", metavar="STORE", default=None,
+        help="URL of, or path to, a chunk store to pull the assets from instead of the servers. "
+             "Only the chunks missing from the local tags of the assets are fetched.")
+
+    sps[CHUNK_CMD].add_argument(
+        "-s", "--store", required=True,
+        help="Path to the chunk store directory.")
+
+    for cmd in [PULL_CMD, CHUNK_CMD]:
+        sps[cmd].add_argument(
+            "--threads", type=int, default=8,
+            help="Number of threads to {} on. Default: 8.".format(
+                "fetch the chunks and write the files" if cmd == PULL_CMD else "chunk the files"))
+
     sps[INSERT_CMD].add_argument(
-        "-p", "--path", required=True,
+        "-p", "--path", required=False, default=None,
         help="Relative local path to asset.")
 
+    sps[INSERT_CMD].add_argument(
+        "-m", "--manifest", required=False, default=None,
+        help="Path to a manifest (TSV or YAML) of the assets to add, with their registry paths, relative local "
+             "paths and optional seek keys. The assets are copied and digested concurrently and registered "
+             "with a single genome configuration file write.")
+
+    sps[INSERT_CMD].add_argument(
+        "--threads", type=int, default=8,
+        help="Number of threads to copy and digest the assets of a manifest, or to digest a single asset, on. "
+             "Default: 8.")
+
     sps[GETSEQ_CMD].add_argument(
         "-l", "--locus", required=True,
         help="Coordinates of desired sequence; e.g. 'chr1:50000-50200'.")
@@ -151,6 +316,21 @@ def build_argparser():
         help="Whether the returned asset path should be checked for existence "
              "on disk.")
 
+    sps[GET_ASSET_CMD].add_argument(
+        "--node-cache", required=False, default=None,
+        help="Path to a node-local cache directory to copy the assets to and return the paths in. "
+             "Optional if {} environment variable is set.".format(NODE_CACHE_ENV_VAR))
+
+    sps[GET_ASSET_CMD].add_argument(
+        "--node-cache-size", required=False, default=None,
+        help="Size limit of the node-local cache, e.g. 500G. Default: {} environment variable or {}.".
+             format(NODE_CACHE_SIZE_ENV_VAR, DEFAULT_NODE_CACHE_SIZE))
+
+    sps[GET_ASSET_CMD].add_argument(
+        "--node-cache-grace", required=False, default=None,
+        help="Time since their last seek during which the cached assets are not evicted, e.g. 12h. "
+             "Default: {} environment variable or {}.".format(NODE_CACHE_GRACE_ENV_VAR, DEFAULT_NODE_CACHE_GRACE))
+
     group = sps[TAG_CMD].add_mutually_exclusive_group(required=True)
 
     group.add_argument(
@@ -161,6 +341,23 @@ def build_argparser():
         "-d", "--default", action="store_true",
         help="Set the selected asset tag as the default one.")
 
+    sps[PROFILE_CMD].add_argument(
+        "-a", "--asset", required=False, type=str, nargs="*",
+        help="Asset name(s) to summarize the build profiles for, e.g. bowtie2_index.")
+
+    sps[PROFILE_CMD].add_argument(
+        "-j", "--json", action="store_true",
+        help="Print the build profiles and their summary in JSON format.")
+
+    sps[CONVERT_CMD].add_argument(
+        "-o", "--output", required=True,
+        help="Path to the converted genome configuration file. The format is determined by the extension: "
+             "{} for the database, YAML otherwise.".format(", ".join(DB_CFG_EXTS)))
+
+    sps[CONVERT_CMD].add_argument(
+        "-f", "--force", action="store_true",
+        help="Do not prompt before overwriting the output file, approve upfront.")
+
     sps[SUBSCRIBE_CMD].add_argument(
         "-r", "--reset", action="store_true",
         help="Overwrite the current list of server URLs.")
@@ -237,18 +434,15 @@ def get_asset_vars(genome, asset_key, tag, outfolder, specific_args=None, specif
     return asset_vars
 
 
-def refgenie_add(rgc, asset_dict, path, force=False):
+def _add_paths(rgc, asset_dict, path):
     """
-    Add an external asset to the config.
-    File existence is checked and asset files are transferred to the selected
-    tag subdirectory
+    Determine the paths of an external asset to add
 
     :param refgenconf.RefGenConf rgc: genome configuration object
     :param dict asset_dict: a single parsed registry path
-    :param str path: the path provided by the user. Must be relative to the
-        specific genome directory
-    :param bool force: whether the replacement of a possibly existing asset
-        should be forced
+    :param str path: the path provided by the user, relative to the genome directory
+    :return str, str, str, str: the path relative to the genome directory, the tag,
+        the absolute path to the asset and the path to the tag directory
     """
     # remove the first directory from the provided path if it is the genome name
     path = os.path.join(*path.split(os.sep)[1:]) \
@@ -262,30 +456,54 @@ def refgenie_add(rgc, asset_dict, path, force=False):
         # if seek_key is not specified we're about to move a directory to
         # the tag subdir
         tag_path = os.path.join(abs_asset_path, tag)
-        from shutil import copytree as cp
     else:
         # if seek_key is specified we're about to move just a single file to
-        # he tag subdir
+        # the tag subdir
         tag_path = os.path.join(os.path.dirname(abs_asset_path), tag)
+    return path, tag, abs_asset_path, tag_path
+
+
+def _add_target(asset_dict, abs_asset_path, tag_path):
+    """ Get the path the external asset is copied to """
+    return tag_path if asset_dict["seek_key"] is None \
+        else os.path.join(tag_path, os.path.basename(abs_asset_path))
+
+
+def _transfer_asset(asset_dict, abs_asset_path, tag_path):
+    """
+    Copy an external asset to the tag directory, replacing a previous copy
+
+    :param dict asset_dict: a single parsed registry path
+    :param str abs_asset_path: absolute path to the asset
+    :param str tag_path: path to the tag directory
+    """
+    target = _add_target(asset_dict, abs_asset_path, tag_path)
+    if os.path.exists(target):
+        _remove(target)
+    if asset_dict["seek_key"] is None:
+        from shutil import copytree
+        copytree(abs_asset_path, tag_path)
+    else:
         if not os.path.exists(tag_path):
             os.makedirs(tag_path)
-        from shutil import copy2 as cp
-    if os.path.exists(abs_asset_path):
-        if not os.path.exists(tag_path):
-            cp(abs_asset_path, tag_path)
-        else:
-            if not force and not \
-                    query_yes_no("Path '{}' exists. Do you want to overwrite?".
-                                         format(tag_path)):
-                return False
-            else:
-                _remove(tag_path)
-                cp(abs_asset_path, tag_path)
-    else:
-        raise OSError("Absolute path '{}' does not exist. "
-                      "The provided path must be relative to: {}".
-                      format(abs_asset_path, rgc[CFG_FOLDER_KEY]))
-    rgc.make_writable()
+        from shutil import copy2
+        copy2(abs_asset_path, target)
+
+
+def _register_added(rgc, asset_dict, tag, path, abs_asset_path, digest, seek_keys=None,
+                    algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """
+    Register an external asset copied to the tag directory
+
+    :param refgenconf.RefGenConf rgc: writable genome configuration object
+    :param dict asset_dict: a single parsed registry path
+    :param str tag: tag name
+    :param str path: the path relative to the genome directory
+    :param str abs_asset_path: absolute path to the asset
+    :param str digest: the asset digest
+    :param Mapping[str, str] seek_keys: additional seek keys, relative to the tag directory
+    :param str algorithm: the algorithm of the asset digest
+    """
     gat_bundle = [asset_dict["genome"], asset_dict["asset"], tag]
     td = {CFG_ASSET_PATH_KEY:
               path if os.path.isdir(abs_asset_path) else os.path.dirname(path)}
@@ -294,18 +512,110 @@ def refgenie_add(rgc, asset_dict, path, force=False):
     seek_key_value = os.path.basename(abs_asset_path) \
         if asset_dict["seek_key"] is not None else "."
     sk = {asset_dict["seek_key"] or asset_dict["asset"]: seek_key_value}
+    sk.update(seek_keys or {})
     rgc.update_seek_keys(*gat_bundle, keys=sk)
     rgc.set_default_pointer(asset_dict["genome"], asset_dict["asset"], tag)
-    # a separate update_tags call since we want to use the get_asset method
-    # that requires a complete asset entry in rgc
-    td = {CFG_ASSET_CHECKSUM_KEY: get_dir_digest(_seek(rgc, *gat_bundle))}
-    rgc.update_tags(*gat_bundle, data=td)
+    rgc.update_tags(*gat_bundle, data={CFG_ASSET_CHECKSUM_KEY: digest, CFG_ASSET_DIGEST_ALGORITHM_KEY: algorithm})
+
+
+def refgenie_add(rgc, asset_dict, path, force=False, algorithm=DEFAULT_DIGEST_ALGORITHM, threads=8):
+    """
+    Add an external asset to the config.
+    File existence is checked and asset files are transferred to the selected
+    tag subdirectory
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param dict asset_dict: a single parsed registry path
+    :param str path: the path provided by the user. Must be relative to the
+        specific genome directory
+    :param bool force: whether the replacement of a possibly existing asset
+        should be forced
+    :param str algorithm: algorithm to digest the asset with
+    :param int threads: number of threads to digest the files on
+    """
+    path, tag, abs_asset_path, tag_path = _add_paths(rgc, asset_dict, path)
+    if not os.path.exists(abs_asset_path):
+        raise OSError("Absolute path '{}' does not exist. "
+                      "The provided path must be relative to: {}".
+                      format(abs_asset_path, rgc[CFG_FOLDER_KEY]))
+    target = _add_target(asset_dict, abs_asset_path, tag_path)
+    if os.path.exists(target) and not force and not \
+            query_yes_no("Path '{}' exists. Do you want to overwrite?".format(target)):
+        return False
+    _transfer_asset(asset_dict, abs_asset_path, tag_path)
+    rgc.make_writable()
+    _register_added(rgc, asset_dict, tag, path, abs_asset_path,
+                    dir_digest(tag_path, threads=threads, algorithm=algorithm), algorithm=algorithm)
     # Write the updated refgenie genome configuration
     rgc.write()
     rgc.make_readonly()
     return True
 
 
+def refgenie_add_manifest(rgc, manifest, genome=None, force=False, threads=8, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """
+    Add the external assets listed in a manifest to the config
+
+    The assets are copied to their tag directories and digested on a pool of
+    threads, and then registered all at once, with a single genome
+    configuration file write. The assets that fail to copy are not registered.
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param str manifest: path to the manifest, see refgenie.manifest
+    :param str genome: genome of the registry paths that do not specify one
+    :param bool force: whether the replacement of the existing assets should be forced
+    :param int threads: number of threads to copy and digest the assets on
+    :param str algorithm: algorithm to digest the assets with
+    :return bool: whether all the assets were added
+    """
+    jobs = []
+    missing = []
+    for entry in read_manifest(manifest):
+        asset_dict = parse_registry_path(entry["registry_path"])
+        asset_dict["genome"] = asset_dict["genome"] or genome
+        if not asset_dict["genome"] or not asset_dict["asset"]:
+            raise ValueError("Invalid registry path in the manifest: {}".format(entry["registry_path"]))
+        path, tag, abs_asset_path, tag_path = _add_paths(rgc, asset_dict, entry["path"])
+        rp = "{}/{}:{}".format(asset_dict["genome"], asset_dict["asset"], tag)
+        if rp in [j[0] for j in jobs]:
+            raise ValueError("Asset '{}' is listed in the manifest more than once".format(rp))
+        if not os.path.exists(abs_asset_path):
+            missing.append(abs_asset_path)
+        jobs.append((rp, asset_dict, tag, path, abs_asset_path, tag_path, entry["seek_keys"]))
+    if missing:
+        raise OSError("Absolute paths do not exist: {}. The provided paths must be relative to the genome "
+                      "directories in: {}".format(", ".join(missing), rgc[CFG_FOLDER_KEY]))
+    existing = [j for j in jobs if os.path.exists(_add_target(j[1], j[4], j[5]))]
+    if existing and not force and not query_yes_no(
+            "{} of the assets exist ({}). Do you want to overwrite them?".
+            format(len(existing), ", ".join([j[0] for j in existing]))):
+        _LOGGER.info("Skipping the existing assets")
+        jobs = [j for j in jobs if j not in existing]
+
+    def _transfer(job):
+        rp, asset_dict, _, _, abs_asset_path, tag_path, _ = job
+        try:
+            _transfer_asset(asset_dict, abs_asset_path, tag_path)
+            return dir_digest(tag_path, threads=max(1, threads // len(jobs)), algorithm=algorithm)
+        except Exception as e:
+            _LOGGER.error("Could not add '{}' ({}): {}".format(rp, e.__class__.__name__, e))
+
+    _LOGGER.info("Adding {} assets".format(len(jobs)))
+    pool = ThreadPool(max(1, min(threads, len(jobs))))
+    try:
+        digests = pool.map(_transfer, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    added = [(j, d) for j, d in zip(jobs, digests) if d is not None]
+    if added:
+        with rgc as r:
+            for (_, asset_dict, tag, path, abs_asset_path, _, seek_keys), digest in added:
+                _register_added(r, asset_dict, tag, path, abs_asset_path, digest, seek_keys, algorithm)
+    _LOGGER.info("Added {} of {} assets".format(len(added), len(jobs)))
+    return len(added) == len(jobs)
+
+
 def refgenie_initg(rgc, genome, content_checksums):
     """
     Initializing a genome means adding `collection_checksum` attributes in the
@@ -338,8 +648,13 @@ def refgenie_build(gencfg, genome, asset_list, recipe_name, args):
 
     :param str gencfg: path to the genome configuration file
     :param argparse.Namespace args: parsed command-line options/arguments
+    :return bool: whether all the assets were built; the build stops at the first failed one
     """
-    rgc = RefGenConf(filepath=gencfg, writable=False)
+    rgc = _load_rgc(gencfg)
+    spool = spool_dir(gencfg) if getattr(args, "spool", False) else None
+    algorithm = getattr(args, "digest_algorithm", None) or DEFAULT_DIGEST_ALGORITHM
+    # fail before building if the package that implements the algorithm is missing
+    new_hash(algorithm)
     specified_args = _parse_user_build_input(args.files)
     specified_params = _parse_user_build_input(args.params)
 
@@ -355,7 +670,8 @@ def refgenie_build(gencfg, genome, asset_list, recipe_name, args):
                       format(args.config_file))
         args.config_file = default_config_file()
 
-    def build_asset(genome, asset_key, tag, build_pkg, genome_outfolder, specific_args, specific_params, **kwargs):
+    def build_asset(genome, asset_key, tag, build_pkg, genome_outfolder, specific_args, specific_params,
+                    profiler, **kwargs):
         """
         Builds assets with pypiper and updates a genome config file.
 
@@ -367,17 +683,32 @@ def refgenie_build(gencfg, genome, asset_list, recipe_name, args):
         :param dict build_pkg: A dict (see examples) specifying lists
             of required input_assets, commands to run, and outputs to register as
             assets.
+        :param refgenie.profiling.BuildProfiler profiler: profiler to record the build timings with
         """
 
         log_outfolder = os.path.abspath(os.path.join(genome_outfolder, asset_key, tag, BUILD_STATS_DIR))
-        _LOGGER.info("Saving outputs to:\n- content: {}\n- logs: {}".format(genome_outfolder, log_outfolder))
-        if args.docker:
-            # Set up some docker stuff
-            if args.volumes:
-                # TODO: is volumes list defined here?
-                volumes = volumes.append(genome_outfolder)
+        target = os.path.join(log_outfolder, TEMPLATE_TARGET.format(genome, asset_key, tag))
+        checkpoints_file = checkpoints_path(log_outfolder, asset_key, tag)
+        # the commands are skipped by pypiper once the target flag exists, with no need for checkpoints
+        checkpointing = args.new_start or not os.path.exists(target)
+        checkpoints = read_checkpoints(checkpoints_file) if checkpointing and not args.new_start else {}
+        # the recipe commands write to the scratch directory, unless they are skipped;
+        # a failed build resumes in the scratch build directory it left in place
+        build_outfolder = genome_outfolder
+        if args.scratch and checkpointing:
+            previous = checkpoints.get("outfolder")
+            scratch = os.path.abspath(os.path.expandvars(os.path.expanduser(args.scratch)))
+            if previous and os.path.isdir(previous) and previous.startswith(scratch + os.sep):
+                build_outfolder = previous
             else:
-                volumes = genome_outfolder
+                build_outfolder = make_scratch_dir(args.scratch, genome, asset_key, tag)
+        _LOGGER.info("Saving outputs to:\n- content: {}\n- logs: {}".format(build_outfolder, log_outfolder))
+        if args.docker:
+            # mount the genome and scratch folders and the directories of the inputs;
+            # the session mounts the folders requested by the user in all the containers
+            volumes = [genome_outfolder] + ([args.scratch] if build_outfolder != genome_outfolder else []) + \
+                [os.path.dirname(os.path.abspath(v)) for v in list((specific_args or {}).values()) +
+                 list(kwargs.values()) if isinstance(v, str) and os.path.exists(v)]
 
         if not _writeable(genome_outfolder):
             _LOGGER.error("Insufficient permissions to write to output folder: {}".
@@ -387,143 +718,617 @@ def refgenie_build(gencfg, genome, asset_list, recipe_name, args):
         pm = pypiper.PipelineManager(name="refgenie", outfolder=log_outfolder, args=args)
         tk = pypiper.NGSTk(pm=pm)
         if args.docker:
-            pm.get_container(build_pkg[CONT], volumes)
+            # all the commands of all the assets run in one container per image
+            pm.container = session.container(build_pkg[CONT], volumes)
         _LOGGER.debug("Asset build package: " + str(build_pkg))
         gat = [genome, asset_key, tag]  # create a bundle list to simplify calls below
         # collect variables required to populate the command templates
-        asset_vars = get_asset_vars(genome, asset_key, tag, genome_outfolder, specific_args, specific_params, **kwargs)
+        asset_vars = get_asset_vars(genome, asset_key, tag, build_outfolder, specific_args, specific_params, **kwargs)
         # populate command templates
         # prior to populating, remove any seek_key parts from the keys, since these are not supported by format method
-        command_list_populated = [x.format(**{k.split(".")[0]: v for k, v in asset_vars.items()})
-                                  for x in build_pkg[CMD_LST]]
+        template_vars = {k.split(".")[0]: v for k, v in asset_vars.items()}
+        command_list_populated = [populate_command(x, template_vars) for x in build_pkg[CMD_LST]]
         # create output directory
         tk.make_dir(asset_vars["asset_outfolder"])
+        # the commands completed by a previous, failed build are not run again
+        fingerprints = command_fingerprints(command_list_populated, input_fingerprint(
+            [v for v in list((specific_args or {}).values()) + list(kwargs.values()) if isinstance(v, str)]))
+        resume_at = resume_index(checkpoints, fingerprints)
+        if args.new_start:
+            clear_checkpoints(checkpoints_file)
+        elif resume_at:
+            _LOGGER.info("Resuming the build at command {} of {}; the preceding ones completed in a previous build".
+                         format(resume_at + 1, len(fingerprints)))
 
-        target = os.path.join(log_outfolder, TEMPLATE_TARGET.format(genome, asset_key, tag))
         # add target command
         command_list_populated.append("touch {target}".format(target=target))
-        _LOGGER.debug("Command populated: '{}'".format(" ".join(command_list_populated)))
+        _LOGGER.debug("Command populated: '{}'".format(" ".join([format_command(x) for x in command_list_populated])))
         try:
             # run build command
             signal.signal(signal.SIGINT, _handle_sigint(gat))
-            pm.run(command_list_populated, target, container=pm.container)
+            # commands are run one by one, with the same target, so that the
+            # whole list is still skipped once the target flag exists
+            with profiler.phase(PHASE_COMMANDS):
+                for i, cmd in enumerate(command_list_populated):
+                    if i < resume_at:
+                        _LOGGER.info("Command completed in a previous build, skipping: {}".
+                                     format(format_command(cmd)))
+                        continue
+                    if is_group(cmd):
+                        _run_group(pm, cmd, target, profiler, args.command_workers)
+                    else:
+                        with profiler.command(cmd, pm.pipeline_profile_file):
+                            _run_command(pm, cmd, target)
+                    if checkpointing and i < len(fingerprints):
+                        write_checkpoints(checkpoints_file, build_outfolder, fingerprints[:i + 1])
         except pypiper.exceptions.SubprocessError:
             _LOGGER.error("asset '{}' build failed".format(asset_key))
+            if build_outfolder != genome_outfolder:
+                _LOGGER.info("Scratch build directory has been left in place: {}".format(build_outfolder))
+            if os.path.exists(checkpoints_file):
+                _LOGGER.info("Rerun the build with --recover to resume it at the failed command, "
+                             "or with --new-start to start over")
             return False
         else:
+            clear_checkpoints(checkpoints_file)
+            published_digest = None
+            if build_outfolder != genome_outfolder:
+                _LOGGER.info("Publishing the asset to: {}".format(os.path.join(genome_outfolder, asset_key, tag)))
+                with profiler.phase(PHASE_PUBLISH):
+                    published_digest = publish_asset(asset_vars["asset_outfolder"],
+                                                     os.path.join(genome_outfolder, asset_key, tag),
+                                                     algorithm=algorithm)
+                rmtree(os.path.dirname(build_outfolder), ignore_errors=True)
             # save build recipe to the JSON-formatted file
             recipe_file_name = TEMPLATE_RECIPE_JSON.format(asset_key, tag)
             with open(os.path.join(log_outfolder, recipe_file_name), 'w') as outfile:
                 json.dump(build_pkg, outfile)
             # update and write refgenie genome configuration
-            with rgc as r:
+            with _profiled_lock(rgc, profiler, spool) as r:
                 r.update_assets(*gat[0:2], data={CFG_ASSET_DESC_KEY: build_pkg[DESC]})
                 r.update_tags(*gat, data={CFG_ASSET_PATH_KEY: asset_key})
                 r.update_seek_keys(*gat, keys={k: v.format(**asset_vars) for k, v in build_pkg[ASSETS].items()})
                 # in order to conveniently get the path to digest we update the tags metadata in two steps
-                digest = get_dir_digest(r.get_asset(genome, asset_key, tag, enclosing_dir=True), pm)
-                r.update_tags(*gat, data={CFG_ASSET_CHECKSUM_KEY: digest})
+                # the published asset was digested while being copied
+                with profiler.phase(PHASE_DIGEST):
+                    asset_dir = r.get_asset(genome, asset_key, tag, enclosing_dir=True)
+                    digest = published_digest or (get_dir_digest(asset_dir, pm)
+                                                  if algorithm == DEFAULT_DIGEST_ALGORITHM
+                                                  else dir_digest(asset_dir, algorithm=algorithm))
+                r.update_tags(*gat, data={CFG_ASSET_CHECKSUM_KEY: digest, CFG_ASSET_DIGEST_ALGORITHM_KEY: algorithm})
                 _LOGGER.info("Asset digest: {}".format(digest))
                 r.set_default_pointer(*gat)
         pm.stop_pipeline()
         return True
 
+    with ContainerSession(volumes=args.volumes if args.docker else None) as session:
+        for a in asset_list:
+            asset_key = a["asset"]
+            asset_tag = a["tag"] or rgc.get_default_tag(genome, a["asset"], use_existing=False)
+            asset_recipe = recipe_name or asset_key
+
+            if asset_recipe in asset_build_packages.keys():
+                asset_build_package = _check_recipe(asset_build_packages[asset_recipe])
+                # handle user-requested parents for the required assets
+                input_assets = {}
+                parent_assets = []
+                specified_asset_keys, specified_assets = None, None
+                if args.assets is not None:
+                    parsed_parents_input = _parse_user_build_input(args.assets)
+                    specified_asset_keys, specified_assets = \
+                        list(parsed_parents_input.keys()), list(parsed_parents_input.values())
+                    _LOGGER.debug("Custom assets requested: {}".format(args.assets))
+                if not specified_asset_keys and isinstance(args.assets, list):
+                    _LOGGER.warning("Specified parent assets format is invalid. Using defaults.")
+                for req_asset in asset_build_package[REQ_ASSETS]:
+                    req_asset_data = parse_registry_path(req_asset[KEY])
+                    # for each req asset see if non-default parents were requested
+                    if specified_asset_keys is not None and req_asset_data["asset"] in specified_asset_keys:
+                        parent_data = \
+                            parse_registry_path(specified_assets[specified_asset_keys.index(req_asset_data["asset"])])
+                        g, a, t, s = parent_data["genome"], \
+                                     parent_data["asset"], \
+                                     parent_data["tag"] or rgc.get_default_tag(genome, parent_data["asset"]), \
+                                     parent_data["seek_key"]
+                    else:  # if no custom parents requested for the req asset, use default one
+                        default = parse_registry_path(req_asset[DEFAULT])
+                        g, a, t, s = genome, default["asset"], \
+                                     rgc.get_default_tag(genome, default["asset"]), \
+                                     req_asset_data["seek_key"]
+                    parent_assets.append("{}/{}:{}".format(g, a, t))
+                    input_assets[req_asset[KEY]] = _seek(rgc, g, a, t, s)
+                _LOGGER.debug("Using parents: {}".format(", ".join(parent_assets)))
+                _LOGGER.debug("Provided files: {}".format(specified_args))
+                _LOGGER.debug("Provided parameters: {}".format(specified_params))
+                for required_file in asset_build_package[REQ_FILES]:
+                    if specified_args is None or required_file[KEY] not in specified_args.keys():
+                        raise ValueError("Path to the '{x}' input ({desc}) is required, but not provided. "
+                                         "Specify it with: --files {x}=/path/to/{x}_file"
+                                         .format(x=required_file[KEY], desc=required_file[DESC]))
+                for required_param in asset_build_package[REQ_PARAMS]:
+                    if specified_params is None:
+                        specified_params = {}
+                    if required_param[KEY] not in specified_params.keys():
+                        if required_param[DEFAULT] is None:
+                            raise ValueError("Value for the parameter '{x}' ({desc}) is required, but not provided. "
+                                             "Specify it with: --params {x}=value"
+                                             .format(x=required_param[KEY], desc=required_param[DESC]))
+                        else:
+                            specified_params.update({required_param[KEY]: required_param[DEFAULT]})
+                genome_outfolder = os.path.join(args.outfolder, genome)
+                _LOGGER.info("Building '{}/{}:{}' using '{}' recipe".format(genome, asset_key, asset_tag, asset_recipe))
+                if asset_recipe in FASTA_RECIPES and genome in rgc.genomes_list() \
+                        and 'fasta' in rgc.list_assets_by_genome(genome):
+                    _LOGGER.warning("'{g}' genome is already initialized with other fasta asset ({g}/{a}:{t}). "
+                                    "It will be re-initialized.".format(g=genome, a=asset_key, t=asset_tag))
+                log_outfolder = os.path.abspath(os.path.join(genome_outfolder, asset_key, asset_tag, BUILD_STATS_DIR))
+                profile_path = os.path.join(log_outfolder, TEMPLATE_PROFILE_JSON.format(asset_key, asset_tag))
+                profiler = BuildProfiler(genome, asset_key, asset_tag, asset_recipe)
+                if not build_asset(genome, asset_key, asset_tag, asset_build_package, genome_outfolder,
+                                   specified_args, specified_params, profiler, **input_assets):
+                    log_path = os.path.join(log_outfolder, ORI_LOG_NAME)
+                    _LOGGER.info("'{}/{}:{}' was not added to the config, but directory has been left in place. "
+                                 "See the log file for details: {}".format(genome, asset_key, asset_tag, log_path))
+                    if os.path.isdir(log_outfolder):
+                        profiler.status = "failed"
+                        profiler.write(profile_path)
+                    return False
+                # If the recipe was a fasta, we init the genome
+                if asset_recipe in FASTA_RECIPES:
+                    _LOGGER.info("Computing initial genome digest...")
+                    with profiler.phase(PHASE_CHECKSUM):
+                        collection_checksum, content_checksums = \
+                            fasta_checksum(_seek(rgc, genome, asset_key, asset_tag, "fasta"))
+                    _LOGGER.info("Initializing genome...")
+                    refgenie_initg(rgc, genome, content_checksums)
+                _LOGGER.info("Finished building '{}' asset".format(asset_key))
+                with _profiled_lock(rgc, profiler, spool) as r:
+                    # update asset relationships
+                    r.update_relatives_assets(genome, asset_key, asset_tag, parent_assets)  # adds parents
+                    for i in parent_assets:
+                        parsed_parent = parse_registry_path(i)
+                        # adds child (currently built asset) to the parent
+                        r.update_relatives_assets(parsed_parent["genome"], parsed_parent["asset"], parsed_parent["tag"],
+                                                       ["{}/{}:{}".format(genome, asset_key, asset_tag)], True)
+                    if args.genome_description is not None:
+                        _LOGGER.debug("adding genome ({}) description: '{}'".format(genome, args.genome_description))
+                        r.update_genomes(genome, {CFG_GENOME_DESC_KEY: args.genome_description})
+                    if args.tag_description is not None:
+                        _LOGGER.debug("adding tag ({}/{}:{}) description: '{}'".format(genome, asset_key, asset_tag,
+                                                                                       args.tag_description))
+                        r.update_tags(genome, asset_key, asset_tag, {CFG_TAG_DESC_KEY: args.tag_description})
+                    if asset_recipe in FASTA_RECIPES:
+                        # to save config lock time when building fasta assets
+                        # (genome initialization takes some time for large genomes) we repeat the
+                        # conditional here for writing the computed genome digest
+                        r.update_genomes(genome, data={CFG_CHECKSUM_KEY: collection_checksum})
+                profiler.status = "completed"
+                profiler.write(profile_path)
+            else:
+                _raise_missing_recipe_error(asset_recipe)
+    return True
+
+
+def refgenie_verify_list(rgc, genomes=None, threads=16, cache_file=None):
+    """
+    Report the local assets that have missing paths or are incomplete
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[str] genomes: genomes to check the assets of, all by default
+    :param int threads: number of threads to check the paths on
+    :param str cache_file: path to the verification cache file
+    :return bool: whether all the assets are complete and all their paths exist
+    """
+    results = verify_assets(rgc, genomes=genomes, threads=threads, cache_file=cache_file)
+    problems = [r for r in results if r[1] != STATUS_OK]
+    for rp, status, details in problems:
+        _LOGGER.info("{} ({}): {}".format(rp, status, ", ".join(details)))
+    _LOGGER.info("Verified {} asset tags: {} OK, {} with problems".
+                 format(len(results), len(results) - len(problems), len(problems)))
+    return not problems
+
+
+def refgenie_verify(rgc, asset_list=None, genome=None, threads=8, io_limit=4, state_file=None,
+                    incremental=False):
+    """
+    Recalculate the digests of the local assets and report the ones that do
+    not match the registered digests
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[dict] asset_list: assets to verify, all the assets by default
+    :param str genome: genome to verify the assets of if the assets are not selected, all by default
+    :param int threads: number of threads to hash the files on
+    :param int io_limit: maximum number of files read at the same time
+    :param str state_file: path to the file to save the digests of the files to
+    :param bool incremental: whether to hash only the files that changed since the previous verification
+    :return bool: whether the digests of all the assets match
+    """
+    tags = []
+    if asset_list:
+        for a in asset_list:
+            try:
+                tag = a["tag"] or rgc.get_default_tag(a["genome"], a["asset"])
+                rgc[CFG_GENOMES_KEY][a["genome"]][CFG_ASSETS_KEY][a["asset"]][CFG_ASSET_TAGS_KEY][tag]
+            except (KeyError, MissingAssetError, MissingGenomeError):
+                _LOGGER.error("Asset '{}/{}:{}' does not exist".format(a["genome"], a["asset"], a["tag"]))
+                return False
+            tags.append((a["genome"], a["asset"], tag))
+    else:
+        for g in sorted(rgc[CFG_GENOMES_KEY].keys()):
+            if genome and g != genome:
+                continue
+            for asset, asset_data in rgc[CFG_GENOMES_KEY][g].get(CFG_ASSETS_KEY, {}).items():
+                tags.extend([(g, asset, tag) for tag in asset_data.get(CFG_ASSET_TAGS_KEY, {}).keys()])
+    results = verify_digests(rgc, tags, threads=threads, io_limit=io_limit, state_file=state_file,
+                             incremental=incremental)
+    for rp, status, expected, actual in results:
+        if status == STATUS_MISMATCH:
+            _LOGGER.info("{} ({}): registered {}, calculated {}".format(rp, status, expected, actual))
+        elif status in [STATUS_MISSING, STATUS_UNDIGESTED]:
+            _LOGGER.info("{} ({})".format(rp, status))
+    failed = [r for r in results if r[1] in [STATUS_MISMATCH, STATUS_MISSING]]
+    _LOGGER.info("Verified {} asset tags: {} OK, {} failed, {} without a registered digest".
+                 format(len(results), len([r for r in results if r[1] == STATUS_OK]), len(failed),
+                        len([r for r in results if r[1] == STATUS_UNDIGESTED])))
+    return not failed
+
+
+def refgenie_gc(rgc, genomes=None, delete=False, force=False, min_age=24, threads=16,
+                include_unregistered=False):
+    """
+    Report the files and directories in the genome folder that the genome
+    configuration does not reference and optionally delete them
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[str] genomes: genomes to scan, all by default
+    :param bool delete: whether the reported files and directories should be deleted
+    :param bool force: whether the deletion prompt should be skipped
+    :param float min_age: minimal age in hours of the reported files and directories
+    :param int threads: number of threads to scan the genome folder and delete the files on
+    :param bool include_unregistered: whether the directories without refgenie build logs
+        should be collected as well; otherwise they are only listed
+    :return bool: whether the reported files and directories were all deleted
+    """
+    orphans = find_orphans(rgc, genomes=genomes, threads=threads, min_age=min_age)
+    unknown = [o for o in orphans if o[1] == KIND_UNKNOWN and not include_unregistered]
+    orphans = [o for o in orphans if o not in unknown]
+    row = "{:<20}{:>12}  {}"
+    if unknown:
+        print("Directories without refgenie build logs, collected only with --include-unregistered:")
+        print(row.format("kind", "size [GB]", "path"))
+        for path, kind, size in unknown:
+            print(row.format(kind, "{:.2f}".format(size / 1e9), path))
+    if not orphans:
+        _LOGGER.info("Nothing to collect in: {}".format(rgc[CFG_FOLDER_KEY]))
+        return True
+    if unknown:
+        print("Collected files and directories:")
+    print(row.format("kind", "size [GB]", "path"))
+    for path, kind, size in orphans:
+        print(row.format(kind, "{:.2f}".format(size / 1e9), path))
+    total = sum([size for _, _, size in orphans])
+    _LOGGER.info("Reclaimable: {:.2f} GB in {} files and directories".format(total / 1e9, len(orphans)))
+    if not delete:
+        return False
+    if not force and not query_yes_no("Delete {} files and directories?".format(len(orphans))):
+        _LOGGER.info("Action aborted by the user")
+        return False
+    failed = delete_orphans([path for path, _, _ in orphans], threads=threads)
+    _LOGGER.info("Deleted {} files and directories".format(len(orphans) - len(failed)))
+    return not failed
+
+
+def refgenie_remove(rgc, asset_list, force=False, background=False, threads=16):
+    """
+    Remove assets from the genome configuration and delete their directories
+
+    The genome configuration file is written once, and the directories are
+    moved to the trash directory of the genome folder before they are deleted,
+    so the removal is done as soon as the file is written. Like with
+    RefGenConf.remove, the asset and genome directories are deleted as well
+    once their last tag or asset is removed.
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[dict] asset_list: genomes, assets and tags to remove
+    :param bool force: whether the prompt should be skipped
+    :param bool background: whether the directories should be deleted in a detached process
+    :param int threads: number of threads to delete the files on
+    :return bool: whether the assets were removed and their directories deleted or left to the background process
+    """
+    bundles = []
     for a in asset_list:
-        asset_key = a["asset"]
-        asset_tag = a["tag"] or rgc.get_default_tag(genome, a["asset"], use_existing=False)
-        recipe_name = recipe_name or asset_key
-
-        if recipe_name in asset_build_packages.keys():
-            asset_build_package = _check_recipe(asset_build_packages[recipe_name])
-            # handle user-requested parents for the required assets
-            input_assets = {}
-            parent_assets = []
-            specified_asset_keys, specified_assets = None, None
-            if args.assets is not None:
-                parsed_parents_input = _parse_user_build_input(args.assets)
-                specified_asset_keys, specified_assets = \
-                    list(parsed_parents_input.keys()), list(parsed_parents_input.values())
-                _LOGGER.debug("Custom assets requested: {}".format(args.assets))
-            if not specified_asset_keys and isinstance(args.assets, list):
-                _LOGGER.warning("Specified parent assets format is invalid. Using defaults.")
-            for req_asset in asset_build_package[REQ_ASSETS]:
-                req_asset_data = parse_registry_path(req_asset[KEY])
-                # for each req asset see if non-default parents were requested
-                if specified_asset_keys is not None and req_asset_data["asset"] in specified_asset_keys:
-                    parent_data = \
-                        parse_registry_path(specified_assets[specified_asset_keys.index(req_asset_data["asset"])])
-                    g, a, t, s = parent_data["genome"], \
-                                 parent_data["asset"], \
-                                 parent_data["tag"] or rgc.get_default_tag(genome, parent_data["asset"]), \
-                                 parent_data["seek_key"]
-                else:  # if no custom parents requested for the req asset, use default one
-                    default = parse_registry_path(req_asset[DEFAULT])
-                    g, a, t, s = genome, default["asset"], \
-                                 rgc.get_default_tag(genome, default["asset"]), \
-                                 req_asset_data["seek_key"]
-                parent_assets.append("{}/{}:{}".format(g, a, t))
-                input_assets[req_asset[KEY]] = _seek(rgc, g, a, t, s)
-            _LOGGER.debug("Using parents: {}".format(", ".join(parent_assets)))
-            _LOGGER.debug("Provided files: {}".format(specified_args))
-            _LOGGER.debug("Provided parameters: {}".format(specified_params))
-            for required_file in asset_build_package[REQ_FILES]:
-                if specified_args is None or required_file[KEY] not in specified_args.keys():
-                    raise ValueError("Path to the '{x}' input ({desc}) is required, but not provided. "
-                                     "Specify it with: --files {x}=/path/to/{x}_file"
-                                     .format(x=required_file[KEY], desc=required_file[DESC]))
-            for required_param in asset_build_package[REQ_PARAMS]:
-                if specified_params is None:
-                    specified_params = {}
-                if required_param[KEY] not in specified_params.keys():
-                    if required_param[DEFAULT] is None:
-                        raise ValueError("Value for the parameter '{x}' ({desc}) is required, but not provided. "
-                                         "Specify it with: --params {x}=value"
-                                         .format(x=required_param[KEY], desc=required_param[DESC]))
-                    else:
-                        specified_params.update({required_param[KEY]: required_param[DEFAULT]})
-            genome_outfolder = os.path.join(args.outfolder, genome)
-            _LOGGER.info("Building '{}/{}:{}' using '{}' recipe".format(genome, asset_key, asset_tag, recipe_name))
-            if recipe_name == 'fasta' and genome in rgc.genomes_list() \
-                    and 'fasta' in rgc.list_assets_by_genome(genome):
-                _LOGGER.warning("'{g}' genome is already initialized with other fasta asset ({g}/{a}:{t}). "
-                                "It will be re-initialized.".format(g=genome, a=asset_key, t=asset_tag))
-            if not build_asset(genome, asset_key, asset_tag, asset_build_package, genome_outfolder,
-                               specified_args, specified_params, **input_assets):
-                log_path = os.path.abspath(os.path.join(genome_outfolder, asset_key, asset_tag,
-                                                        BUILD_STATS_DIR, ORI_LOG_NAME))
-                _LOGGER.info("'{}/{}:{}' was not added to the config, but directory has been left in place. "
-                             "See the log file for details: {}".format(genome, asset_key, asset_tag, log_path))
-                return
-            # If the recipe was a fasta, we init the genome
-            if recipe_name == 'fasta':
-                _LOGGER.info("Computing initial genome digest...")
-                collection_checksum, content_checksums = \
-                    fasta_checksum(_seek(rgc, genome, asset_key, asset_tag, "fasta"))
-                _LOGGER.info("Initializing genome...")
-                refgenie_initg(rgc, genome, content_checksums)
-            _LOGGER.info("Finished building '{}' asset".format(asset_key))
-            with rgc as r:
-                # update asset relationships
-                r.update_relatives_assets(genome, asset_key, asset_tag, parent_assets)  # adds parents
-                for i in parent_assets:
-                    parsed_parent = parse_registry_path(i)
-                    # adds child (currently built asset) to the parent
-                    r.update_relatives_assets(parsed_parent["genome"], parsed_parent["asset"], parsed_parent["tag"],
-                                                   ["{}/{}:{}".format(genome, asset_key, asset_tag)], True)
-                if args.genome_description is not None:
-                    _LOGGER.debug("adding genome ({}) description: '{}'".format(genome, args.genome_description))
-                    r.update_genomes(genome, {CFG_GENOME_DESC_KEY: args.genome_description})
-                if args.tag_description is not None:
-                    _LOGGER.debug("adding tag ({}/{}:{}) description: '{}'".format(genome, asset_key, asset_tag,
-                                                                                   args.tag_description))
-                    r.update_tags(genome, asset_key, asset_tag, {CFG_TAG_DESC_KEY: args.tag_description})
-                if recipe_name == "fasta":
-                    # to save config lock time when building fasta assets
-                    # (genome initialization takes some time for large genomes) we repeat the
-                    # conditional here for writing the computed genome digest
-                    r.update_genomes(genome, data={CFG_CHECKSUM_KEY: collection_checksum})
+        bundle = (a["genome"], a["asset"], a["tag"] or rgc.get_default_tag(a["genome"], a["asset"], use_existing=False))
+        _LOGGER.debug("Determined tag for removal: {}".format(bundle[2]))
+        try:
+            complete = rgc.is_asset_complete(*bundle)
+        except (KeyError, MissingAssetError, MissingGenomeError):
+            _LOGGER.info("Asset '{}/{}:{}' does not exist".format(*bundle))
+            return False
+        bundles.append((bundle, complete))
+    question = "Remove '{}/{}:{}'?".format(*bundles[0][0]) if len(bundles) == 1 \
+        else "Are you sure you want to remove {} assets?".format(len(bundles))
+    if not force and not query_yes_no(question):
+        _LOGGER.info("Action aborted by the user")
+        return False
+    tag_dirs = {}
+    for bundle, complete in bundles:
+        if not complete:
+            _LOGGER.info("Removing an incomplete asset '{}/{}:{}'".format(*bundle))
+            continue
+        path = rgc.seek(*bundle, enclosing_dir=True, strict_exists=False)
+        if os.path.exists(path):
+            tag_dirs[bundle] = path
         else:
-            _raise_missing_recipe_error(recipe_name)
+            _LOGGER.warning("Selected asset does not exist on disk ({}). Removing from genome config.".format(path))
+    doomed = {}
+    with rgc as r:
+        for bundle, _ in bundles:
+            r.cfg_remove_assets(*bundle)
+        for (genome, asset, tag), path in tag_dirs.items():
+            # refgenconf prunes the emptied genomes, and the emptied genomes section to None
+            genome_data = (r[CFG_GENOMES_KEY] or {}).get(genome) or {}
+            asset_dir = os.path.dirname(os.path.abspath(path))
+            if asset in genome_data.get(CFG_ASSETS_KEY, {}) or os.path.basename(asset_dir) != asset:
+                doomed[path] = genome
+            elif CFG_ASSETS_KEY in genome_data or os.path.basename(os.path.dirname(asset_dir)) != genome:
+                doomed[asset_dir] = genome
+            else:
+                doomed[os.path.dirname(asset_dir)] = genome
+    # the tag and asset directories in the removed asset and genome directories go with them
+    paths = [p for p in sorted(doomed) if not any([p.startswith(q + os.sep) for q in doomed])]
+    entries, in_place = [], []
+    for path in paths:
+        try:
+            entry = move_to_trash(rgc[CFG_FOLDER_KEY], doomed[path], path)
+        except OSError as e:
+            _LOGGER.warning("Could not move '{}' to the trash, 'refgenie gc' will report it: {}".format(path, e))
+            continue
+        if entry is None:
+            in_place.append(path)
+        else:
+            entries.append(entry)
+    if paths:
+        _LOGGER.info("Successfully removed entities:\n- {}".format("\n- ".join(paths)))
+    if background and entries:
+        empty_trash_in_background(entries, threads)
+        _LOGGER.info("Deleting {} directories in the background; if the deletion is interrupted, "
+                     "'refgenie gc --delete' deletes what is left".format(len(entries)))
+        entries = []
+    failed = empty_trash(entries + in_place, threads)
+    if failed:
+        _LOGGER.warning("Could not delete {} directories, 'refgenie gc --delete' deletes what is left in "
+                        "the trash:\n- {}".format(len(failed), "\n- ".join(failed)))
+    return not failed
+
+
+def refgenie_dedup(rgc, genomes=None, link=LINK_HARD, dry_run=False, force=False, min_size=1024 * 1024,
+                   threads=8, io_limit=4, state_file=None):
+    """
+    Find identical files in the genome folder and replace them with links to one copy
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[str] genomes: genomes to deduplicate the files of, all by default
+    :param str link: type of the links, hardlink or reflink
+    :param bool dry_run: whether to only report the identical files
+    :param bool force: whether the prompt should be skipped
+    :param int min_size: minimal size in bytes of the files to deduplicate
+    :param int threads: number of threads to hash the files on
+    :param int io_limit: maximum number of files read at the same time
+    :param str state_file: path to the digest verification state, whose file digests are reused
+    """
+    folder = rgc[CFG_FOLDER_KEY]
+    folders = [os.path.join(folder, g) for g in sorted(os.listdir(folder))
+               if os.path.isdir(os.path.join(folder, g)) and not g.startswith(".") and (not genomes or g in genomes)]
+    groups = find_duplicates(folders, min_size=min_size, threads=threads, io_limit=io_limit,
+                             state_file=state_file)
+    if not groups:
+        _LOGGER.info("No identical files found")
+        return
+    reclaimable = 0
+    for group in groups:
+        size = os.lstat(group[0]).st_blocks * 512
+        copies = len(set([os.lstat(p).st_ino for p in group]))
+        reclaimable += size * (copies - 1)
+        print("{:.2f} GB x {}:\n  {}".format(size / 1e9, copies, "\n  ".join(group)))
+    _LOGGER.info("Reclaimable: {:.2f} GB in {} groups of identical files".format(reclaimable / 1e9, len(groups)))
+    if dry_run:
+        return
+    if not force and not query_yes_no("Replace the duplicates with {}s?".format(link)):
+        _LOGGER.info("Action aborted by the user")
+        return
+    reclaimed = sum([link_duplicates(group, method=link) for group in groups])
+    _LOGGER.info("Reclaimed: {:.2f} GB".format(reclaimed / 1e9))
+
+
+def refgenie_chunk(rgc, asset_list, store, threads=8):
+    """
+    Save the asset tags to a chunk store
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[dict] asset_list: asset registry paths, parsed
+    :param str store: path to the chunk store directory
+    :param int threads: number of threads to chunk the files on
+    """
+    for a in asset_list:
+        tag = a["tag"] or rgc.get_default_tag(a["genome"], a["asset"])
+        new, total, new_size, total_size = export_asset(rgc, a["genome"], a["asset"], tag, store, threads)
+        _LOGGER.info("Saved '{}/{}:{}': {} of {} chunks new ({:.2f} of {:.2f} MB)".format(
+            a["genome"], a["asset"], tag, new, total, new_size / 1e6, total_size / 1e6))
+
+
+def refgenie_prefetch(rgc, asset_list, threads=8, wait=True, status=False):
+    """
+    Load the files of the assets into the page cache and report the share of them in it
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[dict] asset_list: asset registry paths, parsed; the files of
+        the whole tag are loaded unless a seek key is given
+    :param int threads: number of threads to read the files on
+    :param bool wait: whether to wait for the files to be read, otherwise
+        the kernel is only advised to read them ahead
+    :param bool status: whether to only report the share of the files in the page cache
+    :return bool: whether all the assets were found and their files loaded
+    """
+    assets = []
+    for a in asset_list:
+        try:
+            tag = a["tag"] or rgc.get_default_tag(a["genome"], a["asset"])
+            path = rgc.seek(a["genome"], a["asset"], tag, a["seek_key"], enclosing_dir=a["seek_key"] is None)
+        except (KeyError, RefgenconfError) as e:
+            _LOGGER.error("Asset '{}/{}:{}' does not exist: {}".format(a["genome"], a["asset"], a["tag"], e))
+            return False
+        files = asset_files(path)
+        if not files:
+            _LOGGER.error("No files to prefetch in: {}".format(path))
+            return False
+        rp = "{}/{}{}:{}".format(a["genome"], a["asset"], "." + a["seek_key"] if a["seek_key"] else "", tag)
+        assets.append((rp, files))
+    files = OrderedDict([f for _, fs in assets for f in fs])
+    total = sum(files.values())
+    memory = physical_memory()
+    if memory and total > memory:
+        _LOGGER.warning("The files ({:.2f} GB) do not fit in the physical memory ({:.2f} GB)".
+                        format(total / 1e9, memory / 1e9))
+    resident = dict(zip(files.keys(), resident_files(list(files.items()), threads)))
+    failed = []
+    if not status:
+        # the largest files first, so that a single big file does not finish last
+        todo = sorted([p for p, size in files.items() if resident[p] is None or resident[p] < size],
+                      key=lambda p: -files[p])
+        _LOGGER.info("Prefetching {} of {} files ({:.2f} GB)".format(len(todo), len(files), total / 1e9))
+        failed = prefetch_files(todo, threads, wait)
+        resident.update(zip(todo, resident_files([(p, files[p]) for p in todo], threads)))
+    row = "{:<40}{:>8}{:>12}{:>14}"
+    print(row.format("asset", "files", "size [GB]", "resident [%]"))
+    for rp, fs in assets:
+        size = sum([s for _, s in fs])
+        known = [resident[p] for p, _ in fs if resident[p] is not None]
+        share = "n/a" if len(known) < len(fs) else "{:.1f}".format(100.0 * sum(known) / size if size else 100.0)
+        print(row.format(rp, len(fs), "{:.2f}".format(size / 1e9), share))
+    return not failed
+
+
+def refgenie_pull_chunked(rgc, asset_list, source, force=False, threads=8):
+    """
+    Pull the asset tags from a chunk store and register them
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[dict] asset_list: asset registry paths, parsed
+    :param str source: URL of, or path to, the chunk store
+    :param bool force: whether the prompt before overwriting an existing tag should be skipped
+    :param int threads: number of threads to fetch the chunks and write the files on
+    :return bool: whether all the asset tags were pulled
+    """
+    success = True
+    for a in asset_list:
+        try:
+            manifest = fetch_manifest(source, a["genome"], a["asset"], a["tag"])
+            gat = [manifest["genome"], manifest["asset"], manifest["tag"]]
+            tag_dir = os.path.join(rgc[CFG_FOLDER_KEY], gat[0],
+                                   manifest["attrs"].get(CFG_ASSET_PATH_KEY, gat[1]), gat[2])
+            if os.path.exists(tag_dir) and not force and \
+                    not query_yes_no("'{}/{}:{}' exists. Do you want to overwrite?".format(*gat)):
+                _LOGGER.info("Skipping '{}/{}:{}'".format(*gat))
+                continue
+            fetched, copied = restore_asset(rgc, manifest, source, threads)
+        except ChunkStoreError as e:
+            _LOGGER.error(str(e))
+            success = False
+            continue
+        with rgc as r:
+            if manifest.get("asset_description"):
+                r.update_assets(*gat[0:2], data={CFG_ASSET_DESC_KEY: manifest["asset_description"]})
+            r.update_tags(*gat, data=manifest["attrs"])
+            r.set_default_pointer(*gat)
+        _LOGGER.info("Pulled '{}/{}:{}': fetched {:.2f} MB, reused {:.2f} MB of the local tags".format(
+            *(gat + [fetched / 1e6, copied / 1e6])))
+    return success
+
+
+def refgenie_getseq(rgc, genome, locus):
+    """
+    Print the sequence found in a selected range and chromosome.
+
+    BGZF-compressed FASTA files are read with their samtools indexes,
+    the other ones with RefGenConf.getseq.
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param str genome: name of the genome
+    :param str locus: coordinates of desired sequence, e.g. 'chr1:1-10'
+    """
+    fasta = rgc.seek(genome, "fasta", strict_exists=True)
+    if not is_bgzf_fasta(fasta):
+        rgc.getseq(genome, locus)
+        return
+    locus_split = locus.split(":")
+    if len(locus_split) > 1:
+        start, end = locus_split[1].split("-")
+        _LOGGER.debug("chr: '{}', start: '{}', end: '{}'".format(locus_split[0], start, end))
+        print(BgzfFasta(fasta).fetch(locus_split[0], int(start), int(end)))
+    else:
+        print(BgzfFasta(fasta).fetch(locus_split[0]))
+
+
+def refgenie_profile(rgc, genomes=None, assets=None, as_json=False):
+    """
+    Summarize the build profiles saved in the genome folder.
+
+    Each build profile is listed and the profiles are then aggregated
+    by asset, across the selected genomes.
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[str] genomes: genomes to summarize the profiles for
+    :param list[str] assets: assets to summarize the profiles for
+    :param bool as_json: whether the summary should be printed in JSON format
+    """
+    profiles = read_profiles(rgc[CFG_FOLDER_KEY], genomes=genomes, assets=assets)
+    if not profiles:
+        _LOGGER.info("No build profiles found in: {}".format(rgc[CFG_FOLDER_KEY]))
+        return
+    summary = aggregate_profiles(profiles)
+    if as_json:
+        print(json.dumps({"builds": profiles, "assets": summary}, indent=4))
+        return
+
+    def _fmt(x):
+        return "{:.1f}".format(x) if x is not None else "NA"
+
+    row = "{:<40}{:>11}{:>12}{:>12}{:>10}"
+    print(row.format("build", "status", "wall [s]", "cpu [s]", "mem [GB]"))
+    for p in profiles:
+        print(row.format("{}/{}:{}".format(p["genome"], p["asset"], p["tag"]), p.get("status", "NA"),
+                         _fmt(p.get("wall_time")), _fmt(p.get("cpu_time")), _fmt(p.get("peak_memory_gb"))))
+    print("")
+    row = "{:<40}{:>8}{:>12}{:>12}{:>12}{:>10}"
+    print(row.format("asset", "builds", "mean [s]", "max [s]", "cpu [s]", "mem [GB]"))
+    for asset, s in summary.items():
+        print(row.format(asset, s["builds"], _fmt(s["mean_wall_time"]), _fmt(s["max_wall_time"]),
+                         _fmt(s["total_cpu_time"]), _fmt(s["peak_memory_gb"])))
+        for phase, wall in s["phases"].items():
+            print("    {:<36}{:>20}".format(phase, _fmt(wall)))
+
+
+def refgenie_convert(rgc, output, force=False):
+    """
+    Convert the genome configuration between the YAML and database formats.
+
+    The output format is determined by the output file extension.
+
+    :param refgenconf.RefGenConf rgc: genome configuration object to convert
+    :param str output: path to the converted genome configuration file
+    :param bool force: whether the existing output file should be overwritten without a prompt
+    :return bool: whether the genome configuration was converted
+    """
+    output = os.path.abspath(output)
+    if output == os.path.abspath(rgc.file_path):
+        raise ValueError("The output path is the genome configuration file path: {}".format(output))
+    if os.path.exists(output):
+        if not force and not query_yes_no("File '{}' exists. Do you want to overwrite?".format(output)):
+            return False
+        os.remove(output)
+    cls = DBRefGenConf if is_db_path(output) else RefGenConf
+    cls(entries=config_entries(rgc)).initialize_config_file(output)
+    return True
 
 
 def _exec_list(rgc, remote, genome):
@@ -604,13 +1409,20 @@ def main():
         if args.command in GENOME_ONLY_REQUIRED and not args.genome:
             parser.error("You must provide either a genome or a registry path")
             sys.exit(1)
-        if args.command in ASSET_REQUIRED:
+        if args.command in ASSET_REQUIRED and not getattr(args, "manifest", None):
             parser.error("You must provide an asset registry path")
             sys.exit(1)
 
+    merged = 0
+    exit_code = 0
+    if args.command in SPOOL_MERGE_CMDS and not getattr(args, "spool", False) \
+            and pending_records(spool_dir(gencfg)):
+        merged = merge_spool(_load_rgc(gencfg), spool_dir(gencfg))
+
     if args.command == INIT_CMD:
         _LOGGER.debug("Initializing refgenie genome configuration")
-        rgc = RefGenConf(entries=OrderedDict({
+        rgc_class = DBRefGenConf if is_db_path(gencfg) else RefGenConf
+        rgc = rgc_class(entries=OrderedDict({
             CFG_VERSION_KEY: REQ_CFG_VERSION,
             CFG_FOLDER_KEY: os.path.dirname(os.path.abspath(gencfg)),
             CFG_SERVERS_KEY: args.genome_server or [DEFAULT_SERVER],
@@ -636,27 +1448,37 @@ def main():
                 _LOGGER.info("'{}' recipe requirements: ".format(recipe))
                 _make_asset_build_reqs(recipe)
             sys.exit(0)
-        refgenie_build(gencfg, asset_list[0]["genome"], asset_list, recipe_name, args)
+        if not refgenie_build(gencfg, asset_list[0]["genome"], asset_list, recipe_name, args):
+            exit_code = 1
 
     elif args.command == GET_ASSET_CMD:
-        rgc = RefGenConf(filepath=gencfg, writable=False)
+        rgc = _load_rgc(gencfg, genomes=[a["genome"] for a in asset_list], assets=[a["asset"] for a in asset_list],
+                        cached=True)
         check = args.check_exists if args.check_exists else None
         for a in asset_list:
             _LOGGER.debug("getting asset: '{}/{}.{}:{}'".
                           format(a["genome"], a["asset"], a["seek_key"], a["tag"]))
-            print(rgc.seek(a["genome"], a["asset"], a["tag"], a["seek_key"],
-                           strict_exists=check))
+            print(cached_seek(rgc, a["genome"], a["asset"], a["tag"], a["seek_key"], cache_dir=args.node_cache,
+                              max_size=args.node_cache_size, grace=args.node_cache_grace, strict_exists=check))
         return
 
     elif args.command == INSERT_CMD:
-        rgc = RefGenConf(filepath=gencfg, writable=False)
-        if len(asset_list) > 1:
-            raise NotImplementedError("Can only add 1 asset at a time")
+        rgc = _load_rgc(gencfg)
+        if args.manifest:
+            if args.asset_registry_paths or args.path:
+                parser.error("Provide either a manifest or an asset registry path and a path")
+            if not refgenie_add_manifest(rgc, args.manifest, genome=args.genome, force=args.force,
+                                         threads=args.threads, algorithm=args.digest_algorithm):
+                exit_code = 1
+        elif not args.path:
+            parser.error("You must provide a path to the asset or a manifest")
+        elif len(asset_list) > 1:
+            parser.error("Add multiple assets with a manifest")
         else:
-            refgenie_add(rgc, asset_list[0], args.path, args.force)
+            refgenie_add(rgc, asset_list[0], args.path, args.force, args.digest_algorithm, args.threads)
 
     elif args.command == PULL_CMD:
-        rgc = RefGenConf(filepath=gencfg, writable=False)
+        rgc = _load_rgc(gencfg)
         force = None if not args.force else True
         outdir = rgc[CFG_FOLDER_KEY]
         if not os.path.exists(outdir):
@@ -669,12 +1491,16 @@ def main():
                           format(target, outdir))
             return
 
-        for a in asset_list:
-            rgc.pull(a["genome"], a["asset"], a["tag"],
-                     unpack=not args.no_untar, force=force)
+        if args.chunked:
+            if not refgenie_pull_chunked(rgc, asset_list, args.chunked, args.force, args.threads):
+                exit_code = 1
+        else:
+            for a in asset_list:
+                rgc.pull(a["genome"], a["asset"], a["tag"],
+                         unpack=not args.no_untar, force=force)
 
     elif args.command in [LIST_LOCAL_CMD, LIST_REMOTE_CMD]:
-        rgc = RefGenConf(filepath=gencfg, writable=False)
+        rgc = _load_rgc(gencfg, genomes=args.genome if args.command == LIST_LOCAL_CMD else None, cached=True)
         if args.command == LIST_REMOTE_CMD:
             num_servers = 0
             # Keep all servers so that child updates maintain server list
@@ -705,72 +1531,146 @@ def main():
             if args.command != LIST_REMOTE_CMD:  # Not implemented yet
                 _LOGGER.info("{} recipes: {}".format(pfx, recipes))
             _LOGGER.info("{} assets:\n{}".format(pfx, assets))
+            if args.verify and not refgenie_verify_list(rgc, args.genome, args.threads, verify_cache_path(gencfg)):
+                sys.exit(1)
 
     elif args.command == GETSEQ_CMD:
-        rgc = RefGenConf(filepath=gencfg, writable=False)
-        rgc.getseq(rgc, args.genome, args.locus)
+        rgc = _load_rgc(gencfg, genomes=[args.genome], assets=["fasta"], cached=True)
+        refgenie_getseq(rgc, args.genome, args.locus)
 
     elif args.command == REMOVE_CMD:
-        force = args.force
-        rgc = RefGenConf(filepath=gencfg)
+        rgc = _load_rgc(gencfg)
         for a in asset_list:
-            a["tag"] = a["tag"] or rgc.get_default_tag(a["genome"], a["asset"],
-                                                       use_existing=False)
-            _LOGGER.debug("Determined tag for removal: {}".format(a["tag"]))
             if a["seek_key"] is not None:
                 raise NotImplementedError("You can't remove a specific seek_key.")
-            bundle = [a["genome"], a["asset"], a["tag"]]
-            try:
-                if not rgc.is_asset_complete(*bundle):
-                    with rgc as r:
-                        r.cfg_remove_assets(*bundle)
-                    _LOGGER.info("Removed an incomplete asset '{}/{}:{}'".
-                                 format(*bundle))
-                    return
-            except (KeyError, MissingAssetError, MissingGenomeError):
-                _LOGGER.info("Asset '{}/{}:{}' does not exist".format(*bundle))
-                return
-        if len(asset_list) > 1:
-            if not query_yes_no("Are you sure you want to remove {} assets?".
-                                        format(len(asset_list))):
-                _LOGGER.info("Action aborted by the user")
-                return
-            force = True
-        for a in asset_list:
-            rgc.remove(genome=a["genome"], asset=a["asset"], tag=a["tag"],
-                       force=force)
+        if not refgenie_remove(rgc, asset_list, args.force, args.background, args.threads):
+            exit_code = 1
 
     elif args.command == TAG_CMD:
-        rgc = RefGenConf(filepath=gencfg)
+        rgc = _load_rgc(gencfg)
         if len(asset_list) > 1:
             raise NotImplementedError("Can only tag 1 asset at a time")
         if args.default:
-            # set the default tag and exit
+            # set the default tag
             with rgc as r:
                 r.set_default_pointer(a["genome"], a["asset"], a["tag"], True)
-            sys.exit(0)
-        rgc.tag(a["genome"], a["asset"], a["tag"], args.tag)
+        else:
+            rgc.tag(a["genome"], a["asset"], a["tag"], args.tag)
 
     elif args.command == ID_CMD:
-        rgc = RefGenConf(filepath=gencfg, writable=False)
+        rgc = _load_rgc(gencfg, genomes=[a["genome"] for a in asset_list], assets=[a["asset"] for a in asset_list],
+                        cached=True)
         if len(asset_list) == 1:
             g, a = asset_list[0]["genome"], asset_list[0]["asset"]
             t = asset_list[0]["tag"] or rgc.get_default_tag(g, a)
-            print(rgc.id(g, a, t))
+            print(_asset_id(rgc, g, a, t))
             return
         for asset in asset_list:
             g, a = asset["genome"], asset["asset"]
             t = asset["tag"] or rgc.get_default_tag(g, a)
-            print("{}/{}:{},".format(g, a, t) + rgc.id(g, a, t))
+            print("{}/{}:{},".format(g, a, t) + _asset_id(rgc, g, a, t))
         return
     elif args.command == SUBSCRIBE_CMD:
-        rgc = RefGenConf(filepath=gencfg, writable=False)
+        rgc = _load_rgc(gencfg)
         rgc.subscribe(urls=args.genome_server, reset=args.reset)
         return
     elif args.command == UNSUBSCRIBE_CMD:
-        rgc = RefGenConf(filepath=gencfg, writable=False)
+        rgc = _load_rgc(gencfg)
         rgc.unsubscribe(urls=args.genome_server)
         return
+    elif args.command == PROFILE_CMD:
+        rgc = _load_rgc(gencfg)
+        refgenie_profile(rgc, genomes=args.genome, assets=args.asset, as_json=args.json)
+        return
+    elif args.command == CONVERT_CMD:
+        rgc = _load_rgc(gencfg)
+        refgenie_convert(rgc, args.output, force=args.force)
+        return
+    elif args.command == GC_CMD:
+        rgc = _load_rgc(gencfg)
+        if not refgenie_gc(rgc, args.genome, args.delete, args.force, args.min_age, args.threads,
+                           args.include_unregistered) and args.delete:
+            sys.exit(1)
+    elif args.command == DEDUP_CMD:
+        rgc = _load_rgc(gencfg, cached=True)
+        refgenie_dedup(rgc, args.genome, args.link, args.dry_run, args.force, args.min_size, args.threads,
+                       args.io_limit, digest_state_path(gencfg))
+    elif args.command == CHUNK_CMD:
+        rgc = _load_rgc(gencfg, cached=True)
+        refgenie_chunk(rgc, asset_list, args.store, args.threads)
+    elif args.command == PREFETCH_CMD:
+        rgc = _load_rgc(gencfg, genomes=[a["genome"] for a in asset_list], assets=[a["asset"] for a in asset_list],
+                        cached=True)
+        if not refgenie_prefetch(rgc, asset_list, args.threads, not args.no_wait, args.status):
+            sys.exit(1)
+    elif args.command == MERGE_CMD:
+        # the pending records, if any, were merged above
+        if not merged:
+            _LOGGER.info("No genome configuration updates to merge")
+    elif args.command == VIEWS_CMD:
+        if args.folder:
+            rgc = _load_rgc(gencfg)
+            with rgc as r:
+                r[CFG_VIEWS_FOLDER_KEY] = args.folder
+        rgc = _load_rgc(gencfg, cached=True)
+        if not views_folder(rgc):
+            _LOGGER.error("The views folder is not set, set it with: refgenie {} --folder PATH".format(VIEWS_CMD))
+            sys.exit(1)
+        refresh_views(rgc)
+        _LOGGER.info("Views in '{}' are up to date".format(views_folder(rgc)))
+    elif args.command == VERIFY_CMD:
+        asset_list = asset_list if args.asset_registry_paths else None
+        rgc = _load_rgc(gencfg, cached=True)
+        if not refgenie_verify(rgc, asset_list, args.genome, args.threads, args.io_limit,
+                               digest_state_path(gencfg), args.incremental):
+            sys.exit(1)
+
+    # the commands that may have written the genome configuration file
+    if args.command in VIEWS_REFRESH_CMDS or merged:
+        _refresh_views(gencfg)
+    if exit_code:
+        sys.exit(exit_code)
+
+
+def _refresh_views(gencfg):
+    """
+    Refresh the symbolic link views of the assets, if the genome configuration sets their folder
+
+    :param str gencfg: path to the genome configuration file
+    """
+    rgc = _load_rgc(gencfg, cached=True)
+    if not views_folder(rgc):
+        return
+    try:
+        refresh_views(rgc)
+    except OSError as e:
+        _LOGGER.warning("Could not refresh the views in '{}': {}".format(views_folder(rgc), e))
+
+
+def _load_rgc(gencfg, writable=False, genomes=None, assets=None, cached=False):
+    """
+    Read the genome configuration, using the backend selected by the file extension
+
+    :param str gencfg: path to the genome configuration file
+    :param bool writable: whether to create the object with write capabilities
+    :param Iterable[str] genomes: names of the genomes to read, all by default.
+        Only the database backend reads the genomes selectively
+    :param Iterable[str] assets: names of the assets to read, all by default.
+        Only the database backend reads the assets selectively
+    :param bool cached: whether the YAML file snapshot can be used instead of
+        parsing the file. Disregarded for writable objects
+    :return refgenconf.RefGenConf: genome configuration object, which
+        reflects the spooled asset registrations unless writable
+    """
+    if is_db_path(gencfg):
+        rgc = DBRefGenConf(filepath=gencfg, writable=writable, genomes=genomes, assets=assets)
+    elif cached and not writable:
+        rgc = load_cached_rgc(gencfg)
+    else:
+        rgc = RefGenConf(filepath=gencfg, writable=writable)
+    if not writable:
+        apply_records(rgc, pending_records(spool_dir(gencfg)))
+    return rgc
 
 
 def _entity_dir_removal_log(directory, entity_class, asset_dict, removed_entities):
@@ -876,6 +1776,55 @@ def get_dir_digest(path, pm=None):
     return str(sub(r'\W+', '', x))  # strips non-alphanumeric
 
 
+def _asset_id(rgc, genome, asset, tag):
+    """
+    Get the digest of an asset tag, prefixed with the digest algorithm unless it is MD5
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param str genome: genome name
+    :param str asset: asset name
+    :param str tag: tag name
+    :return str: the asset digest, e.g. blake3:0bb7ca3b95e5e4fbcd89e9a2bbd1d0d7
+    """
+    digest = rgc.id(genome, asset, tag)
+    algorithm = digest_algorithm(rgc[CFG_GENOMES_KEY][genome][CFG_ASSETS_KEY][asset][CFG_ASSET_TAGS_KEY][tag])
+    return digest if algorithm == DEFAULT_DIGEST_ALGORITHM else "{}:{}".format(algorithm, digest)
+
+
+@contextmanager
+def _profiled_lock(rgc, profiler, spool=None):
+    """
+    Make the genome configuration object writable for the duration of the block,
+    just like 'with rgc as r' does, recording the lock wait and config write times
+
+    If the spool directory is provided, the file is neither locked nor
+    written; the updates are recorded and saved to the spool directory instead.
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param refgenie.profiling.BuildProfiler profiler: profiler to record the timings with
+    :param str spool: path to the spool directory
+    """
+    if spool:
+        recorder = SpoolRecorder(rgc)
+        try:
+            yield recorder
+        finally:
+            with profiler.phase(PHASE_WRITE):
+                write_record(spool, recorder.calls)
+        return
+    readonly = not rgc.writable
+    with profiler.phase(PHASE_LOCK_WAIT):
+        if readonly:
+            rgc.make_writable()
+    try:
+        yield rgc
+    finally:
+        with profiler.phase(PHASE_WRITE):
+            rgc.write()
+        if readonly:
+            rgc.make_readonly()
+
+
 def _handle_sigint(gat):
     """
     SIGINT handler, unlocks the config file and exists the program
@@ -914,6 +1863,151 @@ def _raise_missing_recipe_error(recipe):
                              format(recipe, ", ".join(list(asset_build_packages.keys()))))
 
 
+def _run_stage(pm, stage, target):
+    """
+    Run a native recipe stage in the refgenie process, skipping it just like
+    pypiper skips the commands once the target exists
+
+    :param pypiper.PipelineManager pm: pipeline manager of the build
+    :param Mapping stage: the populated stage
+    :param str target: path to the build target flag
+    :raise pypiper.exceptions.SubprocessError: if the stage fails
+    """
+    if os.path.exists(target) and not pm.new_start:
+        _LOGGER.info("Target exists: '{}', skipping stage '{}'".format(target, stage[STAGE]))
+        return
+    try:
+        run_stage(stage)
+    except Exception as e:
+        _LOGGER.error("Stage '{}' failed: {}".format(stage[STAGE], e))
+        raise pypiper.exceptions.SubprocessError("Stage '{}' failed ({}): {}".
+                                                 format(stage[STAGE], e.__class__.__name__, e))
+
+
+def _run_command(pm, cmd, target):
+    """
+    Run a recipe command or a native stage
+
+    :param pypiper.PipelineManager pm: pipeline manager of the build
+    :param str | Mapping cmd: the populated command
+    :param str target: path to the build target flag
+    :raise pypiper.exceptions.SubprocessError: if the command fails
+    """
+    if is_stage(cmd):
+        _run_stage(pm, cmd, target)
+    else:
+        pm.run(cmd, target, container=pm.container)
+
+
+def _run_process(cmd, container=None, running=None, lock=None):
+    """
+    Run a shell command in its own process group, like pypiper does, and
+    measure the resources it used
+
+    :param str cmd: the command to run
+    :param str container: name of the container to run the command in
+    :param dict running: the running processes, by their PIDs, to add the process to for its duration
+    :param threading.Lock lock: lock that guards the running processes
+    :return Mapping: the CPU time in seconds and peak memory use in GB of the
+        command, the processes it started included
+    :raise pypiper.exceptions.SubprocessError: if the command fails
+    """
+    _LOGGER.info("Running command: {}".format(cmd))
+    if container:
+        cmd = "docker exec {} {}".format(container, cmd)
+    proc = subprocess.Popen(cmd, shell=True, preexec_fn=os.setsid)
+    if running is not None:
+        with lock:
+            running[proc.pid] = proc
+    try:
+        # unlike Popen.wait, wait4 reports the resources used by this process only
+        _, status, usage = os.wait4(proc.pid, 0)
+    finally:
+        if running is not None:
+            with lock:
+                running.pop(proc.pid, None)
+    proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    if proc.returncode != 0:
+        raise pypiper.exceptions.SubprocessError("Subprocess returned nonzero result. Check above output for "
+                                                 "details: {} (code {})".format(cmd, proc.returncode))
+    # ru_maxrss is in kilobytes
+    return {"cpu_time": usage.ru_utime + usage.ru_stime, "peak_memory_gb": usage.ru_maxrss * 1024 / 1e9}
+
+
+def _run_group(pm, group, target, profiler, workers=None):
+    """
+    Run a group of independent recipe commands concurrently
+
+    The commands are run in their own processes, outside of the pipeline
+    manager, which is not thread-safe, and the resources each of them uses
+    are measured per process. Once a command fails, no more commands of the
+    group are started, the running ones are terminated and the error is
+    raised after all the commands have ended.
+
+    :param pypiper.PipelineManager pm: pipeline manager of the build
+    :param list group: the populated commands, stages and command sequences
+    :param str target: path to the build target flag
+    :param refgenie.profiling.BuildProfiler profiler: profiler to record the command timings with
+    :param int workers: maximum number of commands to run at once, the number of CPUs by default
+    :raise pypiper.exceptions.SubprocessError: if any command fails
+    """
+    # the commands share the target, which makes pypiper skip them all once it exists
+    if os.path.exists(target) and not pm.new_start:
+        _LOGGER.info("Target exists: '{}', skipping a group of {} commands".format(target, len(group)))
+        return
+    container = pm.container
+    failed = threading.Event()
+    errors = []
+    running = {}
+    lock = threading.Lock()
+
+    def _terminate():
+        with lock:
+            for pid in list(running.keys()):
+                try:
+                    os.killpg(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+
+    def _run_sequence(i):
+        for cmd in group[i] if is_group(group[i]) else [group[i]]:
+            if failed.is_set():
+                _LOGGER.info("Skipping command, another command of the group failed: {}".format(format_command(cmd)))
+                return
+            try:
+                with profiler.command(cmd) as usage:
+                    if is_stage(cmd):
+                        run_stage(cmd)
+                        # the stage shares the CPU time of the refgenie process with the other commands
+                        usage["cpu_time"] = None
+                    else:
+                        usage.update(_run_process(cmd, container, running, lock))
+            except Exception as e:
+                _LOGGER.error("Command of the group failed: {}".format(e))
+                failed.set()
+                errors.append(e)
+                _terminate()
+                return
+
+    workers = max(1, min(workers or cpu_count(), len(group)))
+    _LOGGER.info("Running a group of {} commands on {} workers".format(len(group), workers))
+    pool = ThreadPool(workers)
+    try:
+        pool.map(_run_sequence, range(len(group)), chunksize=1)
+    except BaseException:
+        # interrupted, e.g. by the SIGINT handler
+        failed.set()
+        _terminate()
+        raise
+    finally:
+        pool.close()
+        pool.join()
+    if errors:
+        e = errors[0]
+        raise e if isinstance(e, pypiper.exceptions.SubprocessError) else \
+            pypiper.exceptions.SubprocessError("{}: {}".format(e.__class__.__name__, e))
+
+
 def _check_recipe(recipe):
     """
     Check whether there are any key name clashes in the recipe requirements
@@ -3,8 +3,8 @@
 
 import hashlib
 import binascii
-import pyfaidx
-import os
+import gzip
+from collections import OrderedDict
 
 
 def trunc512_digest(seq, offset=24):
@@ -13,31 +13,86 @@ def trunc512_digest(seq, offset=24):
     return str(hex_digest.decode())
 
 
-def parse_fasta(fa_file):
-    try:
-        fa_object = pyfaidx.Fasta(fa_file)
-    except pyfaidx.UnsupportedCompressionFormat:
-        # pyfaidx can handle bgzip but not gzip; so we just hack it here and
-        # unzip the file for checksumming, then rezip it for the rest of the
-        # asset build.
-        # TODO: streamline this to avoid repeated compress/decompress
-        # in refgenie we feed this function with uncompressed, newly built
-        # FASTA file, so compression issues are not relevant
-        os.system("gunzip {}".format(fa_file))
-        fa_file_unzipped = fa_file.replace(".gz", "")
-        fa_object = pyfaidx.Fasta(fa_file_unzipped)
-        os.system("gzip {}".format(fa_file_unzipped))
-    return fa_object
+class _Trunc512(object):
+    """ Incremental version of trunc512_digest """
+
+    def __init__(self, offset=24):
+        self.hash = hashlib.sha512()
+        self.offset = offset
+
+    def update(self, chunk):
+        self.hash.update(chunk)
+
+    def hexdigest(self):
+        return str(binascii.hexlify(self.hash.digest()[:self.offset]).decode())
+
+
+class _Joined(object):
+    """ Collects the sequence for checksum functions that are not incremental """
+
+    def __init__(self, checksum_function):
+        self.checksum_function = checksum_function
+        self.chunks = []
+
+    def update(self, chunk):
+        self.chunks.append(chunk)
+
+    def hexdigest(self):
+        return self.checksum_function(b"".join(self.chunks).decode())
+
+
+def _open_fasta(fa_file):
+    """
+    Open a plain, gzipped or BGZF-compressed FASTA file for reading
+
+    :param str fa_file: path to the FASTA file
+    :return file: binary file object
+    """
+    with open(fa_file, "rb") as f:
+        magic = f.read(2)
+    return gzip.open(fa_file, "rb") if magic == b"\x1f\x8b" else open(fa_file, "rb")
+
+
+def parse_fasta(fa_file, checksum_function=trunc512_digest):
+    """
+    Stream the sequences of a FASTA file through the checksum function.
+
+    The file is read once, line by line, so neither a decompressed copy nor
+    the whole sequence is needed.
+
+    :param str fa_file: path to the FASTA file, possibly compressed
+    :param callable checksum_function: function that computes the checksum of a sequence
+    :return Mapping[str, str]: sequence checksums keyed by the sequence names, in the file order
+    """
+    content_checksums = OrderedDict()
+    name, digest = None, None
+
+    def _finish():
+        if name is not None:
+            content_checksums[name] = digest.hexdigest()
+
+    with _open_fasta(fa_file) as f:
+        for line in f:
+            if line.startswith(b">"):
+                _finish()
+                fields = line[1:].split()
+                if not fields:
+                    raise ValueError("Bad sequence name {} in {}".format(line.rstrip(b"\r\n"), fa_file))
+                name = fields[0].decode()
+                if name in content_checksums:
+                    raise ValueError("Duplicate key \"{}\" in {}".format(name, fa_file))
+                digest = _Trunc512() if checksum_function is trunc512_digest else _Joined(checksum_function)
+            elif name is not None:
+                digest.update(line.rstrip(b"\r\n"))
+        _finish()
+    return content_checksums
 
 
 def fasta_checksum(fa_file, checksum_function=trunc512_digest):
     """
     Just calculate checksum of fasta file without loading it.
     """
-    fa_object = parse_fasta(fa_file)
-    content_checksums = {}
-    for k in fa_object.keys():
-        content_checksums[k] = checksum_function(str(fa_object[k]))
+    content_checksums = parse_fasta(fa_file, checksum_function)
     collection_string = ";".join([":".join(i) for i in content_checksums.items()])
     collection_checksum = checksum_function(collection_string)
     return collection_checksum, content_checksums
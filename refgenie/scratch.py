@@ -0,0 +1,132 @@
+"""
+Asset builds in a node-local scratch directory.
+
+The recipe commands of an asset write to a node-local scratch directory,
+instead of the genome folder on a shared file system, with many small writes
+and temporary files. The finished asset is published to the genome folder:
+its files are copied on a pool of threads, next to the tag directory, and
+hashed while being copied, which yields the asset digest without reading the
+files again. The copy then replaces the tag directory with a rename.
+"""
+
+import logging
+import os
+import stat
+import tempfile
+from multiprocessing.pool import ThreadPool
+from shutil import copystat, rmtree
+
+from .const import *
+from .digest import combine_digests, new_hash
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["make_scratch_dir", "publish_asset"]
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def make_scratch_dir(scratch, genome, asset, tag):
+    """
+    Create a build directory in the scratch directory
+
+    :param str scratch: path to the scratch directory
+    :param str genome: genome name
+    :param str asset: asset name
+    :param str tag: tag name
+    :return str: path to the build directory, to use as the genome output folder
+    """
+    scratch = os.path.abspath(os.path.expandvars(os.path.expanduser(scratch)))
+    if not os.path.isdir(scratch):
+        os.makedirs(scratch)
+    path = tempfile.mkdtemp(dir=scratch, prefix="refgenie_{}_{}_{}.".format(genome, asset, tag))
+    return os.path.join(path, genome)
+
+
+def _copy_file(source, target, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """
+    Copy a file, with its permissions and modification time, and hash it
+
+    :param str source: path to the file
+    :param str target: path to the copy
+    :param str algorithm: digest algorithm
+    :return str: digest of the file
+    """
+    hasher = new_hash(algorithm)
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            dst.write(chunk)
+    copystat(source, target)
+    return hasher.hexdigest()
+
+
+def publish_asset(source, target, threads=8, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """
+    Copy a built asset directory to the genome folder and replace the tag directory with it
+
+    The build logs already in the tag directory are moved to the copy.
+
+    :param str source: path to the built asset directory
+    :param str target: path to the tag directory in the genome folder
+    :param int threads: number of threads to copy the files on
+    :param str algorithm: digest algorithm
+    :return str: the asset digest; the MD5 digest is equal to the one get_dir_digest produces
+    """
+    parent = os.path.dirname(target)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    tmp = tempfile.mkdtemp(dir=parent, prefix="." + os.path.basename(target) + ".")
+    old = None
+    try:
+        files = []
+        for root, dirs, names in os.walk(source):
+            rel_root = os.path.relpath(root, source)
+            for name in dirs + names:
+                rel = os.path.normpath(os.path.join(rel_root, name))
+                src, dst = os.path.join(source, rel), os.path.join(tmp, rel)
+                mode = os.lstat(src).st_mode
+                if stat.S_ISLNK(mode):
+                    os.symlink(os.readlink(src), dst)
+                elif stat.S_ISDIR(mode):
+                    os.mkdir(dst)
+                elif stat.S_ISREG(mode):
+                    files.append(rel)
+        # the largest files first, so that a single big file does not finish last
+        files.sort(key=lambda rel: -os.path.getsize(os.path.join(source, rel)))
+        pool = ThreadPool(max(1, min(threads, len(files))))
+        try:
+            digests = pool.map(lambda rel: _copy_file(os.path.join(source, rel), os.path.join(tmp, rel), algorithm),
+                               files, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        for root, dirs, names in os.walk(source, topdown=False):
+            for name in dirs:
+                copystat(os.path.join(root, name), os.path.join(tmp, os.path.relpath(root, source), name))
+        copystat(source, tmp)
+        if os.path.isdir(target):
+            old = tempfile.mkdtemp(dir=parent, prefix="." + os.path.basename(target) + ".old.")
+            os.rename(target, os.path.join(old, "tag"))
+            logs = os.path.join(old, "tag", BUILD_STATS_DIR)
+            if os.path.isdir(logs):
+                # open log files remain valid, the rename keeps them on the same file system
+                os.rename(logs, os.path.join(tmp, BUILD_STATS_DIR))
+        os.rename(tmp, target)
+    except Exception:
+        if old is not None and not os.path.exists(target):
+            # put the previous tag directory, with the build logs, back
+            if os.path.isdir(os.path.join(tmp, BUILD_STATS_DIR)):
+                os.rename(os.path.join(tmp, BUILD_STATS_DIR), os.path.join(old, "tag", BUILD_STATS_DIR))
+            os.rename(os.path.join(old, "tag"), target)
+            rmtree(old, ignore_errors=True)
+        rmtree(tmp, ignore_errors=True)
+        raise
+    if old is not None:
+        rmtree(old, ignore_errors=True)
+    # the build logs are not part of the digest
+    return combine_digests(dict([("./" + "/".join(rel.split(os.sep)), d) for rel, d in zip(files, digests)
+                                 if not rel.startswith(BUILD_STATS_DIR)]), algorithm=algorithm)
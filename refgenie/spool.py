@@ -0,0 +1,187 @@
+"""
+Genome configuration spool for concurrent builds.
+
+Builds run concurrently, e.g. as cluster jobs, contend for the genome
+configuration file lock, since each of them rewrites the whole file, twice.
+Instead, a build can record the configuration updates it would make in a small
+file in the spool directory, next to the genome configuration file, and the
+records are merged into the genome configuration file later, under a single
+lock, by 'refgenie merge' or by the next command that writes the file.
+
+A record is a list of calls of the RefGenConf update methods, which are all
+idempotent, so a record merged twice, e.g. after an interrupted merge, does
+no harm. Until they are merged, the records are applied to the genome
+configuration objects read by refgenie, so the builds see the parent assets
+built by other jobs.
+"""
+
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+from itertools import count
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["SpoolRecorder", "spool_dir", "write_record", "pending_records", "apply_records", "merge_spool"]
+
+RECORD_VERSION = 1
+RECORD_EXT = ".json"
+# RefGenConf methods that records may call
+SPOOL_METHODS = ["update_genomes", "update_assets", "update_tags", "update_seek_keys", "update_relatives_assets",
+                 "set_default_pointer"]
+_counter = count()
+
+
+def spool_dir(gencfg):
+    """
+    Get the path to the spool directory of a genome configuration file
+
+    :param str gencfg: path to the genome configuration file
+    :return str: path to the spool directory
+    """
+    folder, name = os.path.split(os.path.abspath(gencfg))
+    return os.path.join(folder, TEMPLATE_SPOOL_DIR.format(name))
+
+
+class SpoolRecorder(object):
+    """
+    Stands in for a genome configuration object: records the calls of the
+    update methods and applies them to the object, so it reflects them
+    """
+
+    def __init__(self, rgc):
+        """
+        :param refgenconf.RefGenConf rgc: genome configuration object
+        """
+        self._rgc = rgc
+        self.calls = []
+
+    def __getattr__(self, name):
+        attr = getattr(self._rgc, name)
+        if name not in SPOOL_METHODS:
+            return attr
+
+        def _record(*args, **kwargs):
+            self.calls.append([name, list(args), kwargs])
+            return attr(*args, **kwargs)
+        return _record
+
+    def __getitem__(self, item):
+        return self._rgc[item]
+
+
+def write_record(path, calls):
+    """
+    Write a record to the spool directory atomically
+
+    :param str path: path to the spool directory
+    :param list[list] calls: names, positional and keyword arguments of the recorded calls
+    :return str: path to the record
+    """
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+    # the records are merged in the order of their names
+    name = "{:020.6f}_{}_{}_{}{}".format(time.time(), socket.gethostname(), os.getpid(), next(_counter), RECORD_EXT)
+    fd, tmp = tempfile.mkstemp(dir=path, prefix="." + name)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": RECORD_VERSION, "calls": calls}, f)
+        os.rename(tmp, os.path.join(path, name))
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _LOGGER.debug("Saved genome configuration updates to: {}".format(os.path.join(path, name)))
+    return os.path.join(path, name)
+
+
+def pending_records(path):
+    """
+    List the records in the spool directory
+
+    :param str path: path to the spool directory
+    :return list[str]: paths to the records, in the merge order
+    """
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return []
+    return [os.path.join(path, n) for n in sorted(names) if n.endswith(RECORD_EXT) and not n.startswith(".")]
+
+
+def _read_record(path):
+    try:
+        with open(path) as f:
+            record = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        _LOGGER.warning("Could not read genome configuration updates from '{}': {}".format(path, e))
+        return None
+    if record.get("version") != RECORD_VERSION:
+        _LOGGER.warning("Unsupported genome configuration updates version in: {}".format(path))
+        return None
+    invalid = [c[0] for c in record["calls"] if c[0] not in SPOOL_METHODS]
+    if invalid:
+        _LOGGER.warning("Invalid genome configuration updates ({}) in: {}".format(", ".join(invalid), path))
+        return None
+    return record["calls"]
+
+
+def apply_records(rgc, paths):
+    """
+    Apply the records to a genome configuration object
+
+    The records that cannot be read are skipped, and left in the spool directory.
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param list[str] paths: paths to the records
+    :return list[str]: paths to the applied records
+    """
+    applied = []
+    for path in paths:
+        calls = _read_record(path)
+        if calls is None:
+            continue
+        for name, args, kwargs in calls:
+            getattr(rgc, name)(*args, **dict([(str(k), v) for k, v in kwargs.items()]))
+        applied.append(path)
+    return applied
+
+
+def merge_spool(rgc, path):
+    """
+    Merge the records in the spool directory into the genome configuration file and remove them
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param str path: path to the spool directory
+    :return int: number of the merged records
+    """
+    if not pending_records(path):
+        return 0
+    readonly = not rgc.writable
+    if readonly:
+        rgc.make_writable()
+    try:
+        # list the records again, under the lock, so that concurrent merges do not repeat each other
+        applied = apply_records(rgc, pending_records(path))
+        if applied:
+            rgc.write()
+        for record in applied:
+            try:
+                os.remove(record)
+            except OSError:
+                pass
+    finally:
+        if readonly:
+            rgc.make_readonly()
+    if applied:
+        _LOGGER.info("Merged {} genome configuration updates".format(len(applied)))
+    return len(applied)
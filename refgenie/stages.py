@@ -0,0 +1,119 @@
+"""
+Native recipe stages.
+
+Besides shell commands, the recipe command lists may contain stages: mappings
+that name a Python function from the registry below and the arguments to call
+it with. The argument values are templates populated just like the shell
+commands, e.g.:
+
+    {STAGE: "ensembl_gtf", STAGE_ARGS: {"gtf": "{asset_outfolder}/{genome}.gtf.gz", ...}}
+
+Stages are run in the refgenie process, on the host, also when the build is
+run in a container.
+
+A list in the command list is a group of independent commands, which are run
+concurrently. Each item of a group is a command, a stage, or a list of
+commands run in order, e.g.:
+
+    [["grep ...", "sed ..."], "cat ..."]
+"""
+
+import json
+import logging
+
+from .annotation import ensembl_gtf, refgene_anno, feat_annotation, dbnsfp
+from .asset_build_packages import STAGE, STAGE_ARGS
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["STAGES", "is_stage", "is_group", "populate_stage", "populate_command", "format_command", "run_stage"]
+
+STAGES = {
+    "ensembl_gtf": ensembl_gtf,
+    "refgene_anno": refgene_anno,
+    "feat_annotation": feat_annotation,
+    "dbnsfp": dbnsfp
+}
+
+
+def is_stage(cmd):
+    """
+    Check whether a recipe command is a native stage
+
+    :param str | Mapping cmd: recipe command
+    :return bool: whether the command is a stage
+    """
+    return isinstance(cmd, dict) and STAGE in cmd
+
+
+def is_group(cmd):
+    """
+    Check whether a recipe command is a group of independent commands
+
+    :param str | Mapping | list cmd: recipe command
+    :return bool: whether the command is a group
+    """
+    return isinstance(cmd, list)
+
+
+def populate_stage(cmd, variables):
+    """
+    Populate the argument templates of a stage
+
+    :param Mapping cmd: the stage
+    :param Mapping variables: values to populate the templates with
+    :return Mapping: the populated stage
+    """
+    if cmd[STAGE] not in STAGES:
+        raise ValueError("Unknown recipe stage: '{}'. Available stages: {}".
+                         format(cmd[STAGE], ", ".join(sorted(STAGES.keys()))))
+    return {STAGE: cmd[STAGE], STAGE_ARGS: {k: v.format(**variables) for k, v in cmd.get(STAGE_ARGS, {}).items()}}
+
+
+def populate_command(cmd, variables, depth=0):
+    """
+    Populate the templates of a recipe command, a stage or a group
+
+    :param str | Mapping | list cmd: recipe command
+    :param Mapping variables: values to populate the templates with
+    :param int depth: nesting level of the command; groups are the first
+        level and the command sequences in the groups the second
+    :return str | Mapping | list: the populated command
+    :raise ValueError: if the command is nested too deeply
+    """
+    if is_stage(cmd):
+        return populate_stage(cmd, variables)
+    if is_group(cmd):
+        if depth > 1:
+            raise ValueError("Recipe command groups may only contain commands, stages and command sequences: "
+                             "{}".format(cmd))
+        return [populate_command(x, variables, depth + 1) for x in cmd]
+    return cmd.format(**variables)
+
+
+def format_command(cmd, depth=0):
+    """
+    Get a printable representation of a populated recipe command
+
+    The commands of a group are joined with '&', like the shell jobs run in
+    the background, and the command sequences in a group with ';'.
+
+    :param str | Mapping | list cmd: recipe command
+    :param int depth: nesting level of the command
+    :return str: the command
+    """
+    if is_stage(cmd):
+        return json.dumps(cmd)
+    if is_group(cmd):
+        return "(" + (" & " if depth == 0 else "; ").join([format_command(x, depth + 1) for x in cmd]) + ")"
+    return cmd
+
+
+def run_stage(cmd):
+    """
+    Run a populated stage
+
+    :param Mapping cmd: the stage
+    """
+    _LOGGER.info("Running stage '{}': {}".format(cmd[STAGE], cmd[STAGE_ARGS]))
+    STAGES[cmd[STAGE]](**cmd[STAGE_ARGS])
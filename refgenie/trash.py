@@ -0,0 +1,170 @@
+"""
+Trash area for the removed assets.
+
+Deleting an asset directory with thousands of files takes long on a shared
+file system, e.g. Lustre, where every unlink is a metadata server operation.
+'refgenie remove' moves the directories of the removed assets to the trash
+directory in the genome folder instead, with a rename, which is instant, and
+deletes them afterwards: the files are unlinked on a pool of threads, in the
+foreground or in a detached background process.
+
+A deletion that is interrupted leaves its entry in the trash directory, where
+'refgenie gc' finds it.
+"""
+
+import errno
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["trash_dir", "trash_entries", "move_to_trash", "delete_tree", "empty_trash", "empty_trash_in_background"]
+
+
+def trash_dir(folder):
+    """
+    Get the path to the trash directory of a genome folder
+
+    :param str folder: path to the genome folder
+    :return str: path to the trash directory
+    """
+    return os.path.join(folder, TRASH_DIR)
+
+
+def trash_entries(folder, genomes=None):
+    """
+    List the entries in the trash directory
+
+    :param str folder: path to the genome folder
+    :param list[str] genomes: genomes to list the entries of, all by default
+    :return list[str]: paths to the entries
+    """
+    try:
+        names = sorted(os.listdir(trash_dir(folder)))
+    except OSError:
+        return []
+    if genomes:
+        names = [n for n in names if n.split("__")[0] in genomes]
+    return [os.path.join(trash_dir(folder), n) for n in names]
+
+
+def move_to_trash(folder, genome, path):
+    """
+    Move a file or directory to the trash directory
+
+    The trash directory is in the genome folder, so the move is a rename
+    unless the path is on another file system.
+
+    :param str folder: path to the genome folder
+    :param str genome: genome name, the entries are named after
+    :param str path: path to move
+    :return str: path to the trash entry, None if the path cannot be renamed into it
+    """
+    trash = trash_dir(folder)
+    if not os.path.isdir(trash):
+        try:
+            os.makedirs(trash)
+        except OSError:
+            if not os.path.isdir(trash):
+                raise
+    entry = tempfile.mkdtemp(dir=trash, prefix="{}__{}.".format(genome, os.path.basename(path)))
+    try:
+        os.rename(path, os.path.join(entry, os.path.basename(path)))
+    except OSError as e:
+        os.rmdir(entry)
+        if e.errno != errno.EXDEV:
+            raise
+        _LOGGER.debug("Not on the genome folder file system, not moving to the trash: {}".format(path))
+        return None
+    return entry
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError as e:
+        # the entries may be deleted by a concurrent 'refgenie gc'
+        if e.errno != errno.ENOENT:
+            _LOGGER.warning("Could not delete '{}': {}".format(path, e))
+            return path
+
+
+def delete_tree(path, threads=16):
+    """
+    Delete a directory tree, unlinking the files on a pool of threads
+
+    :param str path: path to the directory
+    :param int threads: number of threads to unlink the files on
+    :return bool: whether the directory was deleted
+    """
+    if not os.path.isdir(path) or os.path.islink(path):
+        return _unlink(path) is None
+    files, dirs = [], []
+    for root, dnames, fnames in os.walk(path):
+        dirs.append(root)
+        # os.walk lists the links to directories with the directories, without following them
+        files += [os.path.join(root, n) for n in fnames]
+        files += [os.path.join(root, n) for n in dnames if os.path.islink(os.path.join(root, n))]
+    pool = ThreadPool(max(1, min(threads, len(files))))
+    try:
+        failed = [p for p in pool.map(_unlink, files, chunksize=64) if p is not None]
+    finally:
+        pool.close()
+        pool.join()
+    for d in reversed(dirs):
+        try:
+            os.rmdir(d)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                failed.append(d)
+    if failed:
+        _LOGGER.warning("Could not delete {} files and directories in: {}".format(len(failed), path))
+    return not failed
+
+
+def empty_trash(entries, threads=16):
+    """
+    Delete the trash entries
+
+    :param list[str] entries: paths to the trash entries
+    :param int threads: number of threads to unlink the files on
+    :return list[str]: the entries that could not be deleted
+    """
+    return [e for e in entries if not delete_tree(e, threads)]
+
+
+def empty_trash_in_background(entries, threads=16):
+    """
+    Delete the trash entries in a detached process, which outlives the current one
+
+    :param list[str] entries: paths to the trash entries
+    :param int threads: number of threads to unlink the files on
+    :return int: process ID of the deleting process
+    """
+    cmd = [sys.executable, "-m", __name__, "--threads", str(threads)] + list(entries)
+    with open(os.devnull, "r+") as devnull:
+        # a new session, so that the process is not stopped with the terminal or the job of the current one
+        proc = subprocess.Popen(cmd, stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True,
+                                preexec_fn=os.setsid)
+    _LOGGER.debug("Deleting the trash entries in the background, process {}: {}".format(proc.pid, " ".join(cmd)))
+    return proc.pid
+
+
+def main():
+    """ Delete the trash entries given on the command line """
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description="Delete refgenie trash entries.")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("entries", nargs="+")
+    args = parser.parse_args()
+    sys.exit(1 if empty_trash(args.entries, args.threads) else 0)
+
+
+if __name__ == '__main__':
+    main()
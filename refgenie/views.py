@@ -0,0 +1,140 @@
+"""
+Symbolic link views of the genome configuration.
+
+Tools that cannot call 'refgenie seek' can find the assets in a views
+folder instead, a tree of symbolic links that mirrors the registry paths:
+
+    <views folder>/<genome>/<asset>/<tag> -> the path 'refgenie seek genome/asset:tag' returns
+    <views folder>/<genome>/<asset>.<seek key>/<tag> -> the path of the seek key
+    <views folder>/<genome>/<asset>/_default -> <default tag>
+
+The views folder is set with the 'views_folder' genome configuration key.
+refgenie refreshes it after the commands that write the genome configuration;
+only the links that changed are replaced, each with a rename, so the tree is
+consistent for the readers at all times. Files that are not links are never
+removed from the views folder.
+"""
+
+import logging
+import os
+
+from refgenconf import RefgenconfError
+from refgenconf.const import *
+
+from .const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+__all__ = ["views_folder", "view_links", "refresh_views"]
+
+
+def views_folder(rgc):
+    """
+    Get the views folder of a genome configuration
+
+    A relative path is relative to the directory of the genome configuration file.
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :return str: absolute path to the views folder, None if it is not set
+    """
+    folder = rgc.get(CFG_VIEWS_FOLDER_KEY)
+    if not folder:
+        return None
+    folder = os.path.expandvars(os.path.expanduser(folder))
+    if not os.path.isabs(folder) and rgc.file_path:
+        folder = os.path.join(os.path.dirname(os.path.abspath(rgc.file_path)), folder)
+    return os.path.abspath(folder)
+
+
+def view_links(rgc):
+    """
+    Get the links that make up the views of the registered assets
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :return dict[str, str]: link targets, keyed by the link paths relative to the views folder
+    """
+    links = {}
+    for genome, genome_data in (rgc[CFG_GENOMES_KEY] or {}).items():
+        for asset, asset_data in ((genome_data or {}).get(CFG_ASSETS_KEY) or {}).items():
+            default = asset_data.get(CFG_ASSET_DEFAULT_TAG_KEY)
+            for tag, tag_data in (asset_data.get(CFG_ASSET_TAGS_KEY) or {}).items():
+                if CFG_ASSET_PATH_KEY not in tag_data:
+                    continue
+                seek_keys = list((tag_data.get(CFG_SEEK_KEYS_KEY) or {}).keys())
+                for seek_key in [None] + [k for k in seek_keys if k != asset]:
+                    try:
+                        path = rgc.seek(genome, asset, tag, seek_key)
+                    except (KeyError, TypeError, RefgenconfError) as e:
+                        _LOGGER.debug("Not viewing '{}/{}.{}:{}': {}".format(genome, asset, seek_key, tag, e))
+                        continue
+                    name = asset if seek_key is None else "{}.{}".format(asset, seek_key)
+                    links[os.path.join(genome, name, tag)] = os.path.abspath(path)
+                    if tag == default:
+                        links[os.path.join(genome, name, VIEWS_DEFAULT_LINK)] = tag
+    return links
+
+
+def _existing_links(folder):
+    """
+    List the links in the views folder
+
+    :param str folder: path to the views folder
+    :return dict[str, str]: link targets, keyed by the link paths relative to the views folder
+    """
+    links = {}
+    for root, dirs, names in os.walk(folder):
+        for name in dirs + names:
+            path = os.path.join(root, name)
+            if os.path.islink(path):
+                links[os.path.relpath(path, folder)] = os.readlink(path)
+    return links
+
+
+def refresh_views(rgc, folder=None):
+    """
+    Bring the views folder in line with the genome configuration
+
+    :param refgenconf.RefGenConf rgc: genome configuration object
+    :param str folder: path to the views folder, the one set in the genome configuration by default
+    :return (int, int): numbers of the created or replaced links and of the removed links
+    """
+    folder = folder or views_folder(rgc)
+    if not folder:
+        raise ValueError("The views folder is not set, use the '{}' genome configuration key".
+                         format(CFG_VIEWS_FOLDER_KEY))
+    wanted = view_links(rgc)
+    existing = _existing_links(folder) if os.path.isdir(folder) else {}
+    changed = 0
+    for rel in sorted(wanted):
+        if existing.get(rel) == wanted[rel]:
+            continue
+        link = os.path.join(folder, rel)
+        if os.path.lexists(link) and not os.path.islink(link):
+            _LOGGER.warning("Not replacing a file that is not a link in the views folder: {}".format(link))
+            continue
+        if not os.path.isdir(os.path.dirname(link)):
+            os.makedirs(os.path.dirname(link))
+        tmp = "{}.{}.tmp".format(link, os.getpid())
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        os.symlink(wanted[rel], tmp)
+        os.rename(tmp, link)
+        changed += 1
+    removed = 0
+    for rel in sorted(set(existing) - set(wanted)):
+        try:
+            os.remove(os.path.join(folder, rel))
+            removed += 1
+        except OSError as e:
+            _LOGGER.debug("Could not remove '{}': {}".format(rel, e))
+    # the directories of the removed genomes and assets
+    for root, dirs, names in os.walk(folder, topdown=False):
+        if root != folder and not os.listdir(root):
+            try:
+                os.rmdir(root)
+            except OSError:
+                # a concurrent refresh created a link in it
+                pass
+    if changed or removed:
+        _LOGGER.info("Refreshed the views in '{}': {} links created, {} removed".format(folder, changed, removed))
+    return changed, removed
@@ -51,7 +51,8 @@ setup(
     entry_points={
         "console_scripts": [
             'refgenie = refgenie.__main__:main',
-            'import_igenome = refgenie.add_assets_igenome:main'
+            'import_igenome = refgenie.add_assets_igenome:main',
+            'build_all_genome = refgenie.build_all_genome:main'
         ],
     },
     keywords="bioinformatics, sequencing, ngs",
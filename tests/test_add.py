@@ -0,0 +1,70 @@
+""" Tests of the additions of external assets """
+
+import logging
+
+import pytest
+import yaml
+from refgenconf import RefGenConf
+
+import refgenie.refgenie
+from refgenie.const import CFG_ASSET_DIGEST_ALGORITHM_KEY
+from refgenie.digest import dir_digest
+from refgenie.refgenie import get_dir_digest, refgenie_add, refgenie_add_manifest
+
+GENOME = "rCRSd"
+
+
+@pytest.fixture(autouse=True)
+def logger(monkeypatch):
+    """ Set the logger that the CLI sets up """
+    monkeypatch.setattr(refgenie.refgenie, "_LOGGER", logging.getLogger("refgenie"))
+
+
+@pytest.fixture
+def rgc(tmpdir):
+    """ Genome configuration with no assets and two asset directories to add """
+    folder = tmpdir.mkdir("genomes")
+    for asset in ["blacklist", "gencode"]:
+        folder.join(GENOME, asset, "{}.txt".format(asset)).write(asset * 1000, ensure=True)
+        folder.join(GENOME, asset, "sub", "more.txt").write("more", ensure=True)
+    cfg = {"config_version": 0.3, "genome_folder": str(folder),
+           "genome_servers": ["http://refgenomes.databio.org"], "genomes": {}}
+    with open(str(tmpdir.join("genome_config.yaml")), "w") as f:
+        yaml.safe_dump(cfg, f)
+    return RefGenConf(filepath=str(tmpdir.join("genome_config.yaml")), writable=False)
+
+
+def _tag(rgc, asset, tag="default"):
+    cfg = RefGenConf(filepath=rgc.file_path, writable=False)
+    return cfg["genomes"][GENOME]["assets"][asset]["tags"][tag]
+
+
+def test_add_md5_digest(rgc):
+    asset = {"genome": GENOME, "asset": "blacklist", "tag": "default", "seek_key": None}
+    assert refgenie_add(rgc, asset, "blacklist", force=True)
+    tag_data = _tag(rgc, "blacklist")
+    assert tag_data[CFG_ASSET_DIGEST_ALGORITHM_KEY] == "md5"
+    assert tag_data["asset_digest"] == get_dir_digest(rgc.seek(GENOME, "blacklist", "default", enclosing_dir=True))
+
+
+def test_add_digest_algorithm(rgc):
+    asset = {"genome": GENOME, "asset": "blacklist", "tag": "default", "seek_key": None}
+    assert refgenie_add(rgc, asset, "blacklist", force=True, algorithm="blake2b", threads=2)
+    tag_data = _tag(rgc, "blacklist")
+    assert tag_data[CFG_ASSET_DIGEST_ALGORITHM_KEY] == "blake2b"
+    tag_dir = rgc.seek(GENOME, "blacklist", "default", enclosing_dir=True)
+    assert tag_data["asset_digest"] == dir_digest(tag_dir, algorithm="blake2b")
+    assert tag_data["asset_digest"] != dir_digest(tag_dir)
+
+
+def test_add_manifest_digest_algorithm(rgc, tmpdir):
+    manifest = tmpdir.join("manifest.yaml")
+    manifest.write(yaml.safe_dump({"{}/blacklist".format(GENOME): "blacklist",
+                                   "{}/gencode_gtf:35".format(GENOME): {"path": "gencode",
+                                                                        "seek_keys": {"gtf": "gencode.txt"}}}))
+    assert refgenie_add_manifest(rgc, str(manifest), force=True, threads=4, algorithm="blake2b")
+    for asset, tag in [("blacklist", "default"), ("gencode_gtf", "35")]:
+        tag_data = _tag(rgc, asset, tag)
+        assert tag_data[CFG_ASSET_DIGEST_ALGORITHM_KEY] == "blake2b"
+        tag_dir = RefGenConf(filepath=rgc.file_path, writable=False).seek(GENOME, asset, tag, enclosing_dir=True)
+        assert tag_data["asset_digest"] == dir_digest(tag_dir, algorithm="blake2b")
@@ -0,0 +1,92 @@
+""" Tests of the chunked asset storage """
+
+import os
+import random
+from io import BytesIO
+
+import pytest
+import yaml
+from refgenconf import RefGenConf
+
+from refgenie.chunks import export_asset, fetch_manifest, restore_asset, check_manifest, iter_chunks
+from refgenie.exceptions import ChunkStoreError
+
+GENOME = "hg38"
+ASSET = "gencode_gtf"
+
+
+def _lines(n, seed):
+    rng = random.Random(seed)
+    return ["chr{}\t{}\t{}\tgene{}\n".format(rng.randrange(22), rng.randrange(10 ** 8), rng.random(), i)
+            for i in range(n)]
+
+
+@pytest.fixture
+def rgc(tmpdir):
+    """ Genome configuration with two tags of an asset, which differ in one line """
+    folder = tmpdir.mkdir("genomes")
+    lines = _lines(40000, 0)
+    tags = {}
+    for tag in ["v1", "v2"]:
+        if tag == "v2":
+            lines[20000] = "chrX\t1\t2\tedited\n"
+        folder.join(GENOME, ASSET, tag, "genes.gtf").write("".join(lines), ensure=True)
+        folder.join(GENOME, ASSET, tag, "sub", "small.txt").write(tag, ensure=True)
+        os.symlink("genes.gtf", str(folder.join(GENOME, ASSET, tag, "link.gtf")))
+        tags[tag] = {"asset_path": ASSET, "asset_digest": "a3c46f201a3ce7831d85cf4a125aa334",
+                     "seek_keys": {"gtf": "genes.gtf"}}
+    cfg = {"config_version": 0.3, "genome_folder": str(folder), "genome_servers": ["http://refgenomes.databio.org"],
+           "genomes": {GENOME: {"assets": {ASSET: {"default_tag": "v2", "tags": tags}}}}}
+    with open(str(tmpdir.join("genome_config.yaml")), "w") as f:
+        yaml.safe_dump(cfg, f)
+    return RefGenConf(filepath=str(tmpdir.join("genome_config.yaml")), writable=False)
+
+
+def _tree(path):
+    files = {}
+    for root, dirs, names in os.walk(path):
+        for name in names:
+            p = os.path.join(root, name)
+            with open(p, "rb") as f:
+                files[os.path.relpath(p, path)] = (os.path.islink(p), f.read())
+    return files
+
+
+def test_chunks_are_content_defined():
+    data = "".join(_lines(20000, 1)).encode()
+    edited = data[:1000] + b"x" + data[1000:]
+    chunks = list(iter_chunks(BytesIO(data)))
+    edited_chunks = list(iter_chunks(BytesIO(edited)))
+    assert b"".join(chunks) == data
+    assert len(set(chunks) & set(edited_chunks)) >= len(chunks) - 2
+
+
+def test_export_restore_round_trip(rgc, tmpdir):
+    store = str(tmpdir.join("store"))
+    folder = tmpdir.join("genomes", GENOME, ASSET)
+    new, total, _, _ = export_asset(rgc, GENOME, ASSET, "v1", store)
+    assert new == total > 2
+    new, total, _, _ = export_asset(rgc, GENOME, ASSET, "v2", store)
+    # the tags share all the chunks but the edited one and the small file
+    assert 0 < new <= 3
+    expected = _tree(str(folder.join("v2")))
+    folder.join("v2").remove()
+    manifest = fetch_manifest(store, GENOME, ASSET)
+    assert manifest["tag"] == "v2"
+    fetched, copied = restore_asset(rgc, manifest, store)
+    assert _tree(str(folder.join("v2"))) == expected
+    assert os.readlink(str(folder.join("v2", "link.gtf"))) == "genes.gtf"
+    # the chunks of the v1 tag are copied from it instead of being fetched
+    assert copied > fetched
+
+
+def test_manifest_paths_out_of_tag_rejected(rgc, tmpdir):
+    store = str(tmpdir.join("store"))
+    export_asset(rgc, GENOME, ASSET, "v1", store)
+    manifest = fetch_manifest(store, GENOME, ASSET, "v1")
+    manifest["files"][0]["path"] = "../../escaped.txt"
+    with pytest.raises(ChunkStoreError):
+        check_manifest(manifest, GENOME, ASSET, "v1")
+    manifest = fetch_manifest(store, GENOME, ASSET, "v1")
+    with pytest.raises(ChunkStoreError):
+        check_manifest(manifest, GENOME, ASSET, "v2")
@@ -0,0 +1,52 @@
+""" Tests of the SQLite genome configuration backend """
+
+import pytest
+import yaml
+from refgenconf import RefGenConf
+
+from refgenie.config_db import DBRefGenConf, config_entries
+from refgenie.refgenie import refgenie_convert
+
+DIGESTS = ["a3c46f201a3ce7831d85cf4a125aa334", "0bb7ca3b95e5e4fbcd89e9a2bbd1d0d7", "f15b3b1d2e3a0c6f7a4b9d8e1c2f3a4b"]
+TAG = {"asset_path": "fasta", "asset_digest": DIGESTS[0], "seek_keys": {"fasta": "g.fa", "fai": "g.fa.fai"}}
+
+
+@pytest.fixture
+def yaml_cfg(tmpdir):
+    """ YAML genome configuration with two genomes """
+    genomes = {
+        "hg38": {"genome_description": "human", "assets": {
+            "fasta": {"default_tag": "default", "asset_description": "sequences",
+                      "tags": {"default": TAG, "v2": dict(TAG, asset_digest=DIGESTS[1])}},
+            "bowtie2_index": {"default_tag": "default", "tags": {"default": dict(TAG, asset_path="bowtie2_index")}}}},
+        "mm10": {"assets": {"fasta": {"default_tag": "default", "tags": {"default": TAG}}}}
+    }
+    cfg = {"config_version": 0.3, "genome_folder": str(tmpdir), "genome_servers": ["http://refgenomes.databio.org"],
+           "genomes": genomes}
+    path = str(tmpdir.join("genome_config.yaml"))
+    with open(path, "w") as f:
+        yaml.safe_dump(cfg, f)
+    return path
+
+
+def test_convert_round_trip(yaml_cfg, tmpdir):
+    rgc = RefGenConf(filepath=yaml_cfg, writable=False)
+    db = str(tmpdir.join("genome_config.sqlite"))
+    assert refgenie_convert(rgc, db)
+    assert config_entries(DBRefGenConf(filepath=db)) == config_entries(rgc)
+    back = str(tmpdir.join("back.yaml"))
+    assert refgenie_convert(DBRefGenConf(filepath=db), back)
+    assert config_entries(RefGenConf(filepath=back, writable=False)) == config_entries(rgc)
+
+
+def test_selective_read_and_write(yaml_cfg, tmpdir):
+    db = str(tmpdir.join("genome_config.db"))
+    refgenie_convert(RefGenConf(filepath=yaml_cfg, writable=False), db)
+    assert list(DBRefGenConf(filepath=db, genomes=["mm10"])["genomes"].keys()) == ["mm10"]
+    rgc = DBRefGenConf(filepath=db, writable=True)
+    rgc.update_tags("mm10", "fasta", "default", data={"asset_digest": DIGESTS[2]})
+    rgc.write()
+    rgc.make_readonly()
+    reread = DBRefGenConf(filepath=db)
+    assert reread["genomes"]["mm10"]["assets"]["fasta"]["tags"]["default"]["asset_digest"] == DIGESTS[2]
+    assert reread["genomes"]["hg38"]["assets"]["fasta"]["tags"]["v2"]["asset_digest"] == DIGESTS[1]
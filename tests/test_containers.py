@@ -0,0 +1,80 @@
+""" Tests of the build container sessions, run against the fake docker CLI in tests/fake_runtime """
+
+import json
+import os
+import subprocess
+
+import pytest
+
+from refgenie.containers import ContainerSession, _normalize
+
+FAKE_RUNTIME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_runtime")
+IMAGE = "databio/refgenie"
+
+
+@pytest.fixture
+def docker_log(tmpdir, monkeypatch):
+    """ Put the fake docker CLI first on the PATH and get the path to its log """
+    log = str(tmpdir.join("docker.log"))
+    monkeypatch.setenv("FAKE_DOCKER_LOG", log)
+    monkeypatch.setenv("PATH", FAKE_RUNTIME + os.pathsep + os.environ["PATH"])
+    # the containers mount the working directory, which must not contain the test volumes
+    monkeypatch.chdir(str(tmpdir.mkdir("workdir")))
+    return log
+
+
+def _calls(log):
+    with open(log) as f:
+        return [json.loads(line) for line in f]
+
+
+def _mounts(call):
+    return [call[i + 1].split(":")[0] for i, arg in enumerate(call) if arg == "-v"]
+
+
+def _running(log):
+    with open(log + ".containers") as f:
+        return json.load(f)
+
+
+def test_one_container_per_image(docker_log, tmpdir):
+    genome_folder = tmpdir.mkdir("genomes")
+    with ContainerSession() as session:
+        container = session.container(IMAGE, [str(genome_folder)])
+        assert session.container(IMAGE, [str(genome_folder.mkdir("hg38"))]) == container
+        # the recipe commands are executed in the container, like pypiper does
+        subprocess.check_call(["docker", "exec", container, "sh", "-c", "echo done > out.txt"])
+    assert [c[0] for c in _calls(docker_log)] == ["run", "exec", "rm"]
+    assert _calls(docker_log)[-1] == ["rm", "-f", container]
+    assert str(genome_folder) in _mounts(_calls(docker_log)[0])
+    assert tmpdir.join("workdir", "out.txt").read().strip() == "done"
+    assert _running(docker_log) == []
+
+
+def test_container_replaced_to_mount_a_volume(docker_log, tmpdir):
+    with ContainerSession(volumes=[str(tmpdir.mkdir("shared"))]) as session:
+        first = session.container(IMAGE, [str(tmpdir.mkdir("a"))])
+        second = session.container(IMAGE, [str(tmpdir.mkdir("b"))])
+        assert second != first
+        assert _running(docker_log) == [second]
+    calls = _calls(docker_log)
+    assert [c[0] for c in calls] == ["run", "rm", "run", "rm"]
+    assert calls[1] == ["rm", "-f", first]
+    assert set([str(tmpdir.join(d)) for d in ["shared", "a", "b"]]) <= set(_mounts(calls[2]))
+    with pytest.raises(subprocess.CalledProcessError):
+        subprocess.check_call(["docker", "exec", first, "true"])
+
+
+def test_containers_removed_when_interrupted(docker_log):
+    with pytest.raises(KeyboardInterrupt):
+        with ContainerSession() as session:
+            session.container(IMAGE)
+            session.container("databio/other")
+            raise KeyboardInterrupt
+    assert [c[0] for c in _calls(docker_log)] == ["run", "run", "rm", "rm"]
+    assert _running(docker_log) == []
+
+
+def test_normalize_drops_nested_paths(tmpdir):
+    assert _normalize([str(tmpdir.join("a", "b")), str(tmpdir.join("a")), str(tmpdir.join("ab"))]) == \
+        [str(tmpdir.join("a")), str(tmpdir.join("ab"))]
@@ -0,0 +1,63 @@
+""" Tests of the collection of the unreferenced directories in the genome folder """
+
+import logging
+
+import pytest
+import yaml
+from refgenconf import RefGenConf
+from refgenconf.const import BUILD_STATS_DIR
+
+import refgenie.refgenie
+from refgenie.gc import find_orphans, KIND_FAILED, KIND_UNKNOWN, KIND_UNREGISTERED
+from refgenie.refgenie import refgenie_gc
+
+GENOME = "rCRSd"
+
+
+@pytest.fixture(autouse=True)
+def logger(monkeypatch):
+    """ Set the logger that the CLI sets up """
+    monkeypatch.setattr(refgenie.refgenie, "_LOGGER", logging.getLogger("refgenie"))
+
+
+@pytest.fixture
+def folder(tmpdir):
+    """ Genome folder with a registered asset and unreferenced directories of each kind """
+    folder = tmpdir.mkdir("genomes")
+    folder.join(GENOME, "fasta", "default", "rCRSd.fa").write(">chrM\nACGT\n", ensure=True)
+    folder.join(GENOME, "fasta", "old", BUILD_STATS_DIR, "refgenie_completed.flag").write("", ensure=True)
+    folder.join(GENOME, "bowtie2_index", "default", BUILD_STATS_DIR, "refgenie_failed.flag").write("", ensure=True)
+    folder.join(GENOME, "notes", "todo.txt").write("keep me", ensure=True)
+    cfg = {"config_version": 0.3, "genome_folder": str(folder),
+           "genome_servers": ["http://refgenomes.databio.org"],
+           "genomes": {GENOME: {"assets": {"fasta": {"default_tag": "default", "tags": {"default": {
+               "asset_path": "fasta", "asset_digest": "0" * 32, "seek_keys": {"fasta": "rCRSd.fa"}}}}}}}}
+    with open(str(tmpdir.join("genome_config.yaml")), "w") as f:
+        yaml.safe_dump(cfg, f)
+    return folder
+
+
+def _rgc(tmpdir):
+    return RefGenConf(filepath=str(tmpdir.join("genome_config.yaml")), writable=False)
+
+
+def test_find_orphans_kinds(tmpdir, folder):
+    found = dict([(p, k) for p, k, _ in find_orphans(_rgc(tmpdir), min_age=0)])
+    assert found == {str(folder.join(GENOME, "fasta", "old")): KIND_UNREGISTERED,
+                     str(folder.join(GENOME, "bowtie2_index")): KIND_FAILED,
+                     str(folder.join(GENOME, "notes")): KIND_UNKNOWN}
+
+
+def test_unknown_directories_kept(tmpdir, folder, capsys):
+    assert refgenie_gc(_rgc(tmpdir), delete=True, force=True, min_age=0)
+    assert "--include-unregistered" in capsys.readouterr().out
+    assert folder.join(GENOME, "notes", "todo.txt").check(file=1)
+    assert not folder.join(GENOME, "fasta", "old").check()
+    assert not folder.join(GENOME, "bowtie2_index").check()
+    assert folder.join(GENOME, "fasta", "default", "rCRSd.fa").check(file=1)
+
+
+def test_unknown_directories_included(tmpdir, folder):
+    assert refgenie_gc(_rgc(tmpdir), delete=True, force=True, min_age=0, include_unregistered=True)
+    assert not folder.join(GENOME, "notes").check()
+    assert folder.join(GENOME, "fasta", "default", "rCRSd.fa").check(file=1)
@@ -0,0 +1,55 @@
+""" Tests of the concurrent recipe command groups """
+
+import logging
+import sys
+import time
+
+import pypiper
+import pytest
+
+import refgenie.refgenie
+from refgenie.profiling import BuildProfiler
+from refgenie.refgenie import _run_group
+
+BUSY = "{} -c 'import time; t = time.time()\nwhile time.time() - t < 0.5: pass'".format(sys.executable)
+
+
+class Manager(object):
+    """ The attributes of the pipeline manager that the groups read """
+    new_start = False
+    container = None
+
+
+@pytest.fixture(autouse=True)
+def logger(monkeypatch):
+    """ Set the logger that the CLI sets up """
+    monkeypatch.setattr(refgenie.refgenie, "_LOGGER", logging.getLogger("refgenie"))
+
+
+def test_cpu_time_per_command(tmpdir):
+    profiler = BuildProfiler("g", "a", "t", "r")
+    _run_group(Manager(), [BUSY, "sleep 0.5", ["true", "touch {}".format(tmpdir.join("out"))]],
+               str(tmpdir.join("target.flag")), profiler, workers=3)
+    cpu = dict([(c["command"], c["cpu_time"]) for c in profiler.commands])
+    assert cpu[BUSY] > 0.3
+    assert cpu["sleep 0.5"] < 0.2
+    assert tmpdir.join("out").check(file=1)
+    assert all([c["status"] == "completed" for c in profiler.commands])
+
+
+def test_failure_terminates_the_group(tmpdir):
+    profiler = BuildProfiler("g", "a", "t", "r")
+    start = time.time()
+    with pytest.raises(pypiper.exceptions.SubprocessError):
+        _run_group(Manager(), ["sleep 30", "sleep 0.2; false", ["sleep 0.5", "touch {}".format(tmpdir.join("out"))]],
+                   str(tmpdir.join("target.flag")), profiler, workers=3)
+    assert time.time() - start < 10
+    assert not tmpdir.join("out").check()
+    assert [c["status"] for c in profiler.commands] == ["failed"] * 3
+
+
+def test_skipped_once_the_target_exists(tmpdir):
+    target = tmpdir.join("target.flag")
+    target.write("")
+    _run_group(Manager(), ["touch {}".format(tmpdir.join("out"))], str(target), BuildProfiler("g", "a", "t", "r"))
+    assert not tmpdir.join("out").check()
@@ -0,0 +1,59 @@
+""" Tests of the asset removal with a single genome configuration write """
+
+import logging
+import os
+
+import pytest
+import yaml
+from refgenconf import RefGenConf
+
+import refgenie.refgenie
+from refgenie.refgenie import refgenie_remove
+
+GENOME = "rCRSd"
+
+
+@pytest.fixture(autouse=True)
+def logger(monkeypatch):
+    """ Set the logger that the CLI sets up """
+    monkeypatch.setattr(refgenie.refgenie, "_LOGGER", logging.getLogger("refgenie"))
+
+
+def _tag(asset):
+    return {"asset_path": asset, "asset_digest": "0" * 32, "seek_keys": {asset: "."}}
+
+
+def _rgc(tmpdir, assets):
+    """ Write a genome configuration with the assets of one genome, all with tag 'default' """
+    folder = tmpdir.mkdir("genomes")
+    for asset in assets:
+        folder.join(GENOME, asset, "default", "file.txt").write("data", ensure=True)
+    cfg = {"config_version": 0.3, "genome_folder": str(folder),
+           "genome_servers": ["http://refgenomes.databio.org"],
+           "genomes": {GENOME: {"assets": {a: {"default_tag": "default", "tags": {"default": _tag(a)}}
+                                           for a in assets}}}}
+    path = str(tmpdir.join("genome_config.yaml"))
+    with open(path, "w") as f:
+        yaml.safe_dump(cfg, f)
+    return RefGenConf(filepath=path, writable=False), folder
+
+
+def _asset(asset):
+    return {"genome": GENOME, "asset": asset, "tag": "default"}
+
+
+def test_remove_one_of_assets(tmpdir):
+    rgc, folder = _rgc(tmpdir, ["fasta", "bowtie2_index"])
+    assert refgenie_remove(rgc, [_asset("bowtie2_index")], force=True)
+    assets = RefGenConf(filepath=rgc.file_path, writable=False)["genomes"][GENOME]["assets"]
+    assert list(assets.keys()) == ["fasta"]
+    assert folder.join(GENOME, "fasta", "default").check(dir=1)
+    assert not folder.join(GENOME, "bowtie2_index").check()
+
+
+def test_remove_last_asset(tmpdir):
+    rgc, folder = _rgc(tmpdir, ["fasta"])
+    assert refgenie_remove(rgc, [_asset("fasta")], force=True)
+    assert not RefGenConf(filepath=rgc.file_path, writable=False)["genomes"]
+    assert not folder.join(GENOME).check()
+    assert not [e for e in os.listdir(str(folder)) if not e.startswith(".")]
@@ -0,0 +1,42 @@
+""" Tests of the publication of the assets built in a scratch directory """
+
+import os
+
+from refgenconf.const import BUILD_STATS_DIR
+
+from refgenie.digest import dir_digest
+from refgenie.scratch import make_scratch_dir, publish_asset
+
+
+def _built_asset(tmpdir):
+    source = make_scratch_dir(str(tmpdir.join("scratch")), "hg38", "bowtie2_index", "default")
+    asset = os.path.join(source, "bowtie2_index", "default")
+    os.makedirs(os.path.join(asset, "sub"))
+    for i, rel in enumerate(["hg38.1.bt2", "hg38.2.bt2", os.path.join("sub", "notes.txt")]):
+        with open(os.path.join(asset, rel), "wb") as f:
+            f.write(os.urandom(1024 * (i + 1)))
+    os.symlink("hg38.1.bt2", os.path.join(asset, "hg38.bt2"))
+    return asset
+
+
+def test_publish_replaces_tag_keeping_build_logs(tmpdir):
+    source = _built_asset(tmpdir)
+    target = tmpdir.join("genomes", "hg38", "bowtie2_index", "default")
+    target.join("stale.bt2").write("stale", ensure=True)
+    target.join(BUILD_STATS_DIR, "build_log.md").write("log", ensure=True)
+    digest = publish_asset(source, str(target), threads=2)
+    assert sorted(os.listdir(str(target))) == sorted(os.listdir(source) + [BUILD_STATS_DIR])
+    assert target.join(BUILD_STATS_DIR, "build_log.md").read() == "log"
+    assert os.readlink(str(target.join("hg38.bt2"))) == "hg38.1.bt2"
+    for rel in ["hg38.1.bt2", os.path.join("sub", "notes.txt")]:
+        with open(os.path.join(source, rel), "rb") as f:
+            assert target.join(rel).read_binary() == f.read()
+    # the digest calculated during the copy is the one of the published directory
+    assert digest == dir_digest(str(target)) == dir_digest(source)
+    assert [e for e in os.listdir(str(target.dirpath())) if e != "default"] == []
+
+
+def test_publish_digest_algorithm(tmpdir):
+    source = _built_asset(tmpdir)
+    target = str(tmpdir.join("genomes", "hg38", "bowtie2_index", "default"))
+    assert publish_asset(source, target, algorithm="blake2b") == dir_digest(target, algorithm="blake2b")
@@ -0,0 +1,57 @@
+""" Tests of the genome configuration spool of concurrent builds """
+
+import yaml
+from refgenconf import RefGenConf
+
+from refgenie.spool import SpoolRecorder, spool_dir, write_record, pending_records, apply_records, merge_spool
+
+DIGEST = "a3c46f201a3ce7831d85cf4a125aa334"
+
+
+def _cfg(tmpdir):
+    cfg = {"config_version": 0.3, "genome_folder": str(tmpdir), "genome_servers": ["http://refgenomes.databio.org"],
+           "genomes": {"hg38": {"assets": {"fasta": {"default_tag": "default", "tags": {"default": {
+               "asset_path": "fasta", "asset_digest": DIGEST, "seek_keys": {"fasta": "hg38.fa"}}}}}}}}
+    path = str(tmpdir.join("genome_config.yaml"))
+    with open(path, "w") as f:
+        yaml.safe_dump(cfg, f)
+    return path
+
+
+def _record_build(rgc, asset):
+    """ Record the registration of an asset like a spooled build does """
+    r = SpoolRecorder(rgc)
+    r.update_assets("hg38", asset, data={"asset_description": asset})
+    r.update_tags("hg38", asset, "default", data={"asset_path": asset, "asset_digest": DIGEST})
+    r.update_seek_keys("hg38", asset, "default", keys={asset: "."})
+    r.set_default_pointer("hg38", asset, "default")
+    return r.calls
+
+
+def test_spool_merge(tmpdir):
+    gencfg = _cfg(tmpdir)
+    spool = spool_dir(gencfg)
+    for asset in ["bowtie2_index", "bwa_index"]:
+        write_record(spool, _record_build(RefGenConf(filepath=gencfg, writable=False), asset))
+    assert len(pending_records(spool)) == 2
+    # the genome configuration file is not changed until the records are merged
+    assert list(RefGenConf(filepath=gencfg, writable=False)["genomes"]["hg38"]["assets"].keys()) == ["fasta"]
+    pending = RefGenConf(filepath=gencfg, writable=False)
+    assert len(apply_records(pending, pending_records(spool))) == 2
+    assert pending["genomes"]["hg38"]["assets"]["bwa_index"]["default_tag"] == "default"
+    assert merge_spool(RefGenConf(filepath=gencfg, writable=False), spool) == 2
+    assert pending_records(spool) == []
+    assets = RefGenConf(filepath=gencfg, writable=False)["genomes"]["hg38"]["assets"]
+    assert sorted(assets.keys()) == ["bowtie2_index", "bwa_index", "fasta"]
+    assert assets["bwa_index"]["tags"]["default"]["asset_digest"] == DIGEST
+    assert merge_spool(RefGenConf(filepath=gencfg, writable=False), spool) == 0
+
+
+def test_unreadable_records_left_in_spool(tmpdir):
+    gencfg = _cfg(tmpdir)
+    spool = spool_dir(gencfg)
+    write_record(spool, [["remove", ["hg38"], {}]])
+    write_record(spool, _record_build(RefGenConf(filepath=gencfg, writable=False), "bwa_index"))
+    assert merge_spool(RefGenConf(filepath=gencfg, writable=False), spool) == 1
+    assert len(pending_records(spool)) == 1
+    assert "hg38" in RefGenConf(filepath=gencfg, writable=False)["genomes"]
@@ -2,7 +2,7 @@
 cp docs/usage.template usage.template
 #looper --help > USAGE.temp 2>&1
 
-for cmd in "--help" "init --help" "list --help" "listr --help" "pull --help" "build --help" "seek --help" "add --help" "remove --help" "getseq --help" "tag --help" "id --help" "subscribe --help" "unsubscribe --help"; do
+for cmd in "--help" "init --help" "list --help" "listr --help" "pull --help" "build --help" "seek --help" "add --help" "remove --help" "getseq --help" "tag --help" "id --help" "subscribe --help" "unsubscribe --help" "profile --help" "convert --help" "verify --help" "gc --help" "dedup --help" "merge --help" "chunk --help" "prefetch --help" "views --help"; do
 	echo $cmd
 	echo -e "## \`refgenie $cmd\`" > USAGE_header.temp
 	refgenie $cmd --help > USAGE.temp 2>&1